@@ -1,3 +1,4 @@
+import io
 import os
 import binascii
 
@@ -37,7 +38,117 @@ MORSE_DICT_REVERSE = {
 CAP_MARKER = '......' # Jika muncul ini, huruf berikutnya Kapital
 TERMINATOR = '__EOS__' # End of Stream Marker to stop garbage decoding
 
+# --- FORMAT V2 ---
+# v1 spends 2 bits per Morse symbol plus separators, adds a CAP_MARKER per
+# capital and drops anything outside MORSE_DICT. v2 encodes the UTF-8 bytes
+# of the message with a static canonical Huffman code (Morse-like: frequent
+# symbols get short codes) and frames it as:
+#   b"M2" | crc32(message) & 0xFFFF (2 bytes, big-endian) | code bits ... EOS | zero padding
+FORMAT_V1 = 1
+FORMAT_V2 = 2
+V2_MAGIC = b"M2"
+V2_HEADER_LEN = 4
+EOS_SYMBOL = 256
+
+def _v2_symbol_weights():
+    """
+    Static frequency model over byte values 0..255 plus EOS. It favours what
+    people actually hide: lowercase text, flags ({, }, _), digits, and
+    still gives every byte (so every UTF-8 sequence) a code.
+    """
+    english = 'etaoinshrdlcumwfgypbvkjxqz'
+    weights = [1] * 257
+    for b in range(32, 127):
+        weights[b] = 20
+    for rank, ch in enumerate(english):
+        weights[ord(ch)] = 1300 - rank * 45
+        weights[ord(ch.upper())] = 200 - rank * 6
+    for ch in '0123456789':
+        weights[ord(ch)] = 300
+    for ch, w in {' ': 1500, '_': 400, '{': 150, '}': 150, '.': 150, ',': 100, '-': 100, '!': 60, '?': 60}.items():
+        weights[ord(ch)] = w
+    for b in range(0x80, 0xC0):  # UTF-8 continuation bytes
+        weights[b] = 10
+    for b in range(0xC2, 0xF5):  # UTF-8 lead bytes
+        weights[b] = 5
+    weights[EOS_SYMBOL] = 60
+    return weights
+
+def _build_canonical_code(weights):
+    import heapq
+    # Huffman code lengths (ties broken by insertion order for determinism)
+    heap = [(w, i, [sym]) for i, (sym, w) in enumerate(enumerate(weights))]
+    heapq.heapify(heap)
+    lengths = [0] * len(weights)
+    counter = len(heap)
+    while len(heap) > 1:
+        w1, _, syms1 = heapq.heappop(heap)
+        w2, _, syms2 = heapq.heappop(heap)
+        for sym in syms1 + syms2:
+            lengths[sym] += 1
+        heapq.heappush(heap, (w1 + w2, counter, syms1 + syms2))
+        counter += 1
+
+    # Canonical codes: only the lengths define the table
+    codes = {}
+    code = 0
+    prev_len = 0
+    for sym in sorted(range(len(weights)), key=lambda s: (lengths[s], s)):
+        code <<= lengths[sym] - prev_len
+        codes[sym] = (code, lengths[sym])
+        prev_len = lengths[sym]
+        code += 1
+    return codes
+
+V2_CODES = _build_canonical_code(_v2_symbol_weights())
+V2_DECODE = {(length, code): sym for sym, (code, length) in V2_CODES.items()}
+
+def encode_payload_v2(message):
+    data = message.encode('utf-8')
+    acc = 0
+    nbits = 0
+    for sym in list(data) + [EOS_SYMBOL]:
+        code, length = V2_CODES[sym]
+        acc = (acc << length) | code
+        nbits += length
+    pad = (-nbits) % 8
+    acc <<= pad
+    body = acc.to_bytes((nbits + pad) // 8, 'big')
+    crc = (binascii.crc32(data) & 0xFFFF).to_bytes(2, 'big')
+    return bytearray(V2_MAGIC + crc + body)
+
+def decode_payload_v2(payload):
+    """
+    Decodes a v2 payload. Returns the message, or None if the data is not
+    a valid v2 payload (wrong keys or corruption).
+    """
+    if len(payload) < V2_HEADER_LEN or not payload.startswith(V2_MAGIC):
+        return None
+    expected_crc = int.from_bytes(payload[2:4], 'big')
+    out = bytearray()
+    code = 0
+    length = 0
+    for byte in payload[V2_HEADER_LEN:]:
+        for shift in range(7, -1, -1):
+            code = (code << 1) | ((byte >> shift) & 1)
+            length += 1
+            sym = V2_DECODE.get((length, code))
+            if sym is None:
+                continue
+            if sym == EOS_SYMBOL:
+                if binascii.crc32(out) & 0xFFFF != expected_crc:
+                    return None
+                try:
+                    return out.decode('utf-8')
+                except UnicodeDecodeError:
+                    return None
+            out.append(sym)
+            code = 0
+            length = 0
+    return None
+
 def generate_noise(length):
+    # One bulk RNG call for the whole tail
     return os.urandom(length)
 
 def text_to_custom_bytes_sensitive(text):
@@ -45,6 +156,10 @@ def text_to_custom_bytes_sensitive(text):
     morse_seq = []
     
     for char in text:
+        # Non-Morse letters (e.g. accented) are not representable in v1
+        if char.upper() not in MORSE_DICT:
+            continue
+
         # Cek apakah huruf kapital (A-Z)
         if char.isupper():
             # Tambahkan Marker Kapital dulu
@@ -105,7 +220,7 @@ def find_eoi(data):
 
     return eoi, offset_cleanup
 
-def custom_inject(original_data, message, start_offset, interval):
+def custom_inject(original_data, message, start_offset, interval, version=FORMAT_V2):
     # Detect File End to trim any existing junk/previous injection
     eoi, offset_cleanup = find_eoi(original_data)
     
@@ -117,24 +232,70 @@ def custom_inject(original_data, message, start_offset, interval):
     else:
         print("[!] Warning: Could not detect valid image end. Appending to EOF.")
 
-    # Generate Payload with Terminator
-    full_message = message + TERMINATOR
-    flag_bytes = text_to_custom_bytes_sensitive(full_message)
-    print(f"[*] Panjang Payload (inc. EOS): {len(flag_bytes)} bytes")
+    # Generate Payload
+    if version == FORMAT_V1:
+        # Legacy: 2-bit Morse symbols with Terminator
+        flag_bytes = text_to_custom_bytes_sensitive(message + TERMINATOR)
+    else:
+        flag_bytes = encode_payload_v2(message)
+    print(f"[*] Panjang Payload (v{version}): {len(flag_bytes)} bytes")
     
     # Proses Injeksi (Needle in Haystack)
-    injection_payload = bytearray()
-    
-    # Append noise and data
-    injection_payload.extend(generate_noise(start_offset))
-    
-    for b in flag_bytes:
-        injection_payload.append(b)
-        injection_payload.extend(generate_noise(interval))
-        
-    final_data = original_data + injection_payload
+    # Layout: noise(start_offset), then each payload byte followed by
+    # `interval` noise bytes. The whole output is one buffer: the tail is
+    # filled with a single bulk RNG call and the payload is dropped in with
+    # one strided slice assignment.
+    tail_len = tail_size(len(flag_bytes), start_offset, interval)
+    final_data = bytearray(len(original_data) + tail_len)
+    final_data[:len(original_data)] = original_data
+    final_data[len(original_data):] = generate_noise(tail_len)
+    payload_start = len(original_data) + start_offset
+    final_data[payload_start:payload_start + len(flag_bytes) * (interval + 1):interval + 1] = flag_bytes
     return final_data
 
+def check_keys(start_offset, interval):
+    """Both keys are non-negative counts (interval -1 would mean a step of 0)."""
+    if start_offset < 0 or interval < 0:
+        raise ValueError("Offset and interval must be 0 or more")
+
+def tail_size(payload_len, start_offset, interval):
+    """Bytes appended after the end of image for a payload of payload_len bytes."""
+    check_keys(start_offset, interval)
+    return start_offset + payload_len * (interval + 1)
+
+def plan_custom_inject(message, start_offset, interval, version=FORMAT_V2, cover_size=None, cover_samples=None):
+    """
+    Capacity/size planner: reports what custom_inject would produce for this
+    message and keys, without generating any noise. With cover_samples
+    (width * height * channels) it also reports pixel mode capacity.
+    """
+    check_keys(start_offset, interval)
+    if version == FORMAT_V1:
+        payload = text_to_custom_bytes_sensitive(message + TERMINATOR)
+        unsupported = sorted({c for c in message if c.upper() not in MORSE_DICT})
+    else:
+        payload = encode_payload_v2(message)
+        unsupported = []
+    tail = tail_size(len(payload), start_offset, interval)
+    plan = {
+        "version": version,
+        "message_chars": len(message),
+        "message_utf8_bytes": len(message.encode('utf-8')),
+        "payload_bytes": len(payload),
+        "tail_bytes": tail,
+        "unsupported_chars": unsupported,
+    }
+    if cover_size is not None:
+        plan["cover_bytes"] = cover_size
+        plan["output_bytes"] = cover_size + tail
+    if cover_samples is not None:
+        # Pixel mode always uses v2
+        capacity = pixel_capacity(cover_samples, start_offset, interval)
+        pixel_payload = len(payload) if version == FORMAT_V2 else len(encode_payload_v2(message))
+        plan["pixel_capacity_bytes"] = capacity
+        plan["pixel_fits"] = pixel_payload <= capacity
+    return plan
+
 def decode_binary_chunks(binary_str):
     res = ""
     # Baca per 2 bit: 00=., 01=-, 10=spasi
@@ -187,14 +348,15 @@ def solve_custom_steg(data, start_offset, interval):
     if len(hidden_data) < start_offset:
          return "Error: No hidden data found (file too small after EOI)."
 
-    # Ekstrak Byte (De-obfuscate)
-    payload_bytes = bytearray()
-    curr = start_offset
-    
-    # Safely extract
-    while curr < len(hidden_data):
-        payload_bytes.append(hidden_data[curr])
-        curr += (interval + 1)
+    # Ekstrak Byte (De-obfuscate): every (interval+1)-th byte from start_offset
+    payload_bytes = hidden_data[start_offset::interval + 1]
+
+    # v2 payloads carry a magic header and checksum
+    if payload_bytes.startswith(V2_MAGIC):
+        message = decode_payload_v2(payload_bytes)
+        if message is not None:
+            return message
+        return "Error: Could not recover message. Invalid Key (Offset/Interval) or corrupted data."
         
     # Bytes ke Binary String
     bin_str = ""
@@ -214,3 +376,153 @@ def solve_custom_steg(data, start_offset, interval):
     else:
         # Strict mode: If terminator not found, it means keys are likely wrong
         return "Error: Could not recover message. Invalid Key (Offset/Interval) or corrupted data."
+
+# --- BRUTE FORCE ---
+# Random keys from /steg/advanced/hide are drawn from these ranges
+RANDOM_OFFSET_RANGE = (500, 3000)
+RANDOM_INTERVAL_RANGE = (10, 100)
+# v1 has no header; candidates are decoded until the terminator or the
+# first impossible symbol, at most this many payload bytes
+BRUTEFORCE_V1_PROBE = 4096
+
+def _decode_v1_strict(hidden, offset, step, max_bytes=BRUTEFORCE_V1_PROBE):
+    """
+    v1 decoder for brute forcing: returns (message, payload bytes used) if
+    the stream from `offset` decodes cleanly up to TERMINATOR, else None. A real payload
+    never contains the "11" bit pair or an unknown Morse word, so noise
+    is usually rejected within the first byte or two.
+    """
+    text = []
+    word = ""
+    next_is_upper = False
+    for used, b in enumerate(hidden[offset:offset + max_bytes * step:step], 1):
+        for shift in (6, 4, 2, 0):
+            pair = (b >> shift) & 3
+            if pair == 0:
+                word += "."
+            elif pair == 1:
+                word += "-"
+            elif pair == 3:
+                return None
+            elif word:
+                if word == CAP_MARKER:
+                    next_is_upper = True
+                elif word in MORSE_DICT_REVERSE:
+                    char = MORSE_DICT_REVERSE[word]
+                    text.append(char.upper() if next_is_upper else char)
+                    next_is_upper = False
+                    if text[-1] == "_" and "".join(text[-len(TERMINATOR):]) == TERMINATOR:
+                        return "".join(text[:-len(TERMINATOR)]), used
+                else:
+                    return None
+                word = ""
+            if len(word) > len(CAP_MARKER):
+                return None
+    return None
+
+def bruteforce_custom_steg(data, offsets, intervals, include_v1=True):
+    """
+    Tries every (offset, interval) key on the tail of `data` and yields
+    (offset, interval, version, message) for each one that decodes.
+    v2 candidates are rejected on their 2-byte magic, v1 candidates on
+    their first invalid symbol, so the default key space (the ranges the
+    API draws random keys from) takes about a second.
+    """
+    eoi, offset_cleanup = find_eoi(data)
+    if eoi == -1:
+        return
+    hidden = data[eoi + offset_cleanup:]
+    n = len(hidden)
+    m0, m1 = V2_MAGIC[0], V2_MAGIC[1]
+    for interval in intervals:
+        step = interval + 1
+        v1_hits = []
+        for offset in offsets:
+            if offset >= n:
+                continue
+            if hidden[offset] == m0 and offset + step < n and hidden[offset + step] == m1:
+                message = decode_payload_v2(hidden[offset::step])
+                if message is not None:
+                    yield offset, interval, FORMAT_V2, message
+                    continue
+            if include_v1:
+                decoded = _decode_v1_strict(hidden, offset, step)
+                if not decoded or not decoded[0]:
+                    continue
+                # Starting a whole number of steps into a real payload often
+                # still decodes (its tail); skip keys inside an earlier hit
+                if any((offset - o) % step == 0 and offset < end for o, end in v1_hits):
+                    continue
+                v1_hits.append((offset, offset + decoded[1] * step))
+                yield offset, interval, FORMAT_V1, decoded[0]
+
+# --- PIXEL MODE ---
+# Same keyed scheme, but instead of trailing bytes the v2 payload bits go
+# into the least significant bits of the decoded pixel array: bit i lands
+# on flat sample start_offset + i * (interval + 1). Nothing is appended
+# after IEND, so overlay extractors and carvers find no tail. The output
+# is always a lossless PNG.
+
+PIXEL_MODES = ('RGB', 'RGBA', 'L')
+
+def _load_pixels(data):
+    # numpy/PIL only for pixel mode; the byte-domain paths don't need them
+    import numpy as np
+    from PIL import Image
+    img = Image.open(io.BytesIO(data))
+    if img.mode not in PIXEL_MODES:
+        # Palette/CMYK/etc: LSBs of indices are meaningless, work on RGB
+        img = img.convert('RGB')
+    return img, np.array(img)
+
+def pixel_capacity(num_samples, start_offset, interval):
+    """Number of payload bytes that fit in num_samples pixel samples."""
+    check_keys(start_offset, interval)
+    if num_samples <= start_offset:
+        return 0
+    bits = (num_samples - start_offset - 1) // (interval + 1) + 1
+    return bits // 8
+
+def pixel_inject(original_data, message, start_offset, interval):
+    """
+    Embeds message (format v2) into pixel LSBs at keyed strided positions.
+    Returns PNG bytes.
+    """
+    import numpy as np
+    from PIL import Image
+    img, arr = _load_pixels(original_data)
+    flat = arr.reshape(-1)
+
+    payload = encode_payload_v2(message)
+    capacity = pixel_capacity(flat.size, start_offset, interval)
+    if len(payload) > capacity:
+        raise ValueError(f"Message too large for this cover: needs {len(payload)} bytes, capacity is {capacity} bytes with these keys")
+
+    bits = np.unpackbits(np.frombuffer(bytes(payload), dtype=np.uint8))
+    step = interval + 1
+    # Strided view: no index array is materialized, even for 50MP covers
+    target = flat[start_offset:start_offset + bits.size * step:step]
+    target &= 0xFE
+    target |= bits
+    print(f"[*] Pixel mode: {len(payload)} bytes in {bits.size} LSBs of {flat.size} samples")
+
+    out = io.BytesIO()
+    save_kwargs = {'format': 'PNG'}
+    if 'icc_profile' in img.info:
+        save_kwargs['icc_profile'] = img.info['icc_profile']
+    Image.fromarray(arr, mode=img.mode).save(out, **save_kwargs)
+    return out.getvalue()
+
+def solve_pixel_steg(data, start_offset, interval):
+    import numpy as np
+    try:
+        img, arr = _load_pixels(data)
+    except Exception:
+        return "Error: Could not decode image pixels."
+    flat = arr.reshape(-1)
+    bits = flat[start_offset::interval + 1] & 1
+    payload = np.packbits(bits).tobytes()
+    message = decode_payload_v2(payload)
+    if message is None:
+        return "Error: Could not recover message. Invalid Key (Offset/Interval) or corrupted data."
+    return message
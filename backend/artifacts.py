@@ -0,0 +1,210 @@
+import io
+import os
+import json
+import time
+import shutil
+import zipfile
+
+# Artifact packaging
+# Analysis tasks no longer build zip files up front. Instead they register
+# "lazy archives" in a small manifest inside the result directory, and the
+# archive is streamed to the client only when somebody actually downloads it.
+
+MANIFEST_NAME = ".archives.json"
+STREAM_CHUNK_SIZE = 256 * 1024  # 256KB
+
+# Formats that are already compressed. Deflating them again only burns CPU.
+ALREADY_COMPRESSED_EXTS = {
+    '.png', '.jpg', '.jpeg', '.jpe', '.gif', '.webp', '.bmp',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst', '.lzma',
+    '.jar', '.apk', '.docx', '.xlsx', '.pptx', '.odt',
+    '.mp3', '.mp4', '.ogg', '.flac', '.webm', '.pdf',
+}
+
+def compress_type_for(filename):
+    """
+    Returns ZIP_STORED for already-compressed formats, ZIP_DEFLATED otherwise.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ALREADY_COMPRESSED_EXTS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def _load_manifest(result_dir):
+    manifest_path = os.path.join(result_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def register_archive(result_dir, archive_name, source_dir, prefix="", suffix=""):
+    """
+    Records that `archive_name` inside `result_dir` should be built from the
+    files under `source_dir` (relative to result_dir) on download.
+    Optional prefix/suffix restrict which filenames are included.
+    """
+    manifest = _load_manifest(result_dir)
+    manifest[archive_name] = {
+        "source": os.path.relpath(source_dir, result_dir),
+        "prefix": prefix,
+        "suffix": suffix,
+    }
+    with open(os.path.join(result_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f)
+
+def collect_entries(source_dir, prefix="", suffix=""):
+    """
+    Walks source_dir and returns a sorted list of (absolute_path, arcname).
+    """
+    entries = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file == MANIFEST_NAME:
+                continue
+            if not (file.startswith(prefix) and file.endswith(suffix)):
+                continue
+            full_path = os.path.join(root, file)
+            entries.append((full_path, os.path.relpath(full_path, source_dir)))
+    return entries
+
+def resolve_lazy_archive(upload_dir, rel_path):
+    """
+    Maps a download path like "results_x/foremost_out.zip" to the list of
+    entries it should contain. Returns None if the path is not a registered
+    lazy archive.
+    """
+    result_dir = os.path.join(upload_dir, os.path.dirname(rel_path))
+    spec = _load_manifest(result_dir).get(os.path.basename(rel_path))
+    if not spec:
+        return None
+
+    # Never follow a manifest outside of its own result directory
+    real_result_dir = os.path.realpath(result_dir)
+    source_dir = os.path.realpath(os.path.join(result_dir, spec["source"]))
+    if os.path.commonpath([real_result_dir, source_dir]) != real_result_dir:
+        return None
+    if not os.path.isdir(source_dir):
+        return None
+
+    return collect_entries(source_dir, spec.get("prefix", ""), spec.get("suffix", ""))
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink for ZipFile. zipfile falls back to data
+    descriptors when it cannot seek, so entries never need to be rewritten.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def iter_zip_stream(entries, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Generator yielding a zip archive of `entries` ((path, arcname) pairs)
+    piece by piece. Memory use is bounded by chunk_size, not archive size.
+    """
+    buf = _StreamBuffer()
+    with zipfile.ZipFile(buf, "w") as zipf:
+        for full_path, arcname in entries:
+            zinfo = zipfile.ZipInfo.from_file(full_path, arcname)
+            zinfo.compress_type = compress_type_for(arcname)
+            with open(full_path, "rb") as src, zipf.open(zinfo, "w") as dest:
+                while chunk := src.read(chunk_size):
+                    dest.write(chunk)
+                    data = buf.drain()
+                    if data:
+                        yield data
+            data = buf.drain()
+            if data:
+                yield data
+    # Central directory is written on close
+    data = buf.drain()
+    if data:
+        yield data
+
+# --- LIFECYCLE ---
+# Uploads, their results_* directories and generated outputs all live in
+# UPLOAD_DIR. They share one TTL with the Celery results that point at them
+# (celery_app sets result_expires to the same value).
+ARTIFACT_TTL = int(float(os.getenv("ARTIFACT_TTL_HOURS", "24")) * 3600)
+RESULT_DIR_PREFIX = "results_"
+
+def _remove(path):
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def cleanup_expired(upload_dir, ttl=ARTIFACT_TTL, now=None):
+    """
+    Removes upload_dir entries older than ttl seconds. An upload and its
+    results_<upload> directory expire together, based on the upload's age
+    (the analysis may still be writing into the directory after the upload
+    itself was saved). Returns {"removed": n, "bytes": freed}.
+    """
+    now = time.time() if now is None else now
+    cutoff = now - ttl
+    try:
+        names = set(os.listdir(upload_dir))
+    except FileNotFoundError:
+        return {"removed": 0, "bytes": 0}
+
+    removed = 0
+    freed = 0
+    for name in sorted(names):
+        path = os.path.join(upload_dir, name)
+        if name.startswith(RESULT_DIR_PREFIX) and name[len(RESULT_DIR_PREFIX):] in names:
+            continue  # handled with its upload
+        try:
+            if os.lstat(path).st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        group = [path]
+        result_dir = os.path.join(upload_dir, RESULT_DIR_PREFIX + name)
+        if RESULT_DIR_PREFIX + name in names:
+            group.append(result_dir)
+        for p in group:
+            size = _tree_size(p)
+            if _remove(p):
+                removed += 1
+                freed += size
+    return {"removed": removed, "bytes": freed}
+
+def _tree_size(path):
+    if not os.path.isdir(path) or os.path.islink(path):
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
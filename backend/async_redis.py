@@ -0,0 +1,28 @@
+import os
+import redis.asyncio as aioredis
+
+# One pooled asyncio Redis client per API process, shared by the rate
+# limiter, metrics flushing and any other cross-worker state.
+
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))
+
+_client = None
+
+def get_async_redis():
+    global _client
+    if _client is None:
+        redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+        pool = aioredis.ConnectionPool.from_url(
+            redis_url,
+            max_connections=REDIS_POOL_SIZE,
+            socket_timeout=1,
+            socket_connect_timeout=1,
+        )
+        _client = aioredis.Redis(connection_pool=pool)
+    return _client
+
+async def close_async_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
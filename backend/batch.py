@@ -0,0 +1,235 @@
+"""
+Batch RGB scrambling: encrypt or decrypt many images with one password.
+
+    python batch.py encrypt photos/ --out-dir scrambled/ --jobs 8
+    python batch.py decrypt 'scrambled/**/*.png' --out-dir restored/
+
+The key is derived once. Images are sorted by shape and handed out in
+contiguous chunks, so each pool process mostly sees one shape in a row
+and reuses its key stream. A manifest (JSON) lists every input and output
+with SHA-256 hashes. The password is read from --password,
+STEGSIK_PASSWORD or a prompt.
+"""
+import argparse
+import getpass
+import glob
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
+MANIFEST_NAME = "manifest.json"
+HASH_CHUNK = 1024 * 1024
+
+def expand_inputs(patterns, recursive=True, exts=IMAGE_EXTS):
+    """
+    Globs and directories -> sorted list of files (no duplicates).
+    Inside directories only files with `exts` are taken (None = all).
+    """
+    found = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isdir(path):
+                walker = os.walk(path) if recursive else [(path, [], os.listdir(path))]
+                for root, _, files in walker:
+                    for name in files:
+                        full = os.path.join(root, name)
+                        if (exts is None or os.path.splitext(name)[1].lower() in exts) and os.path.isfile(full):
+                            found.append(full)
+            elif os.path.isfile(path):
+                found.append(path)
+    return sorted(set(found))
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+def key_id(password):
+    """Identifies the key in the manifest without revealing the password."""
+    return hashlib.sha256(b"stegsik-key-id:" + password.encode()).hexdigest()[:16]
+
+def _shape_of(path):
+    try:
+        with Image.open(path) as img:
+            # Scrambling converts to RGB
+            return (img.height, img.width, 3)
+    except Exception:
+        return (0, 0, 0)
+
+def plan_jobs(paths, out_dir, base_dir=None):
+    """
+    Returns [(source, out_dir_for_file, shape)] sorted by shape, keeping the
+    input's directory layout under out_dir (None = next to each input).
+    Raises ValueError if two inputs would write the same output: outputs
+    are always <prefix>_<stem>.png, so a.png and a.jpg side by side clash.
+    """
+    base_dir = base_dir or (os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if paths else "")
+    jobs = []
+    outputs = {}
+    for path in paths:
+        target = None
+        if out_dir is not None:
+            rel = os.path.relpath(os.path.dirname(os.path.abspath(path)), base_dir)
+            target = os.path.normpath(os.path.join(out_dir, rel))
+        output = os.path.join(os.path.abspath(target or os.path.dirname(path)), os.path.splitext(os.path.basename(path))[0])
+        if output in outputs:
+            raise ValueError(f"{outputs[output]} and {path} would write the same output file; rename one of them")
+        outputs[output] = path
+        jobs.append((path, target, _shape_of(path)))
+    jobs.sort(key=lambda j: (j[2], j[0]))
+    return jobs
+
+def make_verifiers(password, mode, paths):
+    """
+    {salt hex: password check hex} for the files in `paths`, so Celery
+    workers can sign (encrypt, one salt) or check (decrypt, the salts found
+    in the inputs) without the password. The same values end up in the
+    outputs. Decrypting reads only the PNG chunk headers of each input.
+    """
+    from utils import scramble_salt, scramble_verifier
+    if mode == 'encrypt':
+        salts = [os.urandom(16)]
+    else:
+        salts = {salt for salt in map(scramble_salt, paths) if salt}
+    return {salt.hex(): scramble_verifier(password, salt).hex() for salt in salts}
+
+# Per-process state, set once by the pool initializer
+_state = {}
+
+def _init_worker(password, seed):
+    _state["password"] = password
+    _state["seed"] = seed
+    _state["cache"] = {}
+
+def scramble_one(source, target_dir, mode, seed=None, verifiers=None, cache=None):
+    """
+    Scrambles one file. Returns its manifest entry. Pool processes use the
+    password set by _init_worker; Celery chunks pass the seed and
+    make_verifiers() output instead (they never get the password).
+    """
+    from utils import process_image_encryption
+    password = None
+    if seed is None:
+        password, seed = _state["password"], _state["seed"]
+    cache = cache if cache is not None else _state.get("cache")
+    if target_dir is not None:
+        os.makedirs(target_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    entry = {"source": source, "source_sha256": file_sha256(source)}
+    success, out_name, out_path = process_image_encryption(
+        source, password, mode=mode, seed=seed, keystream_cache=cache, out_dir=target_dir,
+        verifiers=None if verifiers is None else {bytes.fromhex(k): bytes.fromhex(v) for k, v in verifiers.items()})
+    entry["seconds"] = round(time.perf_counter() - start, 4)
+    if success:
+        entry.update(status="ok", output=out_path, output_sha256=file_sha256(out_path))
+    else:
+        entry.update(status="error", error=out_name)
+    return entry
+
+def _scramble_job(job, mode):
+    source, target_dir, _ = job
+    return scramble_one(source, target_dir, mode)
+
+def write_manifest(path, mode, key, entries, started, jobs):
+    """`key` is the key_id() of the password."""
+    manifest = {
+        "mode": mode,
+        "key_id": key,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "jobs": jobs,
+        "seconds": round(time.time() - started, 3),
+        "total": len(entries),
+        "failed": sum(1 for e in entries if e["status"] != "ok"),
+        "files": entries,
+    }
+    manifest_dir = os.path.dirname(path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def run_batch(paths, password, mode='encrypt', out_dir=None, jobs=None, manifest_path=None, on_entry=None):
+    """
+    Scrambles `paths` with a process pool of `jobs` workers (default: all
+    cores) and writes the manifest. `on_entry` is called with each entry
+    as it finishes. Returns the manifest dict.
+    """
+    from utils import derive_scramble_seed
+    started = time.time()
+    jobs = jobs or os.cpu_count() or 1
+    seed = derive_scramble_seed(password)
+    planned = plan_jobs(paths, out_dir)
+
+    entries = []
+    if jobs == 1 or len(planned) <= 1:
+        _init_worker(password, seed)
+        results = (_scramble_job(job, mode) for job in planned)
+        for entry in results:
+            entries.append(entry)
+            if on_entry:
+                on_entry(entry)
+    else:
+        # Contiguous chunks of the shape-sorted list: same-shape runs stay in
+        # one process. 4 chunks per worker keeps the load balanced.
+        chunksize = max(1, math.ceil(len(planned) / (jobs * 4)))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(password, seed)) as pool:
+            for entry in pool.map(_scramble_job, planned, [mode] * len(planned), chunksize=chunksize):
+                entries.append(entry)
+                if on_entry:
+                    on_entry(entry)
+
+    if manifest_path is None:
+        manifest_path = os.path.join(out_dir or ".", MANIFEST_NAME)
+    manifest = write_manifest(manifest_path, mode, key_id(password), entries, started, jobs)
+    manifest["manifest_path"] = manifest_path
+    return manifest
+
+def read_password(args):
+    if args.password:
+        return args.password
+    if os.getenv("STEGSIK_PASSWORD"):
+        return os.environ["STEGSIK_PASSWORD"]
+    return getpass.getpass("Password: ")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch RGB scrambler")
+    parser.add_argument("mode", choices=["encrypt", "decrypt"])
+    parser.add_argument("inputs", nargs="+", help="Files, directories or glob patterns")
+    parser.add_argument("--out-dir", help="Output directory (default: next to each input)")
+    parser.add_argument("--password")
+    parser.add_argument("--jobs", type=int, default=0, help="Worker processes (default: all cores)")
+    parser.add_argument("--manifest", help=f"Manifest path (default: <out-dir>/{MANIFEST_NAME})")
+    parser.add_argument("--no-recursive", action="store_true")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs, recursive=not args.no_recursive)
+    if not paths:
+        sys.exit("[-] No input images found")
+    password = read_password(args)
+
+    def report(entry):
+        print(json.dumps(entry), flush=True)
+
+    try:
+        manifest = run_batch(paths, password, args.mode, args.out_dir, args.jobs or None, args.manifest, on_entry=report)
+    except ValueError as e:
+        sys.exit(f"[-] {e}")
+    print(f"[+] {manifest['total'] - manifest['failed']}/{manifest['total']} files in {manifest['seconds']}s"
+          f" ({manifest['jobs']} jobs). Manifest: {manifest['manifest_path']}", file=sys.stderr)
+    if manifest["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""
+Benchmark harness for the image processing hot paths.
+
+Generates a deterministic synthetic corpus (PNG/JPEG, 1MP..50MP, plain /
+with an appended overlay / with a Morse payload), times each engine
+function on it and writes JSON results that can be compared across commits.
+
+    python benchmark.py run --sizes 1,4,12 --out bench_results/HEAD.json
+    python benchmark.py compare bench_results/base.json bench_results/HEAD.json
+    python benchmark.py startup --server gunicorn --workers 4
+
+Every case runs in a fresh process so peak RSS belongs to that case alone.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_SIZES_MP = [1, 4, 12, 50]
+DEFAULT_REPEAT = 3
+CORPUS_SEED = 1337
+OVERLAY_SIZE = 1024 * 1024  # 1MB appended "zip"
+EMBED_PAYLOAD_SIZE = 4 * 1024 * 1024
+MORSE_MESSAGE = "CTF{synthetic_benchmark_payload_0123456789}"
+MORSE_OFFSET = 1024
+MORSE_INTERVAL = 50
+
+# --- CORPUS ---
+
+def _dimensions(megapixels):
+    # 4:3 aspect ratio, like most camera images
+    width = int(round((megapixels * 1_000_000 * 4 / 3) ** 0.5))
+    height = int(round(megapixels * 1_000_000 / width))
+    return width, height
+
+def _synthetic_pixels(width, height, seed):
+    """
+    Smooth gradients plus noise: compresses like a photo, not like a flat fill.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    arr = np.empty((height, width, 3), dtype=np.uint8)
+    arr[:, :, 0] = (x + y * 0.5) % 256
+    arr[:, :, 1] = (x * 0.5 + y) % 256
+    arr[:, :, 2] = (x * 0.25 + y * 0.75) % 256
+    arr ^= rng.integers(0, 16, size=arr.shape, dtype=np.uint8)
+    return arr
+
+def _overlay_bytes(seed):
+    rng = np.random.default_rng(seed)
+    # Looks like the start of a zip to carvers/binwalk
+    return b"PK\x03\x04" + rng.integers(0, 256, OVERLAY_SIZE - 4, dtype=np.uint8).tobytes()
+
+def build_corpus(corpus_dir, sizes_mp):
+    """
+    Creates (or reuses) the corpus and returns a list of entry dicts.
+    """
+    from advanced_steg import custom_inject
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    entries = []
+    for mp in sizes_mp:
+        width, height = _dimensions(mp)
+        arr = None
+        for fmt, ext in (("PNG", "png"), ("JPEG", "jpg")):
+            base_name = f"{ext}_{mp}mp"
+            plain_path = os.path.join(corpus_dir, f"{base_name}_plain.{ext}")
+            if not os.path.exists(plain_path):
+                if arr is None:
+                    arr = _synthetic_pixels(width, height, CORPUS_SEED + mp)
+                save_kwargs = {"quality": 90} if fmt == "JPEG" else {}
+                Image.fromarray(arr).save(plain_path, format=fmt, **save_kwargs)
+
+            overlay_path = os.path.join(corpus_dir, f"{base_name}_overlay.{ext}")
+            if not os.path.exists(overlay_path):
+                with open(plain_path, "rb") as src, open(overlay_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.write(_overlay_bytes(CORPUS_SEED + mp))
+
+            morse_path = os.path.join(corpus_dir, f"{base_name}_morse.{ext}")
+            if not os.path.exists(morse_path):
+                with open(plain_path, "rb") as f:
+                    data = f.read()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    data = custom_inject(data, MORSE_MESSAGE, MORSE_OFFSET, MORSE_INTERVAL)
+                with open(morse_path, "wb") as f:
+                    f.write(data)
+
+            for variant, path in (("plain", plain_path), ("overlay", overlay_path), ("morse", morse_path)):
+                entries.append({
+                    "name": f"{base_name}_{variant}",
+                    "path": os.path.abspath(path),
+                    "format": ext,
+                    "variant": variant,
+                    "megapixels": mp,
+                    "width": width,
+                    "height": height,
+                    "bytes": os.path.getsize(path),
+                })
+    return entries
+
+# --- CASES ---
+# Each case is (setup, run). setup(entry, workdir) is untimed and returns the
+# arguments for run(*args), which is what gets measured.
+
+def _copy_input(entry, workdir):
+    dst = os.path.join(workdir, os.path.basename(entry["path"]))
+    shutil.copyfile(entry["path"], dst)
+    return dst
+
+def _read_input(entry):
+    with open(entry["path"], "rb") as f:
+        return f.read()
+
+def _case_bit_planes():
+    from worker import generate_bit_planes
+    def setup(entry, workdir):
+        out_dir = os.path.join(workdir, "planes")
+        os.makedirs(out_dir, exist_ok=True)
+        return (entry["path"], out_dir)
+    return setup, generate_bit_planes
+
+def _case_encrypt():
+    from utils import process_image_encryption
+    def setup(entry, workdir):
+        return (_copy_input(entry, workdir), "benchmark-password", "encrypt")
+    return setup, process_image_encryption
+
+def _case_extract_overlay():
+    from utils import extract_overlay
+    return (lambda entry, workdir: (entry["path"],)), extract_overlay
+
+def _case_extract_strings():
+    from strings_scan import extract_file_strings
+    return (lambda entry, workdir: (entry["path"],)), extract_file_strings
+
+def _case_analyze_jpeg():
+    from jpeg_dct import analyze_file
+    return (lambda entry, workdir: (entry["path"],)), analyze_file
+
+def _case_embed():
+    from utils import embed_data
+    payload = bytes(EMBED_PAYLOAD_SIZE)
+    def setup(entry, workdir):
+        return (entry["path"], payload, os.path.join(workdir, "embedded.bin"))
+    return setup, embed_data
+
+def _case_custom_inject():
+    from advanced_steg import custom_inject
+    def setup(entry, workdir):
+        return (_read_input(entry), MORSE_MESSAGE, MORSE_OFFSET, MORSE_INTERVAL)
+    return setup, custom_inject
+
+def _case_solve_custom_steg():
+    from advanced_steg import solve_custom_steg
+    def setup(entry, workdir):
+        return (_read_input(entry), MORSE_OFFSET, MORSE_INTERVAL)
+    return setup, solve_custom_steg
+
+def _case_patch_height():
+    from utils import patch_png_height, patch_jpg_height
+    def setup(entry, workdir):
+        return (_copy_input(entry, workdir), entry["height"] + 64)
+    def run(path, new_height):
+        if path.endswith(".png"):
+            return patch_png_height(path, new_height)
+        return patch_jpg_height(path, new_height)
+    return setup, run
+
+# case name -> (factory, variants it applies to)
+CASES = {
+    "generate_bit_planes": (_case_bit_planes, {"plain"}),
+    "process_image_encryption": (_case_encrypt, {"plain", "overlay"}),
+    "extract_overlay": (_case_extract_overlay, {"overlay", "morse"}),
+    "extract_strings": (_case_extract_strings, {"plain", "overlay"}),
+    "analyze_jpeg": (_case_analyze_jpeg, {"plain"}),
+    "embed_data": (_case_embed, {"plain"}),
+    "custom_inject": (_case_custom_inject, {"plain"}),
+    "solve_custom_steg": (_case_solve_custom_steg, {"morse"}),
+    "patch_height": (_case_patch_height, {"plain"}),
+}
+# Cases that only apply to some corpus formats
+CASE_FORMATS = {
+    "analyze_jpeg": {"jpg"},
+}
+
+def _run_case(case_name, entry, repeat):
+    """
+    Runs one case on one corpus entry. Executed in a fresh worker process.
+    """
+    setup, fn = CASES[case_name][0]()
+    timings = []
+    with tempfile.TemporaryDirectory(prefix="stegsik_bench_") as workdir:
+        for _ in range(repeat):
+            args = setup(entry, workdir)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn(*args)
+            timings.append(time.perf_counter() - start)
+            del args
+
+        # One extra traced run for allocation peak; tracemalloc would skew timings
+        args = setup(entry, workdir)
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn(*args)
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del args
+
+    median = statistics.median(timings)
+    return {
+        "case": case_name,
+        "corpus": entry["name"],
+        "format": entry["format"],
+        "variant": entry["variant"],
+        "megapixels": entry["megapixels"],
+        "input_bytes": entry["bytes"],
+        "runs_s": timings,
+        "median_s": median,
+        "min_s": min(timings),
+        "mb_per_s": (entry["bytes"] / 1e6) / median if median else None,
+        "mp_per_s": entry["megapixels"] / median if median else None,
+        "peak_traced_bytes": traced_peak,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def run_benchmarks(args):
+    sizes = [int(s) for s in args.sizes.split(",")]
+    cases = args.cases.split(",") if args.cases else list(CASES)
+    for name in cases:
+        if name not in CASES:
+            sys.exit(f"Unknown case: {name}. Available: {', '.join(CASES)}")
+
+    print(f"[*] Building corpus in {args.corpus_dir} ({', '.join(map(str, sizes))} MP)...", file=sys.stderr)
+    corpus = build_corpus(args.corpus_dir, sizes)
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for case_name in cases:
+        applies_to = CASES[case_name][1]
+        for entry in corpus:
+            if entry["variant"] not in applies_to or entry["format"] not in CASE_FORMATS.get(case_name, {entry["format"]}):
+                continue
+            # Fresh process per case: no cache warmth or RSS high-water mark leaks between cases
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(_run_case, case_name, entry, args.repeat).result()
+            results.append(result)
+            print(f"    {case_name:<26} {entry['name']:<22} {result['median_s'] * 1000:9.1f} ms"
+                  f"  {result['peak_rss_bytes'] / 2**20:8.1f} MB RSS", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": Image.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "sizes_mp": sizes,
+        },
+        "results": results,
+    }
+    out_dir = os.path.dirname(args.out)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[+] Results written to {args.out}", file=sys.stderr)
+
+def compare_results(args):
+    """
+    Compares median times (and peak RSS) of two result files. Exits with
+    status 1 if any case regressed by more than the threshold.
+    """
+    with open(args.baseline) as f:
+        base = {(r["case"], r["corpus"]): r for r in json.load(f)["results"]}
+    with open(args.current) as f:
+        current = {(r["case"], r["corpus"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'case':<26} {'corpus':<22} {'base ms':>10} {'new ms':>10} {'time':>8} {'rss':>8}")
+    for key in sorted(base.keys() & current.keys()):
+        old, new = base[key], current[key]
+        time_ratio = new["median_s"] / old["median_s"] if old["median_s"] else 1.0
+        rss_ratio = new["peak_rss_bytes"] / old["peak_rss_bytes"] if old["peak_rss_bytes"] else 1.0
+        flag = ""
+        if time_ratio > 1 + args.threshold or rss_ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{key[0]:<26} {key[1]:<22} {old['median_s'] * 1000:10.1f} {new['median_s'] * 1000:10.1f}"
+              f" {time_ratio - 1:+8.1%} {rss_ratio - 1:+8.1%}{flag}")
+
+    for key in sorted(base.keys() - current.keys()):
+        print(f"[!] Missing in current run: {key[0]} / {key[1]}")
+
+    if regressions:
+        print(f"[-] {regressions} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+    print("[+] No regressions")
+
+# Run in a fresh interpreter: import cost and RSS of the API app alone
+_IMPORT_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({
+    "import_s": time.perf_counter() - start,
+    "rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "heavy_loaded": [m for m in ("numpy", "PIL", "worker", "utils") if m in sys.modules],
+}))
+"""
+
+def _server_env():
+    env = dict(os.environ)
+    env.setdefault("RATE_LIMIT_ENABLED", "0")
+    env.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")  # Redis calls fail fast
+    env.setdefault("ACCESS_LOG", "/dev/null")
+    return env
+
+def _proc_memory(pid):
+    """RSS and PSS in bytes from smaps_rollup. PSS splits shared (preloaded) pages between processes."""
+    mem = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    mem[key.lower() + "_bytes"] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return mem
+
+def _child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # ppid is the 2nd field after the ")" that closes the command name
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def _measure_server(kind, workers, port, ready_timeout=60):
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app",
+                   "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(workers), "--no-access-log"]
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, env=_server_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ready_s = None
+    try:
+        deadline = start + ready_timeout
+        while time.perf_counter() < deadline and proc.poll() is None:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).read()
+                ready_s = time.perf_counter() - start
+                break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.05)
+        if ready_s is None:
+            return {"server": kind, "error": f"not ready after {ready_timeout}s (exit code {proc.poll()})"}
+        # Give the remaining workers time to boot before sampling memory
+        time.sleep(2)
+        # uvicorn --workers spawns through multiprocessing; skip its resource tracker
+        worker_pids = [p for p in _child_pids(proc.pid) if _proc_memory(p).get("rss_bytes", 0) > 20 * 2**20]
+        return {
+            "server": kind,
+            "workers": workers,
+            "ready_s": ready_s,
+            "master": _proc_memory(proc.pid),
+            "worker_memory": [_proc_memory(p) for p in worker_pids],
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def measure_startup(args):
+    """
+    Measures API cold start: import time and RSS of main.py in a fresh
+    interpreter, and optionally time-to-ready and per-worker memory of a
+    real multi-worker server.
+    """
+    probes = []
+    for _ in range(args.repeat):
+        out = subprocess.check_output([sys.executable, "-c", _IMPORT_PROBE], env=_server_env(),
+                                      stderr=subprocess.DEVNULL)
+        probes.append(json.loads(out.decode().strip().splitlines()[-1]))
+    import_s = statistics.median(p["import_s"] for p in probes)
+    rss = statistics.median(p["rss_bytes"] for p in probes)
+    print(f"    import main                {import_s * 1000:9.1f} ms  {rss / 2**20:8.1f} MB RSS"
+          f"  heavy modules: {', '.join(probes[-1]['heavy_loaded']) or 'none'}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "import": {"median_s": import_s, "rss_bytes": rss, "runs": probes},
+    }
+
+    if args.server:
+        server = _measure_server(args.server, args.workers, args.port)
+        report["server"] = server
+        if "error" in server:
+            print(f"[-] {args.server}: {server['error']}", file=sys.stderr)
+        else:
+            print(f"    {args.server} ready ({args.workers} workers) {server['ready_s'] * 1000:9.1f} ms", file=sys.stderr)
+            for name, mem in [("master", server["master"])] + [(f"worker {i}", m) for i, m in enumerate(server["worker_memory"])]:
+                print(f"      {name:<10} {mem.get('rss_bytes', 0) / 2**20:8.1f} MB RSS"
+                      f"  {mem.get('pss_bytes', 0) / 2**20:8.1f} MB PSS", file=sys.stderr)
+
+    if args.out:
+        out_dir = os.path.dirname(args.out)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[+] Results written to {args.out}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stegsik hot path benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Generate the corpus and run benchmarks")
+    run_p.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES_MP)),
+                       help="Comma separated image sizes in megapixels")
+    run_p.add_argument("--cases", default="", help=f"Comma separated subset of: {', '.join(CASES)}")
+    run_p.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_p.add_argument("--corpus-dir", default="bench_corpus")
+    run_p.add_argument("--out", default="bench_results/latest.json")
+    run_p.set_defaults(func=run_benchmarks)
+
+    cmp_p = sub.add_parser("compare", help="Compare two result files")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.10,
+                       help="Relative slowdown that counts as a regression (default 0.10)")
+    cmp_p.set_defaults(func=compare_results)
+
+    start_p = sub.add_parser("startup", help="Measure API cold start and per-worker memory")
+    start_p.add_argument("--repeat", type=int, default=5)
+    start_p.add_argument("--server", choices=["gunicorn", "uvicorn"],
+                         help="Also boot a multi-worker server and measure time-to-ready and RSS/PSS")
+    start_p.add_argument("--workers", type=int, default=4)
+    start_p.add_argument("--port", type=int, default=8765)
+    start_p.add_argument("--out", default="")
+    start_p.set_defaults(func=measure_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
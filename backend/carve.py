@@ -0,0 +1,328 @@
+import mmap
+import os
+import re
+import struct
+from collections import deque
+
+# In-process carving of the data appended after an image.
+# One Aho-Corasick automaton holds every magic number, so the overlay is
+# read once, front to back, straight from a memory map (no copy, no
+# binwalk subprocess). Each hit is checked/sized by its format and the tail
+# is split into typed segments: formats that record their own length (PNG
+# chunks, JPEG markers, ZIP EOCD, RIFF, 7z, SQLite...) end exactly there,
+# the others run up to the next signature. Bytes no signature claims
+# (text, Morse tails, noise) come out as "data" segments.
+
+COPY_CHUNK = 1024 * 1024
+
+# --- AHO-CORASICK ---
+
+class Automaton:
+    """
+    Aho-Corasick automaton over byte patterns, flattened to a full DFA
+    (one 256-entry row per state) so scanning is one lookup per byte.
+    """
+    def __init__(self, patterns):
+        self.patterns = [bytes(p) for p in patterns]
+        goto, fail, out = [{}], [0], [[]]
+        for idx, pattern in enumerate(self.patterns):
+            state = 0
+            for b in pattern:
+                if b not in goto[state]:
+                    goto.append({})
+                    fail.append(0)
+                    out.append([])
+                    goto[state][b] = len(goto) - 1
+                state = goto[state][b]
+            out[state].append(idx)
+
+        # Failure links (BFS), then fill in every transition
+        order = []
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for b, nxt in goto[state].items():
+                f = fail[state]
+                while f and b not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f][b] if state and b in goto[f] else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+                queue.append(nxt)
+
+        delta = [None] * len(goto)
+        delta[0] = [goto[0].get(b, 0) for b in range(256)]
+        for state in order:
+            row = list(delta[fail[state]])
+            for b, nxt in goto[state].items():
+                row[b] = nxt
+            delta[state] = row
+        self.delta = delta
+        self.out = [tuple(o) for o in out]
+
+        # In the root state no match is in progress, so we can jump (in C,
+        # via re) to the next place where some pattern's first two bytes
+        # appear. On compressed/random data that skips almost every byte.
+        prefixes = sorted({p[:2] for p in self.patterns})
+        if any(len(p) < 2 for p in prefixes):
+            raise ValueError("Patterns must be at least 2 bytes long")
+        self._skip = re.compile(b"|".join(re.escape(p) for p in prefixes))
+
+    def iter_matches(self, buf, start=0, end=None):
+        """Yields (match_start, pattern_index) in order of match end."""
+        end = len(buf) if end is None else end
+        delta, out, lengths = self.delta, self.out, [len(p) for p in self.patterns]
+        state, i = 0, start
+        while i < end:
+            if state == 0:
+                m = self._skip.search(buf, i, end)
+                if m is None:
+                    return
+                i = m.start()
+            state = delta[state][buf[i]]
+            i += 1
+            for idx in out[state]:
+                yield i - lengths[idx], idx
+
+# --- FORMAT SIZERS ---
+# size(buf, start, end) -> length in bytes, None (valid, length unknown)
+# or False (not really this format).
+
+def _u16be(buf, pos): return struct.unpack(">H", buf[pos:pos + 2])[0]
+def _u32be(buf, pos): return struct.unpack(">I", buf[pos:pos + 4])[0]
+def _u32le(buf, pos): return struct.unpack("<I", buf[pos:pos + 4])[0]
+
+def _size_png(buf, start, end):
+    pos = start + 8
+    while pos + 12 <= end:
+        length = _u32be(buf, pos)
+        chunk_type = buf[pos + 4:pos + 8]
+        if not chunk_type.isalpha():
+            return False
+        pos += length + 12
+        if chunk_type == b"IEND":
+            return pos - start if pos <= end else None
+    return None
+
+def _size_jpeg(buf, start, end):
+    pos = start + 2
+    while pos + 4 <= end:
+        # Anything but a marker before the scan data: not a JPEG
+        if buf[pos] != 0xFF:
+            return False
+        marker = buf[pos + 1]
+        if pos == start + 2 and marker < 0xC0:
+            return False
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0xD9:
+            return pos + 2 - start
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = _u16be(buf, pos + 2)
+        if marker == 0xDA:
+            # Entropy-coded data: 0xFF is always stuffed (FF 00) or a RST
+            # marker there, so the first FF D9 is the real end of image
+            eoi = buf.find(b"\xff\xd9", pos + 2 + length, end)
+            return eoi + 2 - start if eoi != -1 else None
+        pos += 2 + length
+    return None
+
+def _size_zip(buf, start, end):
+    # End of central directory: signature, 16 bytes of fields, comment length
+    eocd = buf.find(b"PK\x05\x06", start, end)
+    if eocd == -1 or eocd + 22 > end:
+        return None
+    return min(eocd + 22 + struct.unpack("<H", buf[eocd + 20:eocd + 22])[0], end) - start
+
+def _size_7z(buf, start, end):
+    if start + 32 > end:
+        return None
+    next_offset, next_size = struct.unpack("<QQ", buf[start + 12:start + 28])
+    return 32 + next_offset + next_size
+
+def _size_riff(buf, start, end):
+    if start + 12 > end or buf[start + 8:start + 12] not in RIFF_FORMS:
+        return False
+    return _u32le(buf, start + 4) + 8
+
+def _size_bmp(buf, start, end):
+    # "BM" alone matches everywhere: require a sane header
+    if start + 18 > end:
+        return False
+    size = _u32le(buf, start + 2)
+    data_offset = _u32le(buf, start + 10)
+    if buf[start + 6:start + 10] != b"\x00\x00\x00\x00" or _u32le(buf, start + 14) not in (12, 40, 52, 56, 108, 124):
+        return False
+    if not 26 <= data_offset < size:
+        return False
+    return size
+
+def _size_sqlite(buf, start, end):
+    if start + 32 > end:
+        return None
+    page_size = _u16be(buf, start + 16)
+    page_size = 65536 if page_size == 1 else page_size
+    return page_size * _u32be(buf, start + 28) or None
+
+def _check_bzip2(buf, start, end):
+    if buf[start + 3:start + 4] not in (b"1", b"2", b"3", b"4", b"5", b"6", b"7", b"8", b"9"):
+        return False
+    return None if buf[start + 4:start + 10] == b"1AY&SY" else False
+
+def _check_gzip(buf, start, end):
+    # Reserved flag bits clear, known extra flags
+    if start + 10 > end or buf[start + 3] & 0xE0 or buf[start + 8] not in (0, 2, 4):
+        return False
+    return None
+
+def _check_id3(buf, start, end):
+    # Version 2.2-2.4, then a "syncsafe" size (high bit of each byte clear)
+    if start + 10 > end or buf[start + 3] not in (2, 3, 4) or any(b & 0x80 for b in buf[start + 6:start + 10]):
+        return False
+    return None
+
+def _check_mp4(buf, start, end):
+    return None if 8 <= _u32be(buf, start) <= 4096 else False
+
+RIFF_FORMS = {b"WAVE": ".wav", b"AVI ": ".avi", b"WEBP": ".webp"}
+
+# Stegsik's own scrambler appends RGB_SIG + salt(16) + hash(32), see utils
+RGB_SIG_LEN = 55
+
+# (type, magic, offset of the magic inside the file, extension, sizer)
+SIGNATURES = [
+    ("png", b"\x89PNG\r\n\x1a\n", 0, ".png", _size_png),
+    ("jpeg", b"\xff\xd8\xff", 0, ".jpg", _size_jpeg),
+    ("gif", b"GIF87a", 0, ".gif", None),
+    ("gif", b"GIF89a", 0, ".gif", None),
+    ("bmp", b"BM", 0, ".bmp", _size_bmp),
+    ("riff", b"RIFF", 0, ".riff", _size_riff),
+    ("zip", b"PK\x03\x04", 0, ".zip", _size_zip),
+    ("rar", b"Rar!\x1a\x07", 0, ".rar", None),
+    ("7z", b"7z\xbc\xaf\x27\x1c", 0, ".7z", _size_7z),
+    ("gzip", b"\x1f\x8b\x08", 0, ".gz", _check_gzip),
+    ("bzip2", b"BZh", 0, ".bz2", _check_bzip2),
+    ("xz", b"\xfd7zXZ\x00", 0, ".xz", None),
+    ("tar", b"ustar", 257, ".tar", None),
+    ("pdf", b"%PDF-", 0, ".pdf", None),
+    ("elf", b"\x7fELF", 0, ".elf", None),
+    ("sqlite", b"SQLite format 3\x00", 0, ".sqlite", _size_sqlite),
+    ("mp4", b"ftyp", 4, ".mp4", _check_mp4),
+    ("ogg", b"OggS", 0, ".ogg", None),
+    ("flac", b"fLaC", 0, ".flac", None),
+    ("mp3", b"ID3", 0, ".mp3", _check_id3),
+    ("rgb_signature", b"RGB_SIG", 0, ".sig", lambda buf, start, end: RGB_SIG_LEN),
+]
+
+_automaton = None
+
+def get_automaton():
+    global _automaton
+    if _automaton is None:
+        _automaton = Automaton([sig[1] for sig in SIGNATURES])
+    return _automaton
+
+# --- SPLITTING ---
+
+def _segment(kind, ext, offset, length, complete):
+    return {"type": kind, "ext": ext, "offset": offset, "length": length, "complete": complete}
+
+def image_end(buf):
+    """
+    End offset of the image at the start of `buf` (its own structure, not
+    the last IEND/EOI in the file). None if it can't be determined.
+    """
+    end = len(buf)
+    for kind, magic, at, _, size in SIGNATURES:
+        if at == 0 and size and buf[:len(magic)] == magic:
+            length = size(buf, 0, end)
+            if length:
+                return min(length, end)
+    # Unknown or broken structure: same heuristic as utils.extract_overlay
+    if buf[:4] == b"\x89PNG":
+        iend = buf.rfind(b"\x00\x00\x00\x00IEND\xae\x42\x60\x82")
+        return iend + 12 if iend != -1 else None
+    if buf[:2] == b"\xff\xd8":
+        eoi = buf.rfind(b"\xff\xd9")
+        return eoi + 2 if eoi != -1 else None
+    return None
+
+def split_segments(buf, start, end=None):
+    """
+    Splits buf[start:end] into typed segments (offsets are into buf).
+    """
+    end = len(buf) if end is None else end
+    segments = []
+    pos = start      # everything before pos is accounted for
+    open_seg = None  # last segment of unknown length, closed by the next one
+
+    for match_start, idx in get_automaton().iter_matches(buf, start, end):
+        kind, magic, at, ext, size = SIGNATURES[idx]
+        seg_start = match_start - at
+        if seg_start < pos:
+            continue  # inside something already claimed
+        length = size(buf, seg_start, end) if size else None
+        if length is False:
+            continue
+        if kind == "riff":
+            ext = RIFF_FORMS[buf[seg_start + 8:seg_start + 12]]
+
+        if open_seg is not None:
+            open_seg["length"] = seg_start - open_seg["offset"]
+            open_seg = None
+        elif seg_start > pos:
+            segments.append(_segment("data", ".bin", pos, seg_start - pos, False))
+
+        if length:
+            length = min(length, end - seg_start)
+            segments.append(_segment(kind, ext, seg_start, length, True))
+            pos = seg_start + length
+        else:
+            open_seg = _segment(kind, ext, seg_start, None, False)
+            segments.append(open_seg)
+            pos = match_start + len(magic)
+
+    if open_seg is not None:
+        open_seg["length"] = end - open_seg["offset"]
+    elif pos < end:
+        segments.append(_segment("data", ".bin", pos, end - pos, False))
+    for i, seg in enumerate(segments):
+        seg["index"] = i
+    return segments
+
+def scan_file(path):
+    """
+    Returns (overlay_offset, segments) for an image file. overlay_offset is
+    None (and segments empty) if nothing follows the image.
+    """
+    if os.path.getsize(path) == 0:
+        return None, []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        start = image_end(buf)
+        if start is None or start >= len(buf):
+            return None, []
+        return start, split_segments(buf, start)
+
+def copy_range(path, offset, length, out_path):
+    with open(path, "rb") as src, open(out_path, "wb") as dst:
+        src.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = src.read(min(COPY_CHUNK, remaining))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+
+def write_segments(path, segments, out_dir, prefix):
+    """
+    Writes each segment to out_dir/<prefix>_<index>_<type><ext> and adds
+    its "filename" to the segment dict.
+    """
+    for seg in segments:
+        seg["filename"] = f"{prefix}_{seg['index']}_{seg['type']}{seg['ext']}"
+        copy_range(path, seg["offset"], seg["length"], os.path.join(out_dir, seg["filename"]))
+    return segments
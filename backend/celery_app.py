@@ -0,0 +1,70 @@
+import os
+from celery import Celery
+from artifacts import ARTIFACT_TTL
+from search_index import INDEX_FLUSH_INTERVAL
+
+# Celery app shared by the worker (which registers the tasks) and the API
+# (which only enqueues them and reads results). Kept separate from worker.py
+# so the API does not import numpy/PIL and the whole analysis pipeline.
+
+redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+TASK_SOFT_TIME_LIMIT = int(os.getenv("TASK_SOFT_TIME_LIMIT", "900"))
+VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", "7200"))
+CLEANUP_INTERVAL = int(os.getenv("CLEANUP_INTERVAL", "3600"))
+celery_app = Celery(
+    "worker",
+    broker=os.getenv("CELERY_BROKER_URL", redis_url),
+    backend=os.getenv("CELERY_RESULT_BACKEND", redis_url),
+)
+
+# Result lifecycle: results expire together with the files on disk they
+# point at (see artifacts.cleanup_expired, run hourly by beat)
+celery_app.conf.update(
+    result_serializer="json",
+    # Results carry full tool output (strings, zsteg); text compresses ~5-10x
+    result_compression="zlib",
+    result_expires=ARTIFACT_TTL,
+    # A worker that dies mid-analysis hands the task back instead of losing it
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Long tasks must not sit prefetched behind another one while the
+    # visibility timeout runs
+    worker_prefetch_multiplier=1,
+    # Hard cap per analysis (deep: stegseek 120s + carving + the rest)
+    task_soft_time_limit=TASK_SOFT_TIME_LIMIT,
+    task_time_limit=TASK_SOFT_TIME_LIMIT + 60,
+    # Redis redelivers unacked tasks after the visibility timeout, so it must
+    # be well above the longest possible run or a slow stegseek task would
+    # be started a second time on another worker
+    broker_transport_options={"visibility_timeout": VISIBILITY_TIMEOUT},
+    beat_schedule={
+        "cleanup-expired-artifacts": {
+            "task": "worker.cleanup_expired_artifacts",
+            "schedule": CLEANUP_INTERVAL,
+        },
+        # Index entries queued by finished analyses (partial batches)
+        "flush-search-index": {
+            "task": "worker.flush_search_index",
+            "schedule": INDEX_FLUSH_INTERVAL,
+        },
+    },
+)
+
+# Local/test stand-in: run tasks inline in the API process (no Redis, no worker).
+# Pair with CELERY_BROKER_URL=memory:// and CELERY_RESULT_BACKEND=cache+memory://
+if os.getenv("CELERY_TASK_ALWAYS_EAGER") == "1":
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_store_eager_result = True
+
+ANALYZE_TASK = "worker.analyze_image_task"
+
+def enqueue_analysis(file_path, enqueued_at=None, profile="auto"):
+    """
+    Queues analyze_image_task by name. In eager mode the task has to run
+    in this process, so only then is the worker module imported.
+    """
+    kwargs = {"enqueued_at": enqueued_at, "profile": profile}
+    if celery_app.conf.task_always_eager:
+        from worker import analyze_image_task
+        return analyze_image_task.apply_async((file_path,), kwargs)
+    return celery_app.send_task(ANALYZE_TASK, args=(file_path,), kwargs=kwargs)
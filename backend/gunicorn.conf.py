@@ -0,0 +1,43 @@
+# Production server profile: gunicorn managing uvicorn workers.
+#   gunicorn -c gunicorn.conf.py main:app
+# Every setting can be overridden from the environment.
+import os
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# The API mostly waits on uploads, Redis and the disk; CPU heavy work runs
+# in Celery. 2 x cores + 1 is the usual starting point, capped so a big
+# host doesn't spawn dozens of ~60MB processes.
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 12)))
+# UvicornWorker uses uvloop and httptools when installed (uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master, workers fork from it and share its pages
+preload_app = os.getenv("PRELOAD_APP", "1") != "0"
+
+# Graceful restarts: recycle workers now and then (guards against slow leaks
+# in image libraries), with jitter so they don't all restart at once.
+# SIGHUP reloads config and replaces workers without dropping connections.
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "200"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Uploads up to 1GB can take a while on slow links
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+
+# Modules the API imports lazily (numpy/PIL through utils/advanced_steg).
+# With preload they are loaded once in the master instead of in every
+# worker on its first heavy request.
+WARM_IMPORTS = ["utils", "advanced_steg"]
+
+def when_ready(server):
+    if not preload_app or os.getenv("WARM_IMPORTS", "1") == "0":
+        return
+    import importlib
+    for name in WARM_IMPORTS:
+        importlib.import_module(name)
+    server.log.info("Warmed imports: %s", ", ".join(WARM_IMPORTS))
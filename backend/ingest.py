@@ -0,0 +1,242 @@
+import os
+import shutil
+import asyncio
+import hashlib
+from urllib.parse import parse_qsl
+import magic  # python-magic-bin
+from fastapi import HTTPException, Request
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+# Streaming multipart ingestion.
+# Starlette's UploadFile spools every part to a temp file first, and the
+# endpoints then copied it again into UPLOAD_DIR. Here the request body is
+# parsed as it arrives and each file part is written straight to its final
+# path, hashed and MIME-sniffed on the way, and cut off as soon as it grows
+# past its limit.
+
+SNIFF_BYTES = 2048
+MAX_FIELD_SIZE = 1024 * 1024  # plain (non-file) form fields
+# Multipart headers and boundaries on top of the declared limits
+ENVELOPE_SLACK = 64 * 1024
+
+class FileField:
+    """
+    Declares an expected file part.
+    dest(filename, parts) returns the path to write to; `parts` holds the
+    FileParts already received. If prefix_from names an earlier file part,
+    its content is copied to the start of dest before this part is written
+    (used by /embed to write the payload straight after the cover).
+    """
+    def __init__(self, max_size, allowed_mimes=None, dest=None, required=True, prefix_from=None):
+        self.max_size = max_size
+        self.allowed_mimes = allowed_mimes
+        self.dest = dest
+        self.required = required
+        self.prefix_from = prefix_from
+
+class FilePart:
+    def __init__(self, name, filename, path):
+        self.name = name
+        self.filename = filename
+        self.path = path
+        self.size = 0
+        self.mime = None
+        self.prefixed = False
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+class _Writer:
+    def __init__(self, part, spec):
+        self.part = part
+        self.spec = spec
+        self.head = bytearray()
+        self.f = open(part.path, "wb")
+
+    def copy_prefix(self, prefix_path):
+        # Blocking (the whole cover, up to 50MB): run it in a thread
+        with open(prefix_path, "rb") as src:
+            shutil.copyfileobj(src, self.f, 1024 * 1024)
+        self.part.prefixed = True
+
+    def _sniff(self):
+        part, spec = self.part, self.spec
+        part.mime = magic.from_buffer(bytes(self.head), mime=True)
+        if spec.allowed_mimes and part.mime not in spec.allowed_mimes:
+            raise HTTPException(status_code=400, detail=f"Invalid file type: {part.mime}. Allowed: {spec.allowed_mimes}")
+
+    def write(self, data):
+        part = self.part
+        part.size += len(data)
+        if part.size > self.spec.max_size:
+            raise HTTPException(status_code=413, detail=f"File too large. Max allowed: {self.spec.max_size/1024/1024} MB")
+        if part.mime is None:
+            self.head.extend(data[:SNIFF_BYTES - len(self.head)])
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+        part._hash.update(data)
+        # Plain blocking write: chunks are small and land in the page cache;
+        # a threadpool hop per chunk costs more than the write itself.
+        self.f.write(data)
+
+    def finish(self):
+        if self.part.mime is None:
+            self._sniff()
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+
+class UploadForm:
+    def __init__(self):
+        self.fields = {}
+        self.files = {}
+
+    def cleanup(self):
+        """Deletes everything written so far (used on errors)."""
+        for part in self.files.values():
+            if os.path.exists(part.path):
+                os.remove(part.path)
+
+def _safe_filename(filename):
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    return name or "upload"
+
+async def _urlencoded_form(request, file_fields, text_fields):
+    limit = MAX_FIELD_SIZE * max(len(text_fields), 1)
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail="Form too large")
+    form = UploadForm()
+    for name, value in parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True):
+        if name in text_fields:
+            form.fields[name] = value
+    for name, spec in file_fields.items():
+        if spec.required:
+            raise HTTPException(status_code=400, detail=f"Missing file field: {name}")
+    return form
+
+async def stream_upload(request: Request, file_fields, text_fields=()):
+    """
+    Parses a multipart/form-data request body. `file_fields` maps field
+    names to FileField specs, `text_fields` lists accepted plain fields.
+    Unknown parts are discarded. Returns an UploadForm; on any error the
+    files written so far are removed and an HTTPException is raised.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type == b"application/x-www-form-urlencoded":
+        # No file parts (e.g. only a resumable upload_id): fields only
+        return await _urlencoded_form(request, file_fields, text_fields)
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    # Reject obviously oversized bodies before reading a byte
+    limit = sum(spec.max_size for spec in file_fields.values()) + MAX_FIELD_SIZE * len(text_fields) + ENVELOPE_SLACK
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        declared = 0
+    if declared > limit:
+        raise HTTPException(status_code=413, detail=f"Request too large. Max allowed: {limit/1024/1024:.0f} MB")
+
+    form = UploadForm()
+    state = {"headers": {}, "header_field": b"", "header_value": b"", "writer": None, "text": None, "name": None}
+    events = []
+
+    def on_part_begin():
+        state["headers"] = {}
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+    def on_headers_finished():
+        events.append(("begin", dict(state["headers"])))
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = multipart.MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    async def begin_part(headers):
+        _, disp = parse_options_header(headers.get(b"content-disposition", b""))
+        name = disp.get(b"name", b"").decode("utf-8", "replace")
+        state["name"] = name
+        if b"filename" in disp:
+            spec = file_fields.get(name)
+            filename = disp[b"filename"].decode("utf-8", "replace")
+            if spec is None or name in form.files or not filename:
+                return  # unexpected or empty file input: skip its data
+            filename = _safe_filename(filename)
+            part = FilePart(name, filename, spec.dest(filename, form.files))
+            prefix = form.files.get(spec.prefix_from) if spec.prefix_from else None
+            form.files[name] = part
+            state["writer"] = _Writer(part, spec)
+            if prefix:
+                await asyncio.to_thread(state["writer"].copy_prefix, prefix.path)
+        elif name in text_fields:
+            state["text"] = bytearray()
+
+    def end_part():
+        if state["writer"] is not None:
+            state["writer"].finish()
+        elif state["text"] is not None:
+            form.fields[state["name"]] = state["text"].decode("utf-8", "replace")
+        state["writer"] = None
+        state["text"] = None
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "begin":
+                    await begin_part(payload)
+                elif kind == "data":
+                    if state["writer"] is not None:
+                        state["writer"].write(payload)
+                    elif state["text"] is not None:
+                        state["text"].extend(payload)
+                        if len(state["text"]) > MAX_FIELD_SIZE:
+                            raise HTTPException(status_code=413, detail=f"Form field '{state['name']}' too large")
+                else:
+                    end_part()
+            events.clear()
+        parser.finalize()
+
+        for name, spec in file_fields.items():
+            if spec.required and name not in form.files:
+                raise HTTPException(status_code=400, detail=f"Missing file field: {name}")
+    except ValueError as e:
+        # Malformed body (python-multipart's parse errors are ValueErrors)
+        if state["writer"] is not None:
+            state["writer"].abort()
+        form.cleanup()
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+    except BaseException:
+        if state["writer"] is not None:
+            state["writer"].abort()
+        form.cleanup()
+        raise
+    return form
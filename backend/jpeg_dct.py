@@ -0,0 +1,521 @@
+import math
+import os
+import re
+import array
+import struct
+import numpy as np
+
+# JPEG steganalysis in the DCT domain, without external tools.
+# The quantized coefficients are read straight from the entropy-coded data
+# (marker parser + table-driven Huffman decoder, no pixel decode through
+# PIL/libjpeg), then the detectors are plain NumPy on the coefficient
+# arrays:
+#   - JSteg: chi-square on LSB pairs (2k, 2k+1) of the AC histogram
+#   - F5: its encoder's comment marker, and the shrinkage estimate (extra
+#     zeros, missing ones) against a calibrated histogram
+#   - OutGuess: keeps the histogram but not the blocking; how much more
+#     blocky random LSB flips make the image vs. the calibrated one
+#   - zero-coefficient ratio, original and calibrated
+# Calibration (Fridrich): decompress the luminance, crop 4x4 pixels so the
+# 8x8 grid moves, recompress with the same table. The result estimates the
+# cover's statistics.
+
+# Huge JPEGs are analyzed on their first rows only (all of each row)
+MAX_BLOCKS = int(os.getenv("DCT_MAX_BLOCKS", "60000"))
+
+# Thresholds for the verdict lines (the raw numbers are always reported)
+JSTEG_PROBABILITY = 0.5
+F5_BETA = 0.25
+OUTGUESS_SLOPE_RATIO = 0.9
+
+CALIBRATION_BLUR = 0.05
+OUTGUESS_FLIP_FRACTION = 0.5
+
+F5_COMMENT = b"JPEG Encoder Copyright 1998, James R. Weeks and BioElectronics Research Laboratory."
+
+# Zigzag position -> natural (row-major) index
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+])
+
+# Orthonormal 8-point DCT-II matrix (the JPEG FDCT is D @ block @ D.T)
+_u = np.arange(8)[:, None]
+_x = np.arange(8)[None, :]
+DCT_MATRIX = (np.where(_u == 0, math.sqrt(1 / 8), 0.5) * np.cos((2 * _x + 1) * _u * np.pi / 16)).astype(np.float32)
+
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Next marker after entropy-coded data (not a stuffed FF 00, not a RST)
+_MARKER_RE = re.compile(b"\xff[^\x00\xd0-\xd7]")
+_RST_RE = re.compile(b"\xff[\xd0-\xd7]")
+
+# --- PARSING ---
+
+def _extend(bits, s):
+    # JPEG sign extension of an s-bit magnitude
+    return bits if bits >= 1 << (s - 1) else bits + 1 - (1 << s)
+
+def _build_luts(counts, symbols):
+    """
+    Huffman table -> two 65536-entry lists indexed by the next 16 bits.
+    code_lut: (code length << 8) | symbol, 0 for invalid codes.
+    fast_lut: for codes whose magnitude bits also fit in the 16 bits,
+    (bits consumed, run + 1, value) with the value already decoded; EOB is
+    (length, 0, 0) and ZRL (length, 16, 0). None means use code_lut.
+    """
+    if sum(counts) > len(symbols):
+        raise ValueError("Invalid Huffman table")
+    code_lut = [0] * 65536
+    fast_lut = [None] * 65536
+    code = k = 0
+    for length in range(1, 17):
+        shift = 16 - length
+        for _ in range(counts[length - 1]):
+            if (code + 1) << shift > 65536:
+                raise ValueError("Invalid Huffman table")
+            symbol = symbols[k]
+            code_lut[code << shift:(code + 1) << shift] = [(length << 8) | symbol] * (1 << shift)
+            run, size = symbol >> 4, symbol & 15
+            total = length + size
+            if total <= 16:
+                rest = 16 - total
+                for bits in range(1 << size):
+                    if size:
+                        entry = (total, run + 1, _extend(bits, size))
+                    else:
+                        entry = (length, 16 if symbol == 0xF0 else 0, 0)
+                    start = ((code << size) | bits) << rest
+                    fast_lut[start:start + (1 << rest)] = [entry] * (1 << rest)
+            code += 1
+            k += 1
+        code <<= 1
+    return code_lut, fast_lut
+
+def parse_jpeg(data):
+    """
+    Walks the marker segments. Returns a dict with the quantization tables
+    (natural order), the frame, the scans (Huffman tables resolved, entropy
+    data range) and the comments.
+    """
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG file")
+    info = {"qt": {}, "frame": None, "scans": [], "comments": [], "restart_interval": 0}
+    huff = {}
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError(f"Expected a marker at offset {pos}")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        pos += 2
+        if marker == 0xD9:
+            break
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue
+        length = int.from_bytes(data[pos:pos + 2], "big")
+        if length < 2 or pos + length > len(data):
+            raise ValueError(f"Truncated segment at offset {pos - 2}")
+        seg = data[pos + 2:pos + length]
+        pos += length
+
+        if marker == 0xDB:  # DQT
+            i = 0
+            while i < len(seg):
+                precision, table_id = seg[i] >> 4, seg[i] & 15
+                size = 128 if precision else 64
+                if i + 1 + size > len(seg):
+                    raise ValueError("Truncated quantization table")
+                values = np.frombuffer(seg[i + 1:i + 1 + size], dtype=">u2" if precision else np.uint8)
+                if not values.all():
+                    # calibrate() divides by the table
+                    raise ValueError("Quantization table contains zeros")
+                table = np.empty(64, dtype=np.float32)
+                table[ZIGZAG] = values
+                info["qt"][table_id] = table
+                i += 1 + size
+        elif marker == 0xC4:  # DHT
+            i = 0
+            while i < len(seg):
+                table_class, table_id = seg[i] >> 4, seg[i] & 15
+                counts = seg[i + 1:i + 17]
+                n = sum(counts)
+                if len(counts) < 16 or i + 17 + n > len(seg):
+                    raise ValueError("Truncated Huffman table")
+                huff[(table_class, table_id)] = _build_luts(counts, seg[i + 17:i + 17 + n])
+                i += 17 + n
+        elif marker in _SOF_MARKERS:
+            if len(seg) < 6 or len(seg) < 6 + 3 * seg[5]:
+                raise ValueError("Truncated frame header")
+            components = []
+            for i in range(seg[5]):
+                c = seg[6 + 3 * i:9 + 3 * i]
+                components.append({"id": c[0], "h": c[1] >> 4, "v": c[1] & 15, "tq": c[2]})
+            info["frame"] = {
+                "marker": marker,
+                "baseline": marker in (0xC0, 0xC1),
+                "progressive": marker in (0xC2, 0xC6, 0xCA),
+                "precision": seg[0],
+                "height": int.from_bytes(seg[1:3], "big"),
+                "width": int.from_bytes(seg[3:5], "big"),
+                "components": components,
+            }
+        elif marker == 0xDD:  # DRI
+            if len(seg) < 2:
+                raise ValueError("Truncated restart interval")
+            info["restart_interval"] = int.from_bytes(seg[0:2], "big")
+        elif marker == 0xFE:  # COM
+            info["comments"].append(bytes(seg))
+        elif marker == 0xDA:  # SOS
+            if not seg or len(seg) < 1 + 2 * seg[0]:
+                raise ValueError("Truncated scan header")
+            scan_components = []
+            for i in range(seg[0]):
+                cid, tables = seg[1 + 2 * i], seg[2 + 2 * i]
+                scan_components.append({"id": cid, "dc": huff.get((0, tables >> 4)), "ac": huff.get((1, tables & 15))})
+            m = _MARKER_RE.search(data, pos)
+            end = m.start() if m else len(data)
+            info["scans"].append({"components": scan_components, "start": pos, "end": end,
+                                  "restart_interval": info["restart_interval"]})
+            pos = end
+    frame = info["frame"]
+    if frame is None:
+        raise ValueError("No frame header (SOF) found")
+    if not frame["width"] or not frame["height"] or not frame["components"] \
+            or any(not 1 <= c["h"] <= 4 or not 1 <= c["v"] <= 4 for c in frame["components"]):
+        raise ValueError("Invalid frame header")
+    return info
+
+# --- HUFFMAN DECODING ---
+
+_WINDOW = struct.Struct(">Q").unpack_from
+
+def _decode_block(buf, p, dc_lut, ac_luts, pred, out, base):
+    """
+    Decodes one 8x8 block starting at bit p into out[base:base + 64]
+    (zigzag order). Returns (new bit position, new DC predictor).
+    """
+    # Symbols are read from a 64-bit window (its low `avail` bits are the
+    # ones at p), refilled when fewer than 32 are left: enough for the
+    # longest code (16) plus magnitude (15).
+    w = _WINDOW(buf, p >> 3)[0]
+    avail = 64 - (p & 7)
+    e = dc_lut[(w >> (avail - 16)) & 0xFFFF]
+    if not e:
+        raise ValueError("Invalid Huffman code")
+    length, s = e >> 8, e & 0xFF
+    avail -= length + s
+    if s:
+        v = (w >> avail) & ((1 << s) - 1)
+        pred += v if v >= 1 << (s - 1) else v + 1 - (1 << s)
+    p += length + s
+    out[base] = pred
+
+    ac_lut, fast_lut = ac_luts
+    k = 1
+    while k < 64:
+        if avail < 32:
+            w = _WINDOW(buf, p >> 3)[0]
+            avail = 64 - (p & 7)
+        top = (w >> (avail - 16)) & 0xFFFF
+        fast = fast_lut[top]
+        if fast is not None:
+            # Short code + magnitude: one lookup does it all
+            n, advance, v = fast
+            p += n
+            avail -= n
+            if not advance:
+                break  # EOB
+            k += advance
+            if v and k <= 64:
+                out[base + k - 1] = v
+            continue
+        e = ac_lut[top]
+        if not e:
+            raise ValueError("Invalid Huffman code")
+        length, rs = e >> 8, e & 0xFF
+        s = rs & 15
+        k += rs >> 4
+        avail -= length + s
+        v = (w >> avail) & ((1 << s) - 1)
+        if k < 64:
+            out[base + k] = v if v >= 1 << (s - 1) else v + 1 - (1 << s)
+        k += 1
+        p += length + s
+    return p, pred
+
+def decode_coefficients(data, info, max_blocks=MAX_BLOCKS):
+    """
+    Huffman-decodes the sequential scans. Returns one dict per component:
+    "blocks" (rows, cols, 64) int16 in natural order and "rows_decoded";
+    huge images stop after about max_blocks blocks, at an MCU row boundary.
+    """
+    frame = info["frame"]
+    if not frame["baseline"]:
+        kind = "progressive" if frame["progressive"] else "arithmetic-coded/lossless"
+        raise ValueError(f"{kind} JPEGs are not supported")
+    hmax = max(c["h"] for c in frame["components"])
+    vmax = max(c["v"] for c in frame["components"])
+    mcux = -(-frame["width"] // (8 * hmax))
+    mcuy = -(-frame["height"] // (8 * vmax))
+    blocks_per_row = sum(c["h"] * c["v"] for c in frame["components"]) * mcux
+    row_limit = min(mcuy, max(1, max_blocks // blocks_per_row))
+
+    comps = {}
+    for c in frame["components"]:
+        # Only the rows that will be decoded are allocated
+        cols, rows = mcux * c["h"], mcuy * c["v"]
+        comps[c["id"]] = dict(c, cols=cols, rows=rows, rows_decoded=0, rows_alloc=row_limit * c["v"],
+                              coef=array.array("h", bytes(2 * cols * row_limit * c["v"] * 64)))
+
+    for scan in info["scans"]:
+        if any(sc["id"] not in comps for sc in scan["components"]):
+            raise ValueError("Scan refers to an unknown component")
+        scan_comps = [comps[sc["id"]] for sc in scan["components"]]
+        if len(scan_comps) == 1:
+            # Non-interleaved: one block per "MCU", over the component's own size
+            c = scan_comps[0]
+            per_line = -(-(-(-frame["width"] * c["h"] // hmax)) // 8)
+            lines = -(-(-(-frame["height"] * c["v"] // vmax)) // 8)
+            line_limit = min(lines, row_limit * c["v"])
+            layout = [(c, 1, 1)]
+        else:
+            per_line, line_limit = mcux, row_limit
+            layout = [(c, c["h"], c["v"]) for c in scan_comps]
+        if any(sc["dc"] is None or sc["ac"] is None for sc in scan["components"]):
+            raise ValueError("Scan uses an undefined Huffman table")
+        luts = [(sc["dc"][0], sc["ac"]) for sc in scan["components"]]
+
+        total = per_line * line_limit
+        interval = scan["restart_interval"] or total
+        entropy = data[scan["start"]:scan["end"]]
+        parts = _RST_RE.split(entropy) if scan["restart_interval"] else [entropy]
+        m = 0
+        try:
+            for part in parts:
+                if m >= total:
+                    break
+                # Unstuff, then pad with 1 bits (JPEG fill) for the windows
+                buf = part.replace(b"\xff\x00", b"\xff") + b"\xff" * 8
+                limit = len(buf) * 8 - 64
+                p = 0
+                preds = [0] * len(layout)
+                for m in range(m, min(m + interval, total)):
+                    my, mx = divmod(m, per_line)
+                    for ci, (c, h, v) in enumerate(layout):
+                        dc_lut, ac_luts = luts[ci]
+                        coef, cols = c["coef"], c["cols"]
+                        for by in range(v):
+                            row = (my * v + by) * cols + mx * h
+                            for bx in range(h):
+                                p, preds[ci] = _decode_block(buf, p, dc_lut, ac_luts, preds[ci], coef, (row + bx) * 64)
+                    if p > limit:
+                        raise ValueError("Entropy data ended early")
+                m += 1
+        except (ValueError, IndexError, OverflowError, struct.error):
+            # corrupt/truncated (OverflowError: a DC predictor outside int16):
+            # keep what was decoded
+            pass
+        for c, h, v in layout:
+            c["rows_decoded"] = max(c["rows_decoded"], (m // per_line) * v)
+
+    result = {}
+    for cid, c in comps.items():
+        zz = np.frombuffer(c["coef"], dtype=np.int16).reshape(c["rows_alloc"], c["cols"], 64)
+        blocks = np.empty_like(zz)
+        blocks[..., ZIGZAG] = zz
+        result[cid] = {"blocks": blocks[:c["rows_decoded"]], "rows_decoded": c["rows_decoded"],
+                       "rows": c["rows"], "tq": c["tq"], "h": c["h"], "v": c["v"]}
+    return result
+
+# --- DETECTORS ---
+
+def _chi_square_probability(even, odd):
+    """Westfeld-Pfitzmann pairs test: probability that the pairs were equalized."""
+    expected = (even + odd) / 2
+    mask = expected > 4
+    dof = int(mask.sum()) - 1
+    if dof < 1:
+        return 0.0, 0
+    chi = float((((even - expected) ** 2)[mask] / expected[mask]).sum())
+    # Wilson-Hilferty approximation of the chi-square upper tail
+    z = ((chi / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2)), dof
+
+def jsteg_test(ac):
+    """
+    JSteg replaces the LSB of every AC coefficient except 0 and 1, which
+    evens out the pairs (2k, 2k + 1) (-2/-1, 2/3, ...).
+    """
+    values = ac[(ac != 0) & (ac != 1)].astype(np.int64)
+    if not len(values):
+        return {"probability": 0.0, "dof": 0}
+    hist = np.bincount(values - values.min() + (values.min() & 1))
+    if len(hist) % 2:
+        hist = np.append(hist, 0)
+    pairs = hist.reshape(-1, 2).astype(np.float64)
+    probability, dof = _chi_square_probability(pairs[:, 0], pairs[:, 1])
+    return {"probability": round(probability, 4), "dof": dof}
+
+def _spatial(blocks, qt):
+    """Quantized blocks (..., 64) -> pixel blocks (..., 8, 8), level shifted back."""
+    coeffs = (blocks.astype(np.float32) * qt).reshape(blocks.shape[:-1] + (8, 8))
+    return np.clip(np.round(DCT_MATRIX.T @ coeffs @ DCT_MATRIX + 128), 0, 255)
+
+def _plane(pixel_blocks):
+    rows, cols = pixel_blocks.shape[:2]
+    return pixel_blocks.transpose(0, 2, 1, 3).reshape(rows * 8, cols * 8)
+
+def _blocks_of(plane):
+    rows, cols = plane.shape[0] // 8, plane.shape[1] // 8
+    return plane[:rows * 8, :cols * 8].reshape(rows, 8, cols, 8).transpose(0, 2, 1, 3)
+
+def blockiness(plane):
+    """Mean absolute step across 8x8 block boundaries."""
+    h = np.abs(plane[7:-1:8, :] - plane[8::8, :])
+    v = np.abs(plane[:, 7:-1:8] - plane[:, 8::8])
+    count = h.size + v.size
+    return float((h.sum() + v.sum()) / count) if count else 0.0
+
+def calibrate(blocks, qt):
+    """
+    Decompress, crop 4x4 pixels, blur lightly (removes the old blocking),
+    recompress with the same table. Returns the calibrated blocks.
+    """
+    plane = _plane(_spatial(blocks, qt))[4:, 4:]
+    padded = np.pad(plane, 1, mode="edge")
+    e = CALIBRATION_BLUR
+    plane = (1 - 4 * e) * plane + e * (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:])
+    coeffs = DCT_MATRIX @ (_blocks_of(plane) - np.float32(128)) @ DCT_MATRIX.T
+    return np.round(coeffs.reshape(coeffs.shape[:2] + (64,)) / qt).astype(np.int32)
+
+def _flip_lsbs(blocks, fraction):
+    """Flips the LSB of a random `fraction` of the AC coefficients outside {0, 1}."""
+    rng = np.random.default_rng(0)
+    flipped = blocks.astype(np.int32)
+    ac = flipped[..., 1:]
+    ac[(ac != 0) & (ac != 1) & (rng.random(ac.shape) < fraction)] ^= 1
+    return flipped
+
+def outguess_test(blocks, calibrated, qt):
+    """
+    Blockiness slope (Fridrich, Goljan, Hogea): flipping more LSBs raises
+    the blockiness of a cover, much less that of an image that already
+    carries LSB-embedded data (OutGuess keeps the histogram, not this).
+    Compares the increase on the image with the one on its calibrated
+    version: clearly under 1 means it was embedded already.
+    """
+    slopes = []
+    for b in (blocks, calibrated):
+        before = blockiness(_plane(_spatial(b, qt)))
+        after = blockiness(_plane(_spatial(_flip_lsbs(b, OUTGUESS_FLIP_FRACTION), qt)))
+        slopes.append((before, after - before))
+    (b_image, s_image), (b_cal, s_cal) = slopes
+    return {
+        "blockiness": round(b_image, 4),
+        "calibrated_blockiness": round(b_cal, 4),
+        "slope_ratio": round(s_image / s_cal, 4) if s_cal > 0 else 0.0,
+    }
+
+def f5_estimate(blocks, calibrated):
+    """
+    F5 shrinkage estimate (Fridrich et al.): with beta the fraction of
+    modified non-zero coefficients, h(0) ~ H(0) + beta H(1) and
+    h(1) ~ (1 - beta) H(1) + beta H(2), H being the calibrated histogram.
+    Least squares on the three lowest AC modes, averaged.
+    """
+    betas = []
+    for mode in (1, 8, 9):
+        h = np.bincount(np.abs(blocks[..., mode]).ravel().astype(np.int64), minlength=3)[:3].astype(np.float64)
+        H = np.bincount(np.abs(calibrated[..., mode]).ravel().astype(np.int64), minlength=3)[:3].astype(np.float64)
+        # Normalize the calibrated counts to the same number of blocks
+        H *= h.sum() / max(H.sum(), 1)
+        denom = H[1] ** 2 + (H[2] - H[1]) ** 2
+        if denom > 0:
+            betas.append((H[1] * (h[0] - H[0]) + (h[1] - H[1]) * (H[2] - H[1])) / denom)
+    return max(0.0, float(np.mean(betas))) if betas else 0.0
+
+def analyze_jpeg(data, max_blocks=MAX_BLOCKS):
+    """
+    Runs every detector on JPEG bytes. Returns a dict of statistics plus
+    "findings" (human-readable lines for the suspicious ones).
+    """
+    info = parse_jpeg(data)
+    frame = info["frame"]
+    comps = decode_coefficients(data, info, max_blocks)
+    luma = comps[frame["components"][0]["id"]]
+    qt = info["qt"].get(luma["tq"])
+    if qt is None:
+        raise ValueError("Missing quantization table")
+
+    all_ac = np.concatenate([c["blocks"][..., 1:].ravel() for c in comps.values()])
+    luma_ac = luma["blocks"][..., 1:]
+    stats = {
+        "width": frame["width"],
+        "height": frame["height"],
+        "components": len(frame["components"]),
+        "sampling": "x".join(f"{c['h']}{c['v']}" for c in frame["components"]),
+        "luma_quant_dc": int(qt[0]),
+        "blocks_analyzed": int(sum(c["blocks"].shape[0] * c["blocks"].shape[1] for c in comps.values())),
+        "sampled": luma["rows_decoded"] < luma["rows"],
+        "ac_coefficients": int(all_ac.size),
+        "zero_ratio": round(float((all_ac == 0).mean()), 4) if all_ac.size else 0.0,
+        "ones_ratio": round(float((np.abs(all_ac) == 1).mean()), 4) if all_ac.size else 0.0,
+        "jsteg": jsteg_test(all_ac),
+        "comments": [c.decode("latin-1")[:200] for c in info["comments"]],
+    }
+
+    findings = []
+    if any(c.startswith(F5_COMMENT[:40]) for c in info["comments"]):
+        findings.append("F5 encoder comment present (JPEG Encoder Copyright 1998, James R. Weeks ...)")
+    if stats["jsteg"]["probability"] > JSTEG_PROBABILITY:
+        findings.append(f"JSteg-like LSB pairs: chi-square embedding probability {stats['jsteg']['probability']}")
+
+    # Calibration needs at least a few block rows/cols after the crop
+    if luma["blocks"].shape[0] > 2 and luma["blocks"].shape[1] > 2:
+        calibrated = calibrate(luma["blocks"], qt)
+        beta = f5_estimate(luma["blocks"], calibrated)
+        outguess = outguess_test(luma["blocks"], calibrated, qt)
+        stats["calibration"] = {
+            "luma_zero_ratio": round(float((luma_ac == 0).mean()), 4),
+            "calibrated_zero_ratio": round(float((calibrated[..., 1:] == 0).mean()), 4),
+            "f5_beta": round(beta, 4),
+            **outguess,
+        }
+        if beta > F5_BETA:
+            findings.append(f"F5-like shrinkage: about {beta:.0%} of non-zero AC coefficients changed"
+                            " (calibration overestimates on graphics and recompressed images)")
+        if 0 < outguess["slope_ratio"] < OUTGUESS_SLOPE_RATIO:
+            findings.append(f"LSB flips add {outguess['slope_ratio']}x the blockiness they add to the calibrated"
+                            " image: data likely embedded already (OutGuess-like)")
+    stats["findings"] = findings
+    return stats
+
+def analyze_file(path, max_blocks=MAX_BLOCKS):
+    with open(path, "rb") as f:
+        return analyze_jpeg(f.read(), max_blocks)
+
+def format_report(stats):
+    lines = [
+        f"Size        : {stats['width']} x {stats['height']}, {stats['components']} component(s), sampling {stats['sampling']}",
+        f"Blocks      : {stats['blocks_analyzed']}" + (" (first rows only)" if stats["sampled"] else ""),
+        f"AC coeffs   : {stats['ac_coefficients']}, zeros {stats['zero_ratio']:.2%}, +/-1 {stats['ones_ratio']:.2%}",
+        f"JSteg test  : embedding probability {stats['jsteg']['probability']} (dof {stats['jsteg']['dof']})",
+    ]
+    cal = stats.get("calibration")
+    if cal:
+        lines.append(f"Calibrated  : zeros {cal['luma_zero_ratio']:.2%} vs {cal['calibrated_zero_ratio']:.2%} (luma), "
+                     f"F5 beta {cal['f5_beta']}")
+        lines.append(f"Blockiness  : {cal['blockiness']} vs {cal['calibrated_blockiness']} calibrated, "
+                     f"LSB flip slope ratio {cal['slope_ratio']}")
+    for comment in stats["comments"]:
+        lines.append(f"Comment     : {comment}")
+    lines.append("")
+    if stats["findings"]:
+        lines.extend(f"[!] {f}" for f in stats["findings"])
+    else:
+        lines.append("[-] No DCT-domain embedding signature found")
+    return "\n".join(lines)
@@ -0,0 +1,354 @@
+"""
+End-to-end load generator for the FastAPI + Celery stack.
+
+Against a running deployment:
+    python loadtest.py --target http://127.0.0.1:8000 --concurrency 16 --duration 60
+
+Fully local, no Redis and no forensic binaries (Celery eager mode, stub tools):
+    python loadtest.py --local --concurrency 8 --duration 30
+
+Local with a real Redis, separate uvicorn + Celery worker processes:
+    python loadtest.py --local --redis-url redis://127.0.0.1:6379/0 --api-workers 4 --celery-concurrency 4
+
+Reports p50/p95/p99 latency, throughput and error rate per endpoint.
+Rate limits must be off on the target (RATE_LIMIT_ENABLED=0), otherwise
+most requests are counted as 429s.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Tools called by worker.analyze_image_task. The stubs sleep for
+# --stub-delay seconds and print a line, so the pipeline runs end to end.
+STUB_TOOLS = ["zsteg", "stegseek", "outguess", "exiftool", "binwalk", "foremost", "strings", "file"]
+
+# Scenario: endpoint -> weight in the request mix
+DEFAULT_MIX = {
+    "upload": 2,
+    "encrypt": 2,
+    "decrypt": 1,
+    "embed": 2,
+    "advanced_hide": 2,
+    "advanced_recover": 2,
+}
+
+ADV_OFFSET = 1024
+ADV_INTERVAL = 50
+ADV_MESSAGE = "LoadTest{payload}"
+
+# --- FIXTURES ---
+
+def _make_fixtures(megapixels):
+    from advanced_steg import custom_inject
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(megapixels * 1_000_000 / width)
+    img = Image.effect_noise((width, height), 64).convert("RGB")
+
+    png_buf = io.BytesIO()
+    img.save(png_buf, format="PNG")
+    jpg_buf = io.BytesIO()
+    img.save(jpg_buf, format="JPEG", quality=90)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stego = custom_inject(png_buf.getvalue(), ADV_MESSAGE, ADV_OFFSET, ADV_INTERVAL)
+
+    return {
+        "png": png_buf.getvalue(),
+        "jpg": jpg_buf.getvalue(),
+        "stego_png": bytes(stego),
+        "payload": os.urandom(256 * 1024),
+    }
+
+# --- STATS ---
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok, status_code=None):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if status_code == 429:
+                self.rate_limited[endpoint] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+def summarize(stats, elapsed):
+    report = {}
+    for endpoint, values in sorted(stats.latencies.items()):
+        values = sorted(values)
+        count = len(values)
+        report[endpoint] = {
+            "count": count,
+            "errors": stats.errors[endpoint],
+            "rate_limited": stats.rate_limited[endpoint],
+            "error_rate": stats.errors[endpoint] / count if count else 0.0,
+            "throughput_rps": count / elapsed if elapsed else 0.0,
+            "p50_ms": _percentile(values, 50) * 1000,
+            "p95_ms": _percentile(values, 95) * 1000,
+            "p99_ms": _percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    return report
+
+def print_report(report, elapsed):
+    print(f"\nDuration: {elapsed:.1f}s")
+    print(f"{'endpoint':<28} {'count':>7} {'rps':>8} {'err%':>7} {'429':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, r in report.items():
+        print(f"{endpoint:<28} {r['count']:>7} {r['throughput_rps']:>8.2f} {r['error_rate'] * 100:>6.1f}%"
+              f" {r['rate_limited']:>5} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+# --- SCENARIO ---
+
+class Scenario:
+    def __init__(self, base_url, fixtures, stats, poll_timeout, poll_interval):
+        self.base_url = base_url.rstrip("/")
+        self.fixtures = fixtures
+        self.stats = stats
+        self.poll_timeout = poll_timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # requests.Session is not thread-safe; one per load thread
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _post(self, endpoint, path, files, data=None):
+        start = time.perf_counter()
+        try:
+            resp = self.session.post(f"{self.base_url}{path}", files=files, data=data, timeout=300)
+            elapsed = time.perf_counter() - start
+            body = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
+            ok = resp.status_code < 400 and body.get("status") != "error"
+            self.stats.record(endpoint, elapsed, ok, resp.status_code)
+            return body if ok else None
+        except Exception:
+            self.stats.record(endpoint, time.perf_counter() - start, False)
+            return None
+
+    def upload(self):
+        body = self._post("/upload", "/upload", {"file": ("load.png", self.fixtures["png"], "image/png")})
+        if not body or "task_id" not in body:
+            return
+        # Track how long the analysis takes end to end, polling like the frontend does
+        start = time.perf_counter()
+        while time.perf_counter() - start < self.poll_timeout:
+            poll_start = time.perf_counter()
+            try:
+                resp = self.session.get(f"{self.base_url}/result/{body['task_id']}", timeout=30)
+                self.stats.record("/result/{task_id}", time.perf_counter() - poll_start, resp.ok, resp.status_code)
+                if resp.ok and resp.json().get("status") == "completed":
+                    self.stats.record("analysis (end-to-end)", time.perf_counter() - start, True)
+                    return
+            except Exception:
+                self.stats.record("/result/{task_id}", time.perf_counter() - poll_start, False)
+            time.sleep(self.poll_interval)
+        self.stats.record("analysis (end-to-end)", time.perf_counter() - start, False)
+
+    def encrypt(self):
+        self._post("/encrypt", "/encrypt", {"file": ("load.jpg", self.fixtures["jpg"], "image/jpeg")},
+                   {"password": "load-test"})
+
+    def decrypt(self):
+        self._post("/decrypt", "/decrypt", {"file": ("load.png", self.fixtures["png"], "image/png")},
+                   {"password": "load-test"})
+
+    def embed(self):
+        self._post("/embed", "/embed", {
+            "cover": ("cover.png", self.fixtures["png"], "image/png"),
+            "payload_file": ("payload.zip", self.fixtures["payload"], "application/zip"),
+        })
+
+    def advanced_hide(self):
+        self._post("/steg/advanced/hide", "/steg/advanced/hide",
+                   {"file": ("cover.png", self.fixtures["png"], "image/png")},
+                   {"message": ADV_MESSAGE, "start_offset": ADV_OFFSET, "interval": ADV_INTERVAL})
+
+    def advanced_recover(self):
+        self._post("/steg/advanced/recover", "/steg/advanced/recover",
+                   {"file": ("stego.png", self.fixtures["stego_png"], "image/png")},
+                   {"offset": ADV_OFFSET, "interval": ADV_INTERVAL})
+
+def run_load(scenario, mix, concurrency, duration, total_requests):
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    deadline = time.monotonic() + duration
+    counter = {"issued": 0}
+    counter_lock = threading.Lock()
+
+    def _next_action():
+        with counter_lock:
+            if total_requests and counter["issued"] >= total_requests:
+                return None
+            if not total_requests and time.monotonic() >= deadline:
+                return None
+            counter["issued"] += 1
+        return random.choices(names, weights)[0]
+
+    def _loop():
+        while (action := _next_action()) is not None:
+            getattr(scenario, action)()
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(_loop)
+    return time.monotonic() - start
+
+# --- LOCAL STACK ---
+
+def _write_stub_tools(stub_dir, delay):
+    for tool in STUB_TOOLS:
+        path = os.path.join(stub_dir, tool)
+        with open(path, "w") as f:
+            f.write(f"#!/bin/sh\nsleep {delay}\necho \"[stub] {tool} $*\"\n")
+        os.chmod(path, 0o755)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return True
+        time.sleep(0.2)
+    return False
+
+@contextlib.contextmanager
+def local_stack(args):
+    """
+    Starts uvicorn (and a Celery worker when --redis-url is given) with stub
+    tools on PATH, in a throwaway working directory.
+    """
+    workdir = tempfile.mkdtemp(prefix="stegsik_load_")
+    stub_dir = os.path.join(workdir, "bin")
+    os.makedirs(stub_dir)
+    _write_stub_tools(stub_dir, args.stub_delay)
+    # stegseek is called with a relative wordlist path
+    open(os.path.join(workdir, "wordlist.txt"), "w").close()
+
+    env = dict(os.environ)
+    env["PATH"] = stub_dir + os.pathsep + env.get("PATH", "")
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env["RATE_LIMIT_ENABLED"] = "0"
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+        api_workers = args.api_workers
+    else:
+        # Eager results live in process memory, so /result must hit the same process
+        env["CELERY_TASK_ALWAYS_EAGER"] = "1"
+        env["CELERY_BROKER_URL"] = "memory://"
+        env["CELERY_RESULT_BACKEND"] = "cache+memory://"
+        env["REDIS_URL"] = "redis://127.0.0.1:1/0"  # metrics flush fails fast
+        api_workers = 1
+
+    port = _free_port()
+    procs = [subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(api_workers), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+    )]
+    if args.redis_url:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "celery", "-A", "worker", "worker", "--loglevel=warning",
+             f"--concurrency={args.celery_concurrency}"],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+        ))
+    try:
+        if not _wait_for_port(port):
+            raise RuntimeError("uvicorn did not start")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _parse_mix(value):
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            sys.exit(f"Unknown endpoint in mix: {name}. Available: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Stegsik end-to-end load test")
+    parser.add_argument("--target", help="Base URL of a running API")
+    parser.add_argument("--local", action="store_true", help="Start a local stack with stub tools")
+    parser.add_argument("--redis-url", help="With --local: use this Redis and a real Celery worker")
+    parser.add_argument("--api-workers", type=int, default=2)
+    parser.add_argument("--celery-concurrency", type=int, default=2)
+    parser.add_argument("--stub-delay", type=float, default=0.05, help="Seconds each stub tool sleeps")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many scenario actions")
+    parser.add_argument("--mix", default="", help="e.g. upload=1,encrypt=3 (default: all endpoints)")
+    parser.add_argument("--image-mp", type=float, default=0.25, help="Fixture image size in megapixels")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--poll-timeout", type=float, default=120)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if not args.target and not args.local:
+        parser.error("one of --target or --local is required")
+
+    mix = _parse_mix(args.mix)
+    fixtures = _make_fixtures(args.image_mp)
+    stats = Stats()
+
+    with contextlib.ExitStack() as stack:
+        base_url = args.target or stack.enter_context(local_stack(args))
+        print(f"[*] Load testing {base_url} with {args.concurrency} clients...", file=sys.stderr)
+        scenario = Scenario(base_url, fixtures, stats, args.poll_timeout, args.poll_interval)
+        elapsed = run_load(scenario, mix, args.concurrency, args.duration, args.requests)
+
+    report = summarize(stats, elapsed)
+    print_report(report, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"duration_s": elapsed, "concurrency": args.concurrency, "endpoints": report}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
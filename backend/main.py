@@ -1,22 +1,45 @@
-from worker import analyze_image_task, celery_app
-from utils import patch_png_height, patch_jpg_height, process_image_encryption
+# Heavy modules (numpy/PIL via utils and advanced_steg) are imported inside
+# the endpoints that need them, so API workers start fast and stay small.
+from celery_app import celery_app, enqueue_analysis
+from profiles import PROFILES
 from celery.result import AsyncResult
-import shutil
 import os
+import time
 import uuid
 import magic  # python-magic-bin
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Depends
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import asyncio
+from metrics import record_request, render_prometheus, flush_to_redis_async, load_redis_samples_async
+from rate_limit import RateLimiter
+from async_redis import close_async_redis
+from ingest import FileField, stream_upload
 
 # Infrastructure Setup
-limiter = Limiter(key_func=get_remote_address)
+# RATE_LIMIT_ENABLED=0 turns limits off (load testing only)
+# Limits live in Redis, so they hold across all uvicorn workers and replicas
+limiter = RateLimiter(enabled=os.getenv("RATE_LIMIT_ENABLED", "1") != "0")
 app = FastAPI(docs_url=None, redoc_url=None)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+
+async def _metrics_flush_loop():
+    # Each API worker pushes its request metrics to Redis, so /metrics on
+    # any worker shows the whole deployment
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        await flush_to_redis_async()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    app.state.metrics_flusher = asyncio.create_task(_metrics_flush_loop())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.metrics_flusher.cancel()
+    await flush_to_redis_async()
+    await close_async_redis()
 
 # Global 404 Redirect
 @app.exception_handler(404)
@@ -28,6 +51,7 @@ async def custom_404_handler(request, __):
 MAX_IMAGE_SIZE = 50 * 1024 * 1024      # 50MB
 MAX_PAYLOAD_SIZE = 1 * 1024 * 1024 * 1024  # 1GB
 ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png']
+ANALYSIS_PROFILES = ["auto"] + list(PROFILES)
 
 # Middleware: Strict CORS & Security Headers
 origins = [
@@ -40,6 +64,11 @@ origins = [
     "*"  # Allow all for troubleshooting
 ]
 
+# Weighted per-client budget (see rate_limit.ENDPOINT_COSTS). Registered
+# first so it runs inside CORS and the security headers: its 429s carry
+# both, and browsers see "rate limited" instead of a CORS failure
+app.middleware("http")(limiter.budget_middleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -55,6 +84,16 @@ async def add_security_headers(request: Request, call_next):
     response.headers["X-Frame-Options"] = "DENY"
     return response
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.monotonic()
+    response = await call_next(request)
+    # Label by route template (e.g. /result/{task_id}) to keep cardinality bounded
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    record_request(endpoint, request.method, response.status_code, time.monotonic() - start)
+    return response
+
 # Validation Helper
 async def validate_file(file: UploadFile, max_size: int = MAX_IMAGE_SIZE, allowed_mimes: list = ALLOWED_IMAGE_TYPES):
     # 1. Check Magic Numbers (Mime Type) for images
@@ -69,53 +108,82 @@ async def validate_file(file: UploadFile, max_size: int = MAX_IMAGE_SIZE, allowe
     
     return True
 
-async def save_upload_file(file: UploadFile, file_location: str, max_size: int):
-    total_size = 0
-    with open(file_location, "wb+") as file_object:
-        while chunk := await file.read(1024 * 1024): # 1MB chunks
-            total_size += len(chunk)
-            if total_size > max_size:
-                file_object.close()
-                os.remove(file_location)
-                raise HTTPException(status_code=413, detail=f"File too large. Max allowed: {max_size/1024/1024} MB")
-            file_object.write(chunk)
-    await file.seek(0) # Reset if needed, though usually we are done reading.
-
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Upload endpoints parse the multipart body themselves (ingest.stream_upload)
+# so files go straight to UPLOAD_DIR, with the type check and size limit
+# applied while streaming.
+def image_field(file_id, required=True):
+    return FileField(MAX_IMAGE_SIZE, ALLOWED_IMAGE_TYPES, dest=lambda filename, parts: f"{UPLOAD_DIR}/{file_id}_{filename}",
+                     required=required)
+
+async def form_file(form, name, spec, id_field="upload_id", link=True, copy=False):
+    """
+    The file part `name`, or else the committed resumable upload whose id
+    is in the form field `id_field` (see resumable.use_upload, run in a
+    thread since it may copy the whole file).
+    """
+    if name in form.files:
+        return form.files[name]
+    upload_id = form.fields.get(id_field)
+    if not upload_id:
+        form.cleanup()
+        raise HTTPException(status_code=400, detail=f"Missing file field: {name} (or {id_field})")
+    from resumable import use_upload
+    try:
+        return await asyncio.to_thread(use_upload, UPLOAD_DIR, upload_id, spec, name, link=link, copy=copy)
+    except HTTPException:
+        form.cleanup()
+        raise
+
+def required_field(form, name, cast=str):
+    value = form.fields.get(name)
+    if value is None:
+        form.cleanup()
+        raise HTTPException(status_code=400, detail=f"Missing form field: {name}")
+    try:
+        return cast(value)
+    except ValueError:
+        form.cleanup()
+        raise HTTPException(status_code=400, detail=f"Invalid value for {name}")
+
 # Mount the uploads directory to be accessible via /uploads
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 @app.post("/upload")
 @limiter.limit("50/minute")
-async def upload_image(request: Request, file: UploadFile = File(...)):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
-    
+async def upload_image(request: Request):
     file_id = str(uuid.uuid4())
-    file_location = f"{UPLOAD_DIR}/{file_id}_{file.filename}"
+    spec = image_field(file_id, required=False)
+    form = await stream_upload(request, {"file": spec}, text_fields=("profile", "upload_id"))
+    profile = form.fields.get("profile", "auto")
+    if profile not in ANALYSIS_PROFILES:
+        form.cleanup()
+        raise HTTPException(status_code=400, detail=f"Invalid profile. Allowed: {ANALYSIS_PROFILES}")
+    upload = await form_file(form, "file", spec)
     
-    await save_upload_file(file, file_location, max_size=MAX_IMAGE_SIZE)
-    
-    task = analyze_image_task.delay(file_location)
-    return {"task_id": task.id, "filename": file.filename}
+    task = enqueue_analysis(upload.path, enqueued_at=time.time(), profile=profile)
+    return {"task_id": task.id, "filename": upload.filename, "sha256": upload.sha256}
 
 @app.post("/patch-height")
 @limiter.limit("20/minute")
-async def patch_height(request: Request, file: UploadFile = File(...), height: int = Form(...)):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
+async def patch_height(request: Request):
     file_id = str(uuid.uuid4())
-    # Save original
-    original_filename = file.filename
-    file_location = f"{UPLOAD_DIR}/{file_id}_{original_filename}"
-    
-    await save_upload_file(file, file_location, max_size=MAX_IMAGE_SIZE)
+    # Save original (a resumable upload is copied: the patch is in place)
+    spec = image_field(file_id, required=False)
+    form = await stream_upload(request, {"file": spec}, text_fields=("height", "upload_id"))
+    height = required_field(form, "height", int)
+    upload = await form_file(form, "file", spec, copy=True)
+    original_filename = upload.filename
+    file_location = upload.path
         
     # Determine type and patch
     ext = os.path.splitext(original_filename)[1].lower()
     success = False
     msg = ""
     
+    from utils import patch_png_height, patch_jpg_height
     if ext == '.png':
         success, msg = patch_png_height(file_location, height)
     elif ext in ['.jpg', '.jpeg']:
@@ -136,15 +204,14 @@ async def patch_height(request: Request, file: UploadFile = File(...), height: i
 
 @app.post("/encrypt")
 @limiter.limit("20/minute")
-async def encrypt_image(request: Request, file: UploadFile = File(...), password: str = Form(...)):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
+async def encrypt_image(request: Request):
+    file_id = str(uuid.uuid4())
+    spec = image_field(file_id, required=False)
+    form = await stream_upload(request, {"file": spec}, text_fields=("password", "upload_id"))
+    password = required_field(form, "password")
+    file_location = (await form_file(form, "file", spec)).path
     try:
-        file_id = str(uuid.uuid4())
-        original_filename = file.filename
-        file_location = f"{UPLOAD_DIR}/{file_id}_{original_filename}"
-        
-        await save_upload_file(file, file_location, max_size=MAX_IMAGE_SIZE)
-            
+        from utils import process_image_encryption
         success, out_filename, out_path = process_image_encryption(file_location, password, mode='encrypt')
         
         if success:
@@ -161,15 +228,14 @@ async def encrypt_image(request: Request, file: UploadFile = File(...), password
 
 @app.post("/decrypt")
 @limiter.limit("20/minute")
-async def decrypt_image(request: Request, file: UploadFile = File(...), password: str = Form(...)):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
+async def decrypt_image(request: Request):
+    file_id = str(uuid.uuid4())
+    spec = image_field(file_id, required=False)
+    form = await stream_upload(request, {"file": spec}, text_fields=("password", "upload_id"))
+    password = required_field(form, "password")
+    file_location = (await form_file(form, "file", spec)).path
     try:
-        file_id = str(uuid.uuid4())
-        original_filename = file.filename
-        file_location = f"{UPLOAD_DIR}/{file_id}_{original_filename}"
-        
-        await save_upload_file(file, file_location, max_size=MAX_IMAGE_SIZE)
-            
+        from utils import process_image_encryption
         success, out_filename, out_path = process_image_encryption(file_location, password, mode='decrypt')
         
         if success:
@@ -186,50 +252,64 @@ async def decrypt_image(request: Request, file: UploadFile = File(...), password
 
 @app.post("/embed")
 @limiter.limit("20/minute")
-async def embed_file(
-    request: Request,
-    cover: UploadFile = File(...),
-    payload_file: UploadFile = File(None),
-    payload_text: str = Form(None)
-):
-    # Validate Cover (Image, 50MB)
-    await validate_file(cover, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
-    
-    # Validate Payload (Any, 1GB)
-    if payload_file:
-        await validate_file(payload_file, max_size=MAX_PAYLOAD_SIZE, allowed_mimes=[])
+async def embed_file(request: Request):
+    file_id = str(uuid.uuid4())
+
+    def embedded_path(cover):
+        name, ext = os.path.splitext(cover.filename)
+        return f"{UPLOAD_DIR}/embedded_{file_id}_{name}{ext}"
+
+    def payload_dest(filename, parts):
+        # Cover already received (the normal field order): the payload is
+        # streamed straight into the output file, right after a copy of the cover
+        if "cover" in parts:
+            return embedded_path(parts["cover"])
+        return f"{UPLOAD_DIR}/{file_id}_payload.bin"
+
+    # Cover: image, 50MB. Payload: anything, 1GB. Either can also be a
+    # resumable upload (cover_upload_id / payload_upload_id), used in place.
+    cover_spec = image_field(file_id, required=False)
+    payload_spec = FileField(MAX_PAYLOAD_SIZE, dest=payload_dest, required=False, prefix_from="cover")
+    form = await stream_upload(request, {
+        "cover": cover_spec,
+        "payload_file": payload_spec,
+    }, text_fields=("payload_text", "cover_upload_id", "payload_upload_id"))
+    cover = await form_file(form, "cover", cover_spec, "cover_upload_id", link=False)
+    payload_file = form.files.get("payload_file")
+    if payload_file is None and form.fields.get("payload_upload_id"):
+        payload_file = await form_file(form, "payload_file", payload_spec, "payload_upload_id", link=False)
+    payload_text = form.fields.get("payload_text")
 
     try:
-        file_id = str(uuid.uuid4())
-        cover_filename = cover.filename
-        cover_location = f"{UPLOAD_DIR}/{file_id}_{cover_filename}"
-        
-        # Save cover image
-        await save_upload_file(cover, cover_location, max_size=MAX_IMAGE_SIZE)
+        cover_location = cover.path
+        out_path = embedded_path(cover)
+        out_filename = os.path.basename(out_path)
             
         # Determine payload
-        payload_bytes = b""
         if payload_file:
-            payload_bytes = await payload_file.read()
+            payload_size = payload_file.size
+            if payload_file.prefixed:
+                success, msg = True, "Data embedded successfully"
+            else:
+                # Payload arrived before the cover (or is a resumable
+                # upload): append it now, chunked
+                from utils import embed_file_data
+                success, msg = embed_file_data(cover_location, payload_file.path, out_path)
+                if "payload_file" in form.files:
+                    os.remove(payload_file.path)
         elif payload_text:
             payload_bytes = payload_text.encode('utf-8')
+            payload_size = len(payload_bytes)
+            from utils import embed_data
+            success, msg = embed_data(cover_location, payload_bytes, out_path)
         else:
+            form.cleanup()
             return {"status": "error", "message": "No payload provided (file or text)"}
-            
-        # Generate output filename
-        name, ext = os.path.splitext(cover_filename)
-        out_filename = f"embedded_{file_id}_{name}{ext}"
-        out_path = f"{UPLOAD_DIR}/{out_filename}"
-        
-        # Embed
-        # Embed
-        from utils import embed_data
-        success, msg = embed_data(cover_location, payload_bytes, out_path)
         
         if success:
             return {
                 "status": "success",
-                "message": f"Data embedded. Size increased by {len(payload_bytes)} bytes.",
+                "message": f"Data embedded. Size increased by {payload_size} bytes.",
                 "download_url": f"uploads/{out_filename}",
                 "filename": out_filename
             }
@@ -241,43 +321,78 @@ async def embed_file(
 
 @app.post("/extract")
 @limiter.limit("20/minute")
-async def extract_file(
-    request: Request,
-    file: UploadFile = File(...)
-):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
-    
+async def extract_file(request: Request):
+    file_id = str(uuid.uuid4())
+    spec = image_field(file_id, required=False)
+    form = await stream_upload(request, {"file": spec}, text_fields=("upload_id",))
+    file_location = (await form_file(form, "file", spec, link=False)).path
+
     try:
-        file_id = str(uuid.uuid4())
-        original_filename = file.filename
-        file_location = f"{UPLOAD_DIR}/{file_id}_{original_filename}"
-        
-        await save_upload_file(file, file_location, max_size=MAX_IMAGE_SIZE)
-        
-        from utils import extract_overlay
-        overlay_data = extract_overlay(file_location)
-        
-        if overlay_data:
-            # Result is bytes (extracted content)
-            # Save to a file to allow download
-            out_filename = f"extracted_{file_id}.bin" # Generic bin
-            
-            out_path = f"{UPLOAD_DIR}/{out_filename}"
-            with open(out_path, 'wb') as f:
-                f.write(overlay_data)
-                
+
+        # Split the appended data into typed segments (zip, png, gzip, ...)
+        # in one pass; each one is saved and served on its own
+        from carve import scan_file, copy_range, write_segments
+        overlay_offset, segments = scan_file(file_location)
+
+        if segments:
+            overlay_size = os.path.getsize(file_location) - overlay_offset
+            # The whole tail too, as before (generic bin)
+            out_filename = f"extracted_{file_id}.bin"
+            copy_range(file_location, overlay_offset, overlay_size, f"{UPLOAD_DIR}/{out_filename}")
+            write_segments(file_location, segments, UPLOAD_DIR, f"extracted_{file_id}")
+            for seg in segments:
+                seg["download_url"] = f"uploads/{seg['filename']}"
+
             return {
                 "status": "success",
-                "message": "Data extracted successfully.",
+                "message": f"Data extracted successfully. Found {len(segments)} segment(s): {', '.join(seg['type'] for seg in segments)}.",
                 "download_url": f"uploads/{out_filename}",
-                "filename": out_filename
+                "filename": out_filename,
+                "overlay_offset": overlay_offset,
+                "overlay_size": overlay_size,
+                "segments": segments
             }
         else:
-            return {"status": "error", "message": f"Extraction failed: {result}"}
+            return {"status": "error", "message": "Extraction failed: no data found after the end of the image."}
             
     except Exception as e:
         return {"status": "error", "message": f"Server Error: {str(e)}"}
 
+# --- RESUMABLE UPLOADS ---
+# init -> POST raw chunks at the current offset -> commit. The upload_id
+# then replaces the file in /upload, /encrypt, /decrypt, /patch-height,
+# /extract, /embed (cover_upload_id / payload_upload_id) and the advanced
+# endpoints, as often as needed.
+
+@app.post("/upload/init")
+@limiter.limit("30/minute")
+async def upload_init(request: Request, filename: str = Form(...), size: int = Form(...), sha256: str = Form(None)):
+    from resumable import init_upload, public_state, MAX_CHUNK_SIZE
+    state = init_upload(UPLOAD_DIR, filename, size, sha256)
+    return {"status": "success", **public_state(state), "chunk_size": MAX_CHUNK_SIZE}
+
+@app.post("/upload/{upload_id}/chunk")
+@limiter.limit("600/minute")
+async def upload_chunk(request: Request, upload_id: str, offset: int, sha256: str = None):
+    # Body = raw chunk bytes; sha256 (hex) of the chunk is checked if given
+    from resumable import append_chunk, public_state
+    state = await append_chunk(UPLOAD_DIR, upload_id, request, offset, sha256)
+    return {"status": "success", **public_state(state)}
+
+@app.get("/upload/{upload_id}")
+async def upload_status(upload_id: str):
+    # Where to resume from after a dropped connection
+    from resumable import load_state, public_state
+    return {"status": "success", **public_state(load_state(UPLOAD_DIR, upload_id))}
+
+@app.post("/upload/{upload_id}/commit")
+@limiter.limit("30/minute")
+async def upload_commit(request: Request, upload_id: str, sha256: str = Form(None)):
+    from resumable import commit_upload, public_state
+    # Hashing up to 1GB: off the event loop
+    state = await asyncio.to_thread(commit_upload, UPLOAD_DIR, upload_id, sha256)
+    return {"status": "success", **public_state(state)}
+
 @app.get("/result/{task_id}")
 async def get_result(task_id: str):
     task_result = AsyncResult(task_id, app=celery_app)
@@ -285,8 +400,60 @@ async def get_result(task_id: str):
         return {"status": "completed", "result": task_result.result}
     return {"status": "processing"}
 
-
-from fastapi.responses import FileResponse, RedirectResponse
+@app.get("/search")
+def search_analyses(q: str = None, sha256: str = None, format: str = None, limit: int = 20, offset: int = 0):
+    # Past analyses by text (findings, strings, metadata, file names) and/or
+    # by the SHA-256 of the image or of anything extracted from it.
+    # Plain def: SQLite runs in the threadpool, off the event loop.
+    if not q and not sha256 and not format:
+        raise HTTPException(status_code=400, detail="Give q, sha256 or format")
+    from search_index import search
+    start = time.perf_counter()
+    try:
+        found = search(q, sha256.lower() if sha256 else None, format, min(max(limit, 1), 100), max(offset, 0))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", **found, "query_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+@app.get("/similar/{task_id}")
+def similar_images(task_id: str, max_distance: int = 8, limit: int = 20):
+    # Near-duplicates (re-encoded, resized, height-patched, restored copies)
+    # among earlier analyses, by perceptual hash. Hashes come from the task
+    # result, or from the index once the result has expired.
+    from search_index import similar, hashes_for_task, MAX_DISTANCE
+    task_result = AsyncResult(task_id, app=celery_app)
+    hashes = None
+    if task_result.ready() and isinstance(task_result.result, dict):
+        hashes = task_result.result.get("perceptual_hashes")
+    hashes = hashes or hashes_for_task(task_id)
+    if not hashes:
+        # 410, not 404: the global 404 handler redirects
+        raise HTTPException(status_code=410, detail="No perceptual hashes for this task (still running, failed or expired)")
+    start = time.perf_counter()
+    items = similar(hashes, min(max(max_distance, 0), MAX_DISTANCE), min(max(limit, 1), 100), exclude_task=task_id)
+    return {"status": "success", "hashes": hashes, "items": items,
+            "query_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+@app.get("/strings/{result_dir}")
+async def get_strings(result_dir: str, offset: int = 0, limit: int = 100, sort: str = "score",
+                      min_score: int = 0, encoding: str = None, q: str = None):
+    # Pages through the strings saved by the analysis (result["result_dir"])
+    if "/" in result_dir or ".." in result_dir or not result_dir.startswith("results_"):
+        raise HTTPException(status_code=400, detail="Invalid result directory")
+    if sort not in ("score", "offset"):
+        raise HTTPException(status_code=400, detail="sort must be 'score' or 'offset'")
+    import json
+    from strings_scan import page_strings, STRINGS_FILE
+    path = os.path.join(UPLOAD_DIR, result_dir, STRINGS_FILE)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No strings for this analysis")
+    with open(path) as f:
+        found = json.load(f)
+    page = page_strings(found["strings"], max(offset, 0), min(max(limit, 1), 1000), sort, min_score, encoding, q)
+    return {"status": "success", "found": found["total"], "truncated": found["truncated"], **page}
+
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse, PlainTextResponse
+from artifacts import resolve_lazy_archive, iter_zip_stream
 
 @app.get("/download/{file_path:path}")
 async def download_file(file_path: str):
@@ -296,11 +463,27 @@ async def download_file(file_path: str):
     
     full_path = os.path.join(UPLOAD_DIR, file_path)
     if not os.path.exists(full_path):
+        # Archives registered by the worker are generated on the fly
+        entries = resolve_lazy_archive(UPLOAD_DIR, file_path)
+        if entries is None:
             raise HTTPException(status_code=404, detail="File not found")
+        archive_name = os.path.basename(file_path)
+        return StreamingResponse(
+            iter_zip_stream(entries),
+            media_type='application/zip',
+            headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+        )
     
     # Force download with attachment
     return FileResponse(full_path, media_type='application/octet-stream', filename=os.path.basename(file_path))
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text format: API request metrics + tool metrics pushed by workers
+    await flush_to_redis_async()
+    redis_samples = await load_redis_samples_async()
+    return PlainTextResponse(render_prometheus(redis_samples=redis_samples), media_type="text/plain; version=0.0.4")
+
 # Root Redirect
 @app.get("/")
 def read_root():
@@ -308,47 +491,53 @@ def read_root():
 
 
 # --- ADVANCED STEGANOGRAPHY ENDPOINTS ---
-from advanced_steg import custom_inject, solve_custom_steg, DEFAULT_INTERVAL, DEFAULT_START_OFFSET
+from advanced_steg import custom_inject, solve_custom_steg, plan_custom_inject, pixel_inject, solve_pixel_steg, DEFAULT_INTERVAL, DEFAULT_START_OFFSET, FORMAT_V1, FORMAT_V2, RANDOM_OFFSET_RANGE, RANDOM_INTERVAL_RANGE
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+async def read_image(file: UploadFile, upload_id: str):
+    """-> (filename, bytes) of the uploaded image or of a committed resumable upload."""
+    if upload_id:
+        from resumable import use_upload
+        # Lock, checks and a read of up to MAX_IMAGE_SIZE: in a thread, like form_file
+        stored = await asyncio.to_thread(use_upload, UPLOAD_DIR, upload_id, FileField(MAX_IMAGE_SIZE, ALLOWED_IMAGE_TYPES))
+        return stored.filename, await asyncio.to_thread(_read_bytes, stored.path)
+    if file is None:
+        raise HTTPException(status_code=400, detail="Missing file (or upload_id)")
+    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
+    data = await file.read()
+    if len(data) > MAX_IMAGE_SIZE:
+        raise HTTPException(status_code=413, detail=f"File too large. Max allowed: {MAX_IMAGE_SIZE/1024/1024} MB")
+    return file.filename, data
+
+def check_keys(offset, interval):
+    if (offset is not None and offset < 0) or (interval is not None and interval < 0):
+        raise HTTPException(status_code=400, detail="Offset and interval must be 0 or more")
 
 @app.post("/steg/advanced/hide")
 @limiter.limit("10/minute")
 async def advanced_hide(
     request: Request,
-    file: UploadFile = File(...),
+    file: UploadFile = File(None),
+    upload_id: str = Form(None),
     message: str = Form(...),
     start_offset: int = Form(None),
-    interval: int = Form(None)
+    interval: int = Form(None),
+    version: int = Form(FORMAT_V2),
+    mode: str = Form("tail")
 ):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
+    if version not in (FORMAT_V1, FORMAT_V2):
+        raise HTTPException(status_code=400, detail="Invalid format version. Allowed: 1, 2")
+    # tail: noise appended after the image, pixel: LSBs of the pixel data (v2, PNG output)
+    if mode not in ("tail", "pixel"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Allowed: tail, pixel")
+    check_keys(start_offset, interval)
+    original_filename, original_data = await read_image(file, upload_id)
     try:
         file_id = str(uuid.uuid4())
-        original_filename = file.filename
-        file_location = f"{UPLOAD_DIR}/{file_id}_{original_filename}"
-        
-        # Read original data (Manually due to need for bytes later for helper?) 
-        # Actually our helper uses file path, but this endpoint reads bytes directly at line 187 (original code)
-        # Let's see... line 241 original says `original_data = await file.read()`.
-        # We should use save_upload_file then read back if we want to enforce size strictly via stream,
-        # OR just read with size check.
-        # Since we need to save anyway or process bytes? 
-        # The original code:
-        # file_location = ...
-        # original_data = await file.read() 
-        # ... logic ...
-        # The file is NOT saved to disk in original code? 
-        # Wait, line 214 writes `final_data` to `out_location`. 
-        # It seems `file_location` variable was unused in original code for reading!
-        # Ah, looking at original code:
-        # file_location = f"{UPLOAD_DIR}/{file_id}_{original_filename}"
-        # original_data = await file.read()
-        # It never saved the input file to disk!
-        # So for size limit, we should just read with limit.
         
-        # Custom Size Limit Read
-        original_data = await file.read()
-        if len(original_data) > MAX_IMAGE_SIZE:
-             raise HTTPException(status_code=413, detail=f"File too large. Max allowed: {MAX_IMAGE_SIZE/1024/1024} MB")
-
         # Determine Keys (Manual or Random)
         import random
         
@@ -359,17 +548,25 @@ async def advanced_hide(
             is_random = False
         else:
             # Generate Random Keys
-            offset = random.randint(500, 3000)
-            interval_val = random.randint(10, 100)
+            offset = random.randint(*RANDOM_OFFSET_RANGE)
+            interval_val = random.randint(*RANDOM_INTERVAL_RANGE)
             is_random = True
             
         # Process Injection
-        # Note: custom_inject returns binary data (bytes)
-        final_data = custom_inject(original_data, message, offset, interval_val)
+        # Note: both modes return binary data (bytes)
+        name, ext = os.path.splitext(original_filename)
+        if mode == "pixel":
+            try:
+                final_data = pixel_inject(original_data, message, offset, interval_val)
+            except ValueError as e:
+                return {"status": "error", "message": f"Hiding failed: {str(e)}"}
+            version = FORMAT_V2
+            ext = ".png"
+        else:
+            final_data = custom_inject(original_data, message, offset, interval_val, version=version)
         
         # Save Modified File
         # We'll save it with a modified name
-        name, ext = os.path.splitext(original_filename)
         out_filename = f"advanced_steg_{file_id}{ext}"
         out_location = f"{UPLOAD_DIR}/{out_filename}"
         
@@ -383,28 +580,62 @@ async def advanced_hide(
                 "filename": out_filename,
                 "key_offset": offset,
                 "key_interval": interval_val,
-                "is_random": is_random
+                "is_random": is_random,
+                "format_version": version,
+                "mode": mode
             }
     except Exception as e:
         return {"status": "error", "message": f"Hiding failed: {str(e)}"}
 
+@app.post("/steg/advanced/plan")
+@limiter.limit("60/minute")
+async def advanced_plan(
+    request: Request,
+    message: str = Form(...),
+    start_offset: int = Form(DEFAULT_START_OFFSET),
+    interval: int = Form(DEFAULT_INTERVAL),
+    version: int = Form(FORMAT_V2),
+    cover_size: int = Form(None),
+    cover_width: int = Form(None),
+    cover_height: int = Form(None),
+    cover_channels: int = Form(3)
+):
+    # Size planner: how big the output will be, before uploading a cover
+    if version not in (FORMAT_V1, FORMAT_V2):
+        raise HTTPException(status_code=400, detail="Invalid format version. Allowed: 1, 2")
+    check_keys(start_offset, interval)
+    cover_samples = None
+    if cover_width and cover_height:
+        cover_samples = cover_width * cover_height * cover_channels
+    plan = plan_custom_inject(message, start_offset, interval, version=version,
+                              cover_size=cover_size, cover_samples=cover_samples)
+    return {"status": "success", **plan}
+
 @app.post("/steg/advanced/recover")
 @limiter.limit("20/minute")
 async def advanced_recover(
     request: Request,
-    file: UploadFile = File(...),
+    file: UploadFile = File(None),
+    upload_id: str = Form(None),
     offset: int = Form(DEFAULT_START_OFFSET),
-    interval: int = Form(DEFAULT_INTERVAL)
+    interval: int = Form(DEFAULT_INTERVAL),
+    mode: str = Form("auto")
 ):
-    await validate_file(file, max_size=MAX_IMAGE_SIZE, allowed_mimes=ALLOWED_IMAGE_TYPES)
+    if mode not in ("auto", "tail", "pixel"):
+        raise HTTPException(status_code=400, detail="Invalid mode. Allowed: auto, tail, pixel")
+    check_keys(offset, interval)
+    _, data = await read_image(file, upload_id)
     try:
-        # Read file data directly
-        data = await file.read()
-        if len(data) > MAX_IMAGE_SIZE:
-             raise HTTPException(status_code=413, detail=f"File too large. Max allowed: {MAX_IMAGE_SIZE/1024/1024} MB")
-        
         # Solve/Recover
-        recovered_message = solve_custom_steg(data, offset, interval)
+        # auto: trailing data first (cheap), then pixel LSBs
+        if mode == "pixel":
+            recovered_message = solve_pixel_steg(data, offset, interval)
+        else:
+            recovered_message = solve_custom_steg(data, offset, interval)
+            if mode == "auto" and recovered_message.startswith("Error:"):
+                pixel_message = solve_pixel_steg(data, offset, interval)
+                if not pixel_message.startswith("Error:"):
+                    recovered_message = pixel_message
         
         if recovered_message.startswith("Error:"):
              return {"status": "error", "message": recovered_message}
@@ -0,0 +1,202 @@
+import os
+import threading
+from collections import defaultdict
+
+# Lightweight Prometheus-style metrics.
+# Each process keeps its own registry of counters/histograms. The worker
+# pushes its registry to Redis after every task (one pipelined round trip),
+# API workers push theirs periodically, and /metrics renders its own
+# registry merged with whatever everyone else has pushed.
+
+REDIS_METRICS_KEY = "stegsik:metrics"
+
+# Seconds: covers quick tools (exiftool) up to long stegseek runs
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Bytes: 4MB .. 2GB
+MEMORY_BUCKETS = tuple(2 ** p for p in range(22, 32))
+
+FAMILIES = {
+    "stegsik_tool_runs_total": ("counter", "Forensic tool invocations."),
+    "stegsik_tool_timeouts_total": ("counter", "Forensic tool invocations killed by timeout."),
+    "stegsik_tool_errors_total": ("counter", "Forensic tool invocations that failed to start or crashed."),
+    "stegsik_tool_output_bytes_total": ("counter", "Bytes of stdout+stderr captured from tools."),
+    "stegsik_tool_wall_seconds": ("histogram", "Wall time per tool invocation or in-process stage."),
+    "stegsik_tool_cpu_seconds": ("histogram", "User+system CPU time per tool invocation or in-process stage."),
+    "stegsik_tool_peak_rss_bytes": ("histogram", "Peak resident set size of the tool process."),
+    "stegsik_task_queue_wait_seconds": ("histogram", "Time between enqueue and task start."),
+    "stegsik_task_wall_seconds": ("histogram", "Total wall time per Celery task."),
+    "stegsik_index_seconds": ("histogram", "Time to build and queue (or write) a search index entry."),
+    "stegsik_http_requests_total": ("counter", "HTTP requests handled by the API."),
+    "stegsik_http_request_seconds": ("histogram", "HTTP request latency."),
+}
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for k, v in sorted(labels.items()):
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+def _format_le(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of samples keyed by their exposition name,
+    e.g. 'stegsik_tool_runs_total{tool="zsteg"}'. Histograms are stored as
+    their _bucket/_sum/_count samples, so everything is a plain counter and
+    can be summed across processes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(float)
+
+    def inc(self, name, labels=None, value=1.0):
+        key = name + _format_labels(labels)
+        with self._lock:
+            self._samples[key] += value
+
+    def observe(self, name, value, labels=None, buckets=DURATION_BUCKETS):
+        labels = labels or {}
+        with self._lock:
+            for bound in tuple(buckets) + (float("inf"),):
+                # Buckets are cumulative; empty ones are still emitted as 0
+                key = f"{name}_bucket" + _format_labels({**labels, "le": _format_le(bound)})
+                self._samples[key] += 1 if value <= bound else 0
+            self._samples[f"{name}_sum" + _format_labels(labels)] += value
+            self._samples[f"{name}_count" + _format_labels(labels)] += 1
+
+    def merge(self, samples):
+        with self._lock:
+            for key, value in samples.items():
+                self._samples[key] += value
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            samples = dict(self._samples)
+            if reset:
+                self._samples.clear()
+        return samples
+
+registry = MetricsRegistry()
+
+_redis_client = None
+
+def _get_redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+        _redis_client = redis.Redis.from_url(redis_url, socket_timeout=2, socket_connect_timeout=2)
+    return _redis_client
+
+def flush_to_redis():
+    """
+    Pushes this process' samples to the shared Redis hash and resets them.
+    Metrics must never break a task, so Redis errors are swallowed and the
+    samples are kept for the next flush.
+    """
+    samples = registry.snapshot(reset=True)
+    if not samples:
+        return
+    try:
+        pipe = _get_redis().pipeline(transaction=False)
+        for key, value in samples.items():
+            pipe.hincrbyfloat(REDIS_METRICS_KEY, key, value)
+        pipe.execute()
+    except Exception:
+        registry.merge(samples)
+
+def _load_redis_samples():
+    try:
+        raw = _get_redis().hgetall(REDIS_METRICS_KEY)
+    except Exception:
+        return {}
+    return {k.decode(): float(v) for k, v in raw.items()}
+
+async def flush_to_redis_async():
+    """
+    Same as flush_to_redis, for the API: uses the pooled asyncio client so
+    the event loop is never blocked on Redis.
+    """
+    from async_redis import get_async_redis
+    samples = registry.snapshot(reset=True)
+    if not samples:
+        return
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        for key, value in samples.items():
+            pipe.hincrbyfloat(REDIS_METRICS_KEY, key, value)
+        await pipe.execute()
+    except Exception:
+        registry.merge(samples)
+
+async def load_redis_samples_async():
+    from async_redis import get_async_redis
+    try:
+        raw = await get_async_redis().hgetall(REDIS_METRICS_KEY)
+    except Exception:
+        return {}
+    return {k.decode(): float(v) for k, v in raw.items()}
+
+def _family_of(sample_key):
+    name = sample_key.split("{", 1)[0]
+    if name in FAMILIES:
+        return name
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+def render_prometheus(include_redis=True, redis_samples=None):
+    """
+    Renders local samples (plus samples pushed to Redis by other processes)
+    in the Prometheus text exposition format. Async callers load the Redis
+    samples themselves and pass them in as `redis_samples`.
+    """
+    samples = defaultdict(float)
+    for key, value in registry.snapshot().items():
+        samples[key] += value
+    if redis_samples is None and include_redis:
+        redis_samples = _load_redis_samples()
+    if redis_samples:
+        for key, value in redis_samples.items():
+            samples[key] += value
+
+    by_family = defaultdict(list)
+    for key in sorted(samples):
+        by_family[_family_of(key)].append(key)
+
+    lines = []
+    for family in sorted(by_family):
+        kind, help_text = FAMILIES.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for key in by_family[family]:
+            value = samples[key]
+            lines.append(f"{key} {int(value) if value.is_integer() else value}")
+    return "\n".join(lines) + "\n"
+
+def record_tool_run(tool, stats):
+    """
+    Records one tool invocation. `stats` is the dict produced by
+    worker.run_command.
+    """
+    labels = {"tool": tool}
+    registry.inc("stegsik_tool_runs_total", labels)
+    if stats.get("timed_out"):
+        registry.inc("stegsik_tool_timeouts_total", labels)
+    if stats.get("error"):
+        registry.inc("stegsik_tool_errors_total", labels)
+    registry.inc("stegsik_tool_output_bytes_total", labels, stats.get("output_bytes", 0))
+    registry.observe("stegsik_tool_wall_seconds", stats["wall_seconds"], labels)
+    if stats.get("cpu_seconds") is not None:
+        registry.observe("stegsik_tool_cpu_seconds", stats["cpu_seconds"], labels)
+    if stats.get("peak_rss_bytes"):
+        registry.observe("stegsik_tool_peak_rss_bytes", stats["peak_rss_bytes"], labels, buckets=MEMORY_BUCKETS)
+
+def record_request(endpoint, method, status_code, seconds):
+    registry.inc("stegsik_http_requests_total", {"endpoint": endpoint, "method": method, "status": status_code})
+    registry.observe("stegsik_http_request_seconds", seconds, {"endpoint": endpoint, "method": method})
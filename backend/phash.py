@@ -0,0 +1,67 @@
+import math
+import numpy as np
+
+# Perceptual hashes (64 bits each) of the pixel array the analysis already
+# decoded. One vectorized area-average pass brings the image down to a
+# 288x288 grid (288 = 32 * 9 = 8 * 36 = 9 * 32); every hash is then a
+# reshape-mean of that grid:
+#   aHash: 8x8 means above the mean
+#   dHash: 8x9 means, each one brighter than its right neighbour
+#   pHash: 32x32 -> 2D DCT, the 8x8 lowest frequencies above their median
+#   tHash: pHash of the top band (full width, half as tall as wide). Height
+#     patching only cuts or extends the bottom, so the band stays the same.
+# Re-saved, re-encoded or scrambled-then-restored copies keep (almost) the
+# same hashes even though their SHA-256 differs.
+
+GRID = 288
+HASH_SIZE = 8
+
+_u = np.arange(32)[:, None]
+_x = np.arange(32)[None, :]
+DCT32 = (np.where(_u == 0, math.sqrt(1 / 32), math.sqrt(2 / 32)) * np.cos((2 * _x + 1) * _u * np.pi / 64)).astype(np.float32)
+
+def _gray(arr):
+    if arr.ndim == 2:
+        return arr.astype(np.float32)
+    # ITU-R 601 luma, like PIL's "L"
+    rgb = arr[..., :3].astype(np.float32)
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def _area_resize(gray, size):
+    """Area-average downscale to size x size (tiny images are repeated up first)."""
+    h, w = gray.shape
+    if h < size:
+        gray = np.repeat(gray, -(-size // h), axis=0)
+    if w < size:
+        gray = np.repeat(gray, -(-size // w), axis=1)
+    h, w = gray.shape
+    rows = np.linspace(0, h, size + 1).astype(np.int64)
+    cols = np.linspace(0, w, size + 1).astype(np.int64)
+    sums = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=0), cols[:-1], axis=1)
+    return sums / (np.diff(rows)[:, None] * np.diff(cols)[None, :])
+
+def _block_mean(grid, rows, cols):
+    return grid.reshape(rows, grid.shape[0] // rows, cols, grid.shape[1] // cols).mean(axis=(1, 3))
+
+def _pack(bits):
+    return int("".join("1" if b else "0" for b in bits.ravel()), 2)
+
+def _phash(grid):
+    coeffs = DCT32 @ _block_mean(grid, 32, 32).astype(np.float32) @ DCT32.T
+    low = coeffs[:HASH_SIZE, :HASH_SIZE]
+    return low > np.median(low)
+
+def image_hashes(arr):
+    """{"ahash", "dhash", "phash", "thash"} as 16-digit hex strings."""
+    gray = _gray(arr)
+    grid = _area_resize(gray, GRID)
+    small = _block_mean(grid, HASH_SIZE, HASH_SIZE)
+    ahash = small > small.mean()
+    wide = _block_mean(grid, HASH_SIZE, HASH_SIZE + 1)
+    dhash = wide[:, :-1] > wide[:, 1:]
+    band = gray[:max(1, gray.shape[1] // 2)]
+    hashes = (("ahash", ahash), ("dhash", dhash), ("phash", _phash(grid)), ("thash", _phash(_area_resize(band, GRID))))
+    return {name: f"{_pack(bits):016x}" for name, bits in hashes}
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
@@ -0,0 +1,28 @@
+# Analysis profiles: which stages run for each profile. Kept free of heavy
+# imports so the API can validate profile names without loading the worker.
+# "auto" picks quick for very large images and standard otherwise. Brute
+# force and carving are deep only.
+QUICK_STAGES = ["structure", "exiftool", "lsb_score", "dct", "phash"]
+STANDARD_STAGES = QUICK_STAGES + ["bit_planes", "zsteg", "outguess", "strings", "binwalk_scan"]
+DEEP_STAGES = QUICK_STAGES + ["bit_planes", "zsteg", "outguess", "strings", "binwalk", "foremost", "stegseek"]
+PROFILES = {
+    "quick": QUICK_STAGES,
+    "standard": STANDARD_STAGES,
+    "deep": DEEP_STAGES,
+}
+AUTO_QUICK_PIXELS = 25_000_000
+
+# Stages that only make sense for some formats (PIL format names)
+STAGE_FORMATS = {
+    "zsteg": {"PNG", "BMP"},
+    "outguess": {"JPEG"},
+    "dct": {"JPEG"},
+    "stegseek": {"JPEG", "BMP"},  # steghide cover formats (plus audio)
+}
+
+def resolve_profile(profile, width, height):
+    if profile in PROFILES:
+        return profile
+    if width and height and width * height > AUTO_QUICK_PIXELS:
+        return "quick"
+    return "standard"
@@ -0,0 +1,161 @@
+import os
+import math
+import logging
+import functools
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from async_redis import get_async_redis
+
+# Redis-backed rate limiting shared by every uvicorn worker and replica.
+# Counters are sliding windows (current + weighted previous fixed window),
+# checked and incremented atomically in one Lua script round trip.
+
+logger = logging.getLogger("stegsik.rate_limit")
+
+KEY_PREFIX = "stegsik:rl"
+MB = 1024 * 1024
+
+# Global per-client budget, consumed by every request according to its cost.
+GLOBAL_BUDGET = os.getenv("RATE_LIMIT_BUDGET", "600/minute")
+
+# Base cost per endpoint (path prefix). Uploads also pay per MB of body,
+# so a 50MB /encrypt costs far more than a /result poll. One request never
+# costs more than the budget itself.
+ENDPOINT_COSTS = {
+    "/upload": 10,
+    "/encrypt": 5,
+    "/decrypt": 5,
+    "/embed": 5,
+    "/extract": 3,
+    "/patch-height": 2,
+    "/steg/advanced/hide": 3,
+    "/steg/advanced/recover": 3,
+    "/steg/advanced/plan": 1,
+    "/result/": 1,
+    "/download/": 1,
+    "/uploads/": 1,
+}
+COST_PER_MB = 1
+# Not counted (monitoring)
+EXEMPT_PATHS = {"/metrics"}
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# KEYS[1] = counter prefix
+# ARGV = window_ms, limit, cost
+# Returns {allowed (0/1), used, retry_after_ms}
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local cur_start = now - (now % window)
+local cur_key = KEYS[1] .. ':' .. cur_start
+local prev_key = KEYS[1] .. ':' .. (cur_start - window)
+local cur = tonumber(redis.call('GET', cur_key) or '0')
+local prev = tonumber(redis.call('GET', prev_key) or '0')
+local elapsed = now - cur_start
+local used = prev * (window - elapsed) / window + cur
+if used + cost > limit then
+    local retry = window - elapsed
+    if prev > 0 and cur + cost <= limit then
+        -- Time until the previous window's weight has decayed enough
+        retry = math.ceil((used + cost - limit) * window / prev)
+    end
+    return {0, math.ceil(used), retry}
+end
+redis.call('INCRBY', cur_key, cost)
+redis.call('PEXPIRE', cur_key, window * 2)
+return {1, math.ceil(used + cost), 0}
+"""
+
+def parse_rate(rate):
+    """'20/minute' -> (20, 60000 ms)"""
+    count, _, period = rate.partition("/")
+    return int(count), _PERIODS[period.strip().rstrip("s")] * 1000
+
+def client_key(request: Request):
+    return request.client.host if request.client else "unknown"
+
+def request_cost(request: Request):
+    path = request.url.path
+    # CORS preflights are answered by the CORS middleware; don't charge them
+    if path in EXEMPT_PATHS or request.method == "OPTIONS":
+        return 0
+    cost = 1
+    for prefix, base in ENDPOINT_COSTS.items():
+        if path == prefix or (prefix.endswith("/") and path.startswith(prefix)):
+            cost = base
+            break
+    # Content-Length is known before the body is read, so oversized bursts are rejected early
+    try:
+        size = int(request.headers.get("content-length", 0))
+    except ValueError:
+        size = 0
+    return cost + math.ceil(size / MB) * COST_PER_MB
+
+class RateLimiter:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._script = None
+
+    async def hit(self, key, limit, window_ms, cost=1):
+        """
+        Consumes `cost` from the sliding window `key`. Returns
+        (allowed, used, retry_after_seconds). Fails open if Redis is down:
+        an outage of the limiter must not take the API down with it.
+        """
+        try:
+            client = get_async_redis()
+            if self._script is None:
+                self._script = client.register_script(SLIDING_WINDOW_LUA)
+            allowed, used, retry_ms = await self._script(keys=[f"{KEY_PREFIX}:{key}"], args=[window_ms, limit, cost], client=client)
+        except Exception as e:
+            logger.warning("Rate limiter unavailable, allowing request: %s", e)
+            return True, 0, 0
+        return bool(allowed), int(used), max(1, math.ceil(int(retry_ms) / 1000)) if not allowed else 0
+
+    def limit(self, rate, cost=1):
+        """
+        Per-endpoint limit decorator, e.g. @limiter.limit("20/minute").
+        The endpoint must take a `request: Request` argument.
+        """
+        limit, window_ms = parse_rate(rate)
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if self.enabled and request is not None:
+                    key = f"ep:{func.__name__}:{client_key(request)}"
+                    allowed, _, retry_after = await self.hit(key, limit, window_ms, cost)
+                    if not allowed:
+                        raise HTTPException(
+                            status_code=429,
+                            detail=f"Rate limit exceeded: {rate}",
+                            headers={"Retry-After": str(retry_after)},
+                        )
+                return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    async def budget_middleware(self, request: Request, call_next):
+        """
+        Charges every request against the client's global weighted budget.
+        """
+        cost = request_cost(request)
+        if self.enabled and cost:
+            limit, window_ms = parse_rate(GLOBAL_BUDGET)
+            # A body bigger than the whole budget (1GB /embed payload) would
+            # never fit in any window; it costs the full budget instead, so
+            # it gets through once the client's window is empty
+            cost = min(cost, limit)
+            allowed, used, retry_after = await self.hit(f"budget:{client_key(request)}", limit, window_ms, cost)
+            if not allowed:
+                return JSONResponse(
+                    status_code=429,
+                    content={"detail": f"Rate limit exceeded: request cost {cost}, budget {GLOBAL_BUDGET}"},
+                    headers={"Retry-After": str(retry_after)},
+                )
+        return await call_next(request)
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+import shutil
+import fcntl
+import hashlib
+import uuid
+import magic  # python-magic-bin
+from fastapi import HTTPException, Request
+
+# Resumable uploads: init -> append chunks -> commit.
+# A chunk is the raw request body, written at its offset in a staging file
+# ({id}.part) and checked against the SHA-256 the client sent with it. The
+# offset only moves forward once a chunk is complete and verified, so a
+# dropped connection costs that one chunk: ask for the status, resend from
+# `offset`. Commit checks the whole file's hash, sniffs its type and moves
+# it to {id}_{filename}, where the other endpoints pick it up by upload_id
+# (as many times as needed, no re-upload).
+# Everything lives in UPLOAD_DIR, so staging files, committed uploads and
+# their state expire with the other artifacts (artifacts.cleanup_expired).
+
+MB = 1024 * 1024
+MAX_UPLOAD_SIZE = 1024 * MB  # the largest any endpoint accepts (/embed payload)
+MAX_CHUNK_SIZE = int(float(os.getenv("UPLOAD_CHUNK_MAX_MB", "16")) * MB)
+HASH_CHUNK = MB
+SNIFF_BYTES = 2048
+STATE_SUFFIX = ".upload.json"
+PART_SUFFIX = ".part"
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+def _paths(upload_dir, upload_id):
+    if not _ID_RE.match(upload_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid upload_id")
+    base = os.path.join(upload_dir, upload_id)
+    return base + STATE_SUFFIX, base + PART_SUFFIX
+
+def _check_sha256(value, what):
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if not _SHA256_RE.match(value):
+        raise HTTPException(status_code=400, detail=f"Invalid {what}: expected a hex SHA-256")
+    return value
+
+def load_state(upload_dir, upload_id):
+    state_path, _ = _paths(upload_dir, upload_id)
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # 410, not 404: the global 404 handler redirects
+        raise HTTPException(status_code=410, detail="Unknown or expired upload")
+
+def _save_state(upload_dir, state):
+    state_path, _ = _paths(upload_dir, state["upload_id"])
+    tmp = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+def public_state(state):
+    keys = ("upload_id", "filename", "size", "offset", "committed", "sha256", "mime")
+    return {k: state.get(k) for k in keys}
+
+def init_upload(upload_dir, filename, size, sha256=None):
+    if size < 1 or size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=f"Invalid size. Max allowed: {MAX_UPLOAD_SIZE/1024/1024} MB")
+    upload_id = uuid.uuid4().hex
+    _, part_path = _paths(upload_dir, upload_id)
+    open(part_path, "wb").close()
+    state = {
+        "upload_id": upload_id,
+        "filename": os.path.basename((filename or "").replace("\\", "/")) or "upload",
+        "size": size,
+        "offset": 0,
+        "expected_sha256": _check_sha256(sha256, "sha256"),
+        "committed": False,
+        "created": time.time(),
+    }
+    _save_state(upload_dir, state)
+    return state
+
+async def append_chunk(upload_dir, upload_id, request: Request, offset, sha256=None):
+    """
+    Streams the request body into the staging file at `offset`, which
+    must be the current offset. The chunk counts only if it arrives whole
+    (and matches `sha256` if given); otherwise it is cut off again.
+    """
+    sha256 = _check_sha256(sha256, "chunk sha256")
+    state = load_state(upload_dir, upload_id)
+    if state["committed"]:
+        raise HTTPException(status_code=409, detail="Upload already committed")
+    if offset != state["offset"]:
+        raise HTTPException(status_code=409, detail=f"Offset mismatch: upload is at {state['offset']}",
+                            headers={"Upload-Offset": str(state["offset"])})
+    remaining = state["size"] - offset
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        declared = 0
+    if declared > min(MAX_CHUNK_SIZE, remaining):
+        raise HTTPException(status_code=413, detail=f"Chunk too large. Max: {min(MAX_CHUNK_SIZE, remaining)} bytes")
+
+    _, part_path = _paths(upload_dir, upload_id)
+    with open(part_path, "r+b") as f:
+        # One writer per upload, across all API workers
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(status_code=409, detail="Another chunk is being written to this upload")
+        # Re-read under the lock: a concurrent chunk may have just finished
+        state = load_state(upload_dir, upload_id)
+        if offset != state["offset"]:
+            raise HTTPException(status_code=409, detail=f"Offset mismatch: upload is at {state['offset']}",
+                                headers={"Upload-Offset": str(state["offset"])})
+        f.seek(offset)
+        h = hashlib.sha256()
+        written = 0
+        try:
+            async for data in request.stream():
+                written += len(data)
+                if written > MAX_CHUNK_SIZE or written > remaining:
+                    raise HTTPException(status_code=413, detail=f"Chunk too large. Max: {min(MAX_CHUNK_SIZE, remaining)} bytes")
+                h.update(data)
+                f.write(data)
+            if not written:
+                raise HTTPException(status_code=400, detail="Empty chunk")
+            if sha256 and h.hexdigest() != sha256:
+                raise HTTPException(status_code=422, detail="Chunk hash mismatch")
+        except BaseException:
+            # Partial or bad chunk: back to the last verified offset
+            f.truncate(offset)
+            raise
+        f.truncate(offset + written)
+        state["offset"] = offset + written
+        _save_state(upload_dir, state)
+    return state
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+def commit_upload(upload_dir, upload_id, sha256=None):
+    """
+    Verifies the complete file and makes it usable by upload_id. Blocking
+    (hashes the whole file): run it in a thread. Committing twice is fine.
+    """
+    sha256 = _check_sha256(sha256, "sha256")
+    state = load_state(upload_dir, upload_id)
+    if state["committed"]:
+        if sha256 and sha256 != state["sha256"]:
+            raise HTTPException(status_code=422, detail="File hash mismatch")
+        return state
+    if state["offset"] != state["size"]:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {state['offset']} of {state['size']} bytes",
+                            headers={"Upload-Offset": str(state["offset"])})
+    _, part_path = _paths(upload_dir, upload_id)
+    try:
+        f = open(part_path, "rb")
+    except FileNotFoundError:
+        # A concurrent commit got there first
+        return load_state(upload_dir, upload_id)
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise HTTPException(status_code=409, detail="Upload is busy")
+        mime = magic.from_buffer(f.read(SNIFF_BYTES), mime=True)
+        digest = file_sha256(part_path)
+        expected = sha256 or state["expected_sha256"]
+        if expected and digest != expected:
+            raise HTTPException(status_code=422, detail="File hash mismatch")
+        path = os.path.join(upload_dir, f"{upload_id}_{state['filename']}")
+        os.replace(part_path, path)
+        state.update(committed=True, sha256=digest, mime=mime, path=path)
+        _save_state(upload_dir, state)
+    return state
+
+class StoredFile:
+    """Committed upload as seen by an endpoint (same fields as ingest.FilePart)."""
+    def __init__(self, name, filename, path, size, mime, sha256):
+        self.name = name
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.mime = mime
+        self.sha256 = sha256
+        self.prefixed = False
+
+def use_upload(upload_dir, upload_id, spec, name="file", link=False, copy=False):
+    """
+    Returns the committed upload as a StoredFile, checked against the
+    endpoint's FileField `spec` (size limit, allowed types). With
+    link=True the file is hard-linked to the spec's destination, so
+    per-request outputs named after the input never collide; copy=True
+    copies it instead (endpoints that modify their input in place).
+    Using an upload refreshes its expiry.
+    """
+    state = load_state(upload_dir, upload_id)
+    if not state["committed"]:
+        raise HTTPException(status_code=409, detail="Upload not committed yet")
+    if not os.path.exists(state["path"]):
+        raise HTTPException(status_code=410, detail="Unknown or expired upload")
+    if state["size"] > spec.max_size:
+        raise HTTPException(status_code=413, detail=f"File too large. Max allowed: {spec.max_size/1024/1024} MB")
+    if spec.allowed_mimes and state["mime"] not in spec.allowed_mimes:
+        raise HTTPException(status_code=400, detail=f"Invalid file type: {state['mime']}. Allowed: {spec.allowed_mimes}")
+
+    path = state["path"]
+    os.utime(path)
+    _save_state(upload_dir, state)
+    if link or copy:
+        dest = spec.dest(state["filename"], {})
+        if copy:
+            shutil.copyfile(path, dest)
+        else:
+            try:
+                os.link(path, dest)
+            except OSError:
+                shutil.copyfile(path, dest)
+        path = dest
+    return StoredFile(name, state["filename"], path, state["size"], state["mime"], state["sha256"])
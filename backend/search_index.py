@@ -0,0 +1,496 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Searchable index of finished analyses (SQLite + FTS5).
+# One row per analysis: image hash, format, size, tool verdicts; one row
+# per artifact (carved overlay segments, files the tools extracted) with
+# its SHA-256; and a full-text row with the findings, the best strings,
+# metadata and artifact types.
+# Writes are batched: each finished task pushes its entry to a Redis list,
+# and whoever drains it (the task that sees a full batch, or the periodic
+# beat task) writes up to INDEX_BATCH_SIZE entries in one transaction. So
+# there is one SQLite writer at a time and no per-task fsync. Without
+# Redis (local/eager runs) entries are written right away.
+# The index outlives the artifacts on purpose: finding an old upload that
+# had the same string or the same embedded ZIP is the point.
+
+INDEX_DB = os.getenv("SEARCH_INDEX_DB", "index/stegsik.db")
+INDEX_BATCH_SIZE = int(os.getenv("SEARCH_INDEX_BATCH", "50"))
+INDEX_FLUSH_INTERVAL = float(os.getenv("SEARCH_INDEX_FLUSH_INTERVAL", "10"))
+PENDING_KEY = "stegsik:index:pending"
+
+INDEX_STRINGS = 50  # best strings per analysis
+INDEX_STRING_CHARS = 256
+INDEX_TEXT_CHARS = 8192  # exiftool / binwalk output
+MAX_ARTIFACTS = 200
+HASH_CHUNK = 1024 * 1024
+# Result dir files written by the stages themselves (not extracted data)
+OWN_FILES = re.compile(r"^(?:.*_output\.log|bitplane_.*\.png|strings\.json|\.archives\.json)$")
+
+SEARCH_COLUMNS = ("filename", "findings", "strings", "metadata", "artifacts")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    task_id TEXT UNIQUE,
+    sha256 TEXT,
+    filename TEXT,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    file_size INTEGER,
+    profile TEXT,
+    created REAL,
+    result_dir TEXT,
+    verdicts TEXT
+);
+CREATE INDEX IF NOT EXISTS analyses_sha256 ON analyses(sha256);
+CREATE INDEX IF NOT EXISTS analyses_created ON analyses(created);
+CREATE TABLE IF NOT EXISTS artifacts (
+    analysis_id INTEGER,
+    sha256 TEXT,
+    kind TEXT,
+    type TEXT,
+    name TEXT,
+    offset INTEGER,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS artifacts_sha256 ON artifacts(sha256);
+CREATE INDEX IF NOT EXISTS artifacts_analysis ON artifacts(analysis_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(filename, findings, strings, metadata, artifacts);
+CREATE TABLE IF NOT EXISTS image_hashes (
+    analysis_id INTEGER PRIMARY KEY,
+    ahash TEXT,
+    dhash TEXT,
+    phash TEXT,
+    thash TEXT
+);
+"""
+
+def connect(db_path=INDEX_DB):
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# --- BUILDING ENTRIES (worker) ---
+
+def _sha256_range(f, offset, size):
+    h = hashlib.sha256()
+    f.seek(offset)
+    while size > 0:
+        chunk = f.read(min(HASH_CHUNK, size))
+        if not chunk:
+            break
+        h.update(chunk)
+        size -= len(chunk)
+    return h.hexdigest()
+
+def _file_artifacts(result_dir):
+    found = []
+    for root, dirs, files in os.walk(result_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if root == result_dir and OWN_FILES.match(name):
+                continue
+            path = os.path.join(root, name)
+            if len(found) >= MAX_ARTIFACTS or not os.path.isfile(path) or os.path.islink(path):
+                continue
+            with open(path, "rb") as f:
+                size = os.path.getsize(path)
+                digest = _sha256_range(f, 0, size)
+            ext = os.path.splitext(name)[1].lstrip(".").lower()
+            found.append({"kind": "extracted", "type": ext or "bin", "name": os.path.relpath(path, result_dir),
+                          "offset": None, "size": size, "sha256": digest})
+    return found
+
+def _verdicts(outputs, overlay_segments):
+    """Compact per-tool verdicts plus the finding lines that go into the text index."""
+    verdicts, findings = {}, []
+    lsb = outputs.get("lsb_score", {}).get("scores")
+    if lsb:
+        verdicts["lsb_embedding_probability"] = max(s["embedding_probability"] for s in lsb.values())
+        if verdicts["lsb_embedding_probability"] > 0.9:
+            findings.append("LSB pairs equalized: sequential LSB embedding likely")
+    dct = outputs.get("dct", {}).get("stats")
+    if dct:
+        verdicts["dct_findings"] = dct["findings"]
+        findings.extend(dct["findings"])
+    if "steghide" in outputs:
+        verdicts["steghide_extracted"] = "steghide_extracted" in outputs["steghide"].get("file_path", "")
+        if verdicts["steghide_extracted"]:
+            findings.append("steghide payload extracted with the wordlist")
+    if "outguess" in outputs:
+        verdicts["outguess_extracted"] = outputs["outguess"].get("file_path", "").endswith("outguess.out")
+    if overlay_segments:
+        types = [s["type"] for s in overlay_segments]
+        verdicts["overlay_segments"] = types
+        findings.append(f"appended data after end of image: {', '.join(types)}")
+    strings = outputs.get("strings")
+    if strings:
+        verdicts["strings_total"] = strings.get("total", 0)
+    return verdicts, findings
+
+def _top_strings(result_dir):
+    from strings_scan import STRINGS_FILE
+    try:
+        with open(os.path.join(result_dir, STRINGS_FILE)) as f:
+            found = json.load(f)
+    except (OSError, ValueError):
+        return [], []
+    lines, tags = [], set()
+    for s in found["strings"][:INDEX_STRINGS]:
+        lines.append(s["text"][:INDEX_STRING_CHARS])
+        lines.extend(d[:INDEX_STRING_CHARS] for d in s.get("decoded", []))
+        tags.update(s["tags"])
+    return lines, sorted(tags - {"repetitive"})
+
+def build_entry(task_id, file_path, result):
+    """
+    Everything the index keeps about one finished analysis (JSON-safe, so
+    it can sit in the Redis queue). Runs in the worker, right after the
+    analysis, while the files are still there.
+    """
+    from carve import scan_file
+    abs_path = os.path.abspath(file_path)
+    outputs = result.get("tool_outputs", {})
+    result_dir = os.path.join(os.path.dirname(abs_path), result["result_dir"]) if result.get("result_dir") else None
+
+    with open(abs_path, "rb") as f:
+        size = os.path.getsize(abs_path)
+        digest = _sha256_range(f, 0, size)
+        overlay_offset, segments = scan_file(abs_path)
+        artifacts = []
+        if segments:
+            artifacts.append({"kind": "overlay", "type": "overlay", "name": None, "offset": overlay_offset,
+                              "size": size - overlay_offset, "sha256": _sha256_range(f, overlay_offset, size - overlay_offset)})
+            for seg in segments:
+                artifacts.append({"kind": "segment", "type": seg["type"], "name": None, "offset": seg["offset"],
+                                  "size": seg["length"], "sha256": _sha256_range(f, seg["offset"], seg["length"])})
+    if result_dir and os.path.isdir(result_dir):
+        artifacts.extend(_file_artifacts(result_dir))
+
+    verdicts, findings = _verdicts(outputs, segments)
+    strings, tags = _top_strings(result_dir) if result_dir else ([], [])
+    if tags:
+        verdicts["string_tags"] = tags
+    metadata = "\n".join(outputs.get(name, {}).get("content", "")[:INDEX_TEXT_CHARS] for name in ("exiftool", "binwalk_scan", "binwalk"))
+
+    # Upload names are "<uuid>_<original name>"
+    filename = result.get("filename") or os.path.basename(abs_path)
+    original = filename.split("_", 1)[1] if re.match(r"^[0-9a-f-]{32,36}_", filename) else filename
+    return {
+        "task_id": task_id,
+        "sha256": digest,
+        "filename": original,
+        "format": result.get("format"),
+        "width": result.get("width"),
+        "height": result.get("height"),
+        "file_size": size,
+        "profile": result.get("profile"),
+        "created": time.time(),
+        "result_dir": result.get("result_dir"),
+        "verdicts": verdicts,
+        "findings": findings,
+        "strings": strings,
+        "metadata": metadata,
+        "artifacts": artifacts,
+        "hashes": result.get("perceptual_hashes"),
+    }
+
+# --- WRITING (batched) ---
+
+def write_batch(entries, db_path=INDEX_DB):
+    """Writes entries in one transaction. A re-run task replaces its old row."""
+    if not entries:
+        return 0
+    conn = connect(db_path)
+    try:
+        with conn:
+            for e in entries:
+                old = conn.execute("SELECT id FROM analyses WHERE task_id = ?", (e["task_id"],)).fetchone()
+                if old:
+                    conn.execute("DELETE FROM analyses_fts WHERE rowid = ?", (old["id"],))
+                    conn.execute("DELETE FROM artifacts WHERE analysis_id = ?", (old["id"],))
+                    conn.execute("DELETE FROM image_hashes WHERE analysis_id = ?", (old["id"],))
+                    conn.execute("DELETE FROM analyses WHERE id = ?", (old["id"],))
+                cur = conn.execute(
+                    "INSERT INTO analyses (task_id, sha256, filename, format, width, height, file_size, profile, created, result_dir, verdicts)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (e["task_id"], e["sha256"], e["filename"], e["format"], e["width"], e["height"], e["file_size"],
+                     e["profile"], e["created"], e["result_dir"], json.dumps(e["verdicts"])))
+                aid = cur.lastrowid
+                conn.executemany(
+                    "INSERT INTO artifacts (analysis_id, sha256, kind, type, name, offset, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(aid, a["sha256"], a["kind"], a["type"], a["name"], a["offset"], a["size"]) for a in e["artifacts"]])
+                hashes = e.get("hashes")
+                if hashes:
+                    conn.execute("INSERT INTO image_hashes (analysis_id, ahash, dhash, phash, thash) VALUES (?, ?, ?, ?, ?)",
+                                 (aid, hashes["ahash"], hashes["dhash"], hashes["phash"], hashes["thash"]))
+                artifact_text = " ".join(f"{a['type']} {a['name'] or ''}" for a in e["artifacts"])
+                conn.execute(
+                    "INSERT INTO analyses_fts (rowid, filename, findings, strings, metadata, artifacts) VALUES (?, ?, ?, ?, ?, ?)",
+                    (aid, e["filename"], "\n".join(e["findings"]), "\n".join(e["strings"]), e["metadata"], artifact_text))
+    finally:
+        conn.close()
+    return len(entries)
+
+_redis_client = None
+
+def _get_redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+        _redis_client = redis.Redis.from_url(redis_url, socket_timeout=2, socket_connect_timeout=2)
+    return _redis_client
+
+def queue_entry(entry, db_path=INDEX_DB):
+    """
+    Queues an entry for the next batch; drains right away once a full
+    batch is waiting. The index must never break a task: without Redis
+    the entry is written directly.
+    """
+    try:
+        pending = _get_redis().rpush(PENDING_KEY, json.dumps(entry))
+    except Exception:
+        write_batch([entry], db_path)
+        return
+    if pending >= INDEX_BATCH_SIZE:
+        flush_pending(db_path)
+
+def flush_pending(db_path=INDEX_DB, max_batches=20):
+    """
+    Writes queued entries, INDEX_BATCH_SIZE per transaction. LPOP with a
+    count is atomic, so concurrent flushers never write an entry twice.
+    """
+    written = 0
+    client = _get_redis()
+    for _ in range(max_batches):
+        raw = client.lpop(PENDING_KEY, INDEX_BATCH_SIZE)
+        if not raw:
+            break
+        entries = [json.loads(r) for r in raw]
+        try:
+            written += write_batch(entries, db_path)
+        except sqlite3.Error:
+            # Put them back for the next flush
+            client.lpush(PENDING_KEY, *reversed(raw))
+            raise
+        if len(raw) < INDEX_BATCH_SIZE:
+            break
+    return written
+
+# --- QUERIES (API) ---
+
+_local = threading.local()
+
+def _reader(db_path):
+    conn = getattr(_local, "conns", {}).get(db_path)
+    if conn is None:
+        if not os.path.exists(db_path):
+            return None
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+        conn.row_factory = sqlite3.Row
+        _local.conns = {**getattr(_local, "conns", {}), db_path: conn}
+    return conn
+
+def fts_query(text):
+    """
+    User text -> FTS5 query: every term must match, as a quoted phrase so
+    punctuation (flag{...}, file names) can't break the syntax. "a b"
+    stays one phrase, a trailing * means prefix, column:term searches one
+    column (filename, findings, strings, metadata, artifacts).
+    """
+    terms = []
+    for token in re.findall(r'(?:\w+:)?"[^"]*"|\S+', text):
+        column = None
+        m = re.match(r'^(\w+):(.+)$', token)
+        if m and m.group(1) in SEARCH_COLUMNS:
+            column, token = m.groups()
+        prefix = token.endswith("*")
+        token = token.rstrip("*").strip('"').replace('"', '""')
+        if not re.search(r"\w", token):
+            continue  # the tokenizer keeps only word characters: nothing to match
+        term = f'"{token}"' + ("*" if prefix else "")
+        terms.append(f"{column}:{term}" if column else term)
+    return " AND ".join(terms)
+
+def _row(r):
+    item = {k: r[k] for k in ("task_id", "sha256", "filename", "format", "width", "height", "file_size",
+                              "profile", "created", "result_dir")}
+    item["verdicts"] = json.loads(r["verdicts"] or "{}")
+    return item
+
+def search(q=None, sha256=None, fmt=None, limit=20, offset=0, db_path=INDEX_DB):
+    """
+    Full-text (`q`) and/or hash (`sha256`: the image or any artifact)
+    search, newest first or best match first for text queries. Returns
+    {"items": [...], "has_more": bool}.
+    """
+    if q and not fts_query(q):
+        # Only quotes/asterisks: don't fall through to listing everything
+        raise ValueError("No search terms in q")
+    conn = _reader(db_path)
+    if conn is None:
+        return {"items": [], "has_more": False}
+    where, args = [], []
+    if sha256:
+        where.append("(a.sha256 = ? OR a.id IN (SELECT analysis_id FROM artifacts WHERE sha256 = ?))")
+        args += [sha256, sha256]
+    if fmt:
+        where.append("a.format = ?")
+        args.append(fmt.upper())
+    match = fts_query(q) if q else ""
+    if match:
+        sql = ("SELECT a.*, snippet(analyses_fts, -1, '[', ']', '...', 16) AS snippet FROM analyses_fts"
+               " JOIN analyses a ON a.id = analyses_fts.rowid WHERE analyses_fts MATCH ?")
+        args.insert(0, match)
+        sql += "".join(f" AND {w}" for w in where) + " ORDER BY analyses_fts.rank"
+    else:
+        sql = "SELECT a.*, NULL AS snippet FROM analyses a"
+        sql += (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY a.created DESC"
+    sql += " LIMIT ? OFFSET ?"
+    args += [limit + 1, offset]
+    try:
+        rows = conn.execute(sql, args).fetchall()
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid query: {e}")
+
+    items = []
+    for r in rows[:limit]:
+        item = _row(r)
+        if r["snippet"]:
+            item["snippet"] = r["snippet"]
+        items.append(item)
+    if sha256 and items:
+        # Which artifacts matched the hash
+        ids = [r["id"] for r in rows[:limit]]
+        matched = conn.execute(
+            f"SELECT analysis_id, kind, type, name, offset, size FROM artifacts WHERE sha256 = ? AND analysis_id IN ({','.join('?' * len(ids))})",
+            [sha256, *ids]).fetchall()
+        by_id = {}
+        for m in matched:
+            by_id.setdefault(m["analysis_id"], []).append({k: m[k] for k in ("kind", "type", "name", "offset", "size")})
+        for r, item in zip(rows, items):
+            item["matched_artifacts"] = by_id.get(r["id"], [])
+    return {"items": items, "has_more": len(rows) > limit}
+
+# --- NEAR-DUPLICATES (perceptual hashes, see phash.py) ---
+
+SIMILAR_HASHES = ("phash", "thash", "dhash")  # indexed; ahash is only reported
+MAX_DISTANCE = 16
+CHUNKS = 4
+CHUNK_BITS = 16
+
+def _popcount(x):
+    return bin(x).count("1")
+
+_flip_masks = {}
+
+def _masks(radius):
+    """16-bit masks with at most `radius` bits set."""
+    if radius not in _flip_masks:
+        _flip_masks[radius] = [m for m in range(1 << CHUNK_BITS) if _popcount(m) <= radius]
+    return _flip_masks[radius]
+
+class HammingIndex:
+    """
+    Multi-index hashing: each 64-bit hash is split into 4 chunks of 16
+    bits, with one dict per chunk position. Two hashes within distance d
+    agree within d // 4 bits on at least one chunk (pigeonhole), so a
+    query probes only the chunk values that close and checks the few
+    candidates it finds, instead of scanning every hash.
+    """
+    def __init__(self):
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.values = {}
+
+    def _chunks(self, value):
+        mask = (1 << CHUNK_BITS) - 1
+        return [(value >> (i * CHUNK_BITS)) & mask for i in range(CHUNKS)]
+
+    def add(self, key, value):
+        self.values[key] = value
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(key)
+
+    def query(self, value, max_distance):
+        """{key: distance} of every stored hash within max_distance."""
+        found = {}
+        masks = _masks(max_distance // CHUNKS)
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            for m in masks:
+                for key in table.get(chunk ^ m, ()):
+                    if key not in found:
+                        d = _popcount(self.values[key] ^ value)
+                        if d <= max_distance:
+                            found[key] = d
+        return found
+
+# Built from image_hashes on first use, then topped up with the new rows
+# before every query (rows only ever get appended)
+_similar = {"last_id": 0, "indexes": None}
+_similar_lock = threading.Lock()
+
+def _refresh_similar(conn):
+    with _similar_lock:
+        if _similar["indexes"] is None:
+            _similar["indexes"] = {name: HammingIndex() for name in SIMILAR_HASHES}
+        rows = conn.execute(f"SELECT analysis_id, {', '.join(SIMILAR_HASHES)} FROM image_hashes"
+                            " WHERE analysis_id > ? ORDER BY analysis_id", (_similar["last_id"],)).fetchall()
+        for r in rows:
+            for name in SIMILAR_HASHES:
+                _similar["indexes"][name].add(r["analysis_id"], int(r[name], 16))
+        if rows:
+            _similar["last_id"] = rows[-1]["analysis_id"]
+        return _similar["indexes"]
+
+def hashes_for_task(task_id, db_path=INDEX_DB):
+    conn = _reader(db_path)
+    if conn is None:
+        return None
+    r = conn.execute("SELECT h.* FROM analyses a JOIN image_hashes h ON h.analysis_id = a.id WHERE a.task_id = ?",
+                     (task_id,)).fetchone()
+    return {name: r[name] for name in ("ahash", "dhash", "phash", "thash")} if r else None
+
+def similar(hashes, max_distance=8, limit=20, exclude_task=None, db_path=INDEX_DB):
+    """
+    Earlier analyses whose pHash, top-band hash or dHash is within
+    max_distance bits of `hashes`. Closest first; each item carries the
+    distances for all four hashes and which ones matched.
+    """
+    conn = _reader(db_path)
+    if conn is None:
+        return []
+    indexes = _refresh_similar(conn)
+    best = {}
+    for name in SIMILAR_HASHES:
+        for aid, d in indexes[name].query(int(hashes[name], 16), max_distance).items():
+            best[aid] = min(best.get(aid, d), d)
+    if not best:
+        return []
+    ids = list(best)
+    rows = conn.execute(
+        f"SELECT a.*, h.ahash, h.dhash, h.phash, h.thash FROM analyses a JOIN image_hashes h ON h.analysis_id = a.id"
+        f" WHERE a.id IN ({','.join('?' * len(ids))})", ids).fetchall()
+    items = []
+    for r in rows:
+        if r["task_id"] == exclude_task:
+            continue
+        item = _row(r)
+        item["distances"] = {name: _popcount(int(r[name], 16) ^ int(hashes[name], 16)) for name in ("ahash", "dhash", "phash", "thash")}
+        item["matched"] = [name for name in SIMILAR_HASHES if item["distances"][name] <= max_distance]
+        item["distance"] = best[r["id"]]
+        items.append(item)
+    items.sort(key=lambda i: (i["distance"], -i["created"]))
+    return items[:limit]
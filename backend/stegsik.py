@@ -0,0 +1,342 @@
+"""
+stegsik: run the Stegsik engines directly on local files.
+
+    python stegsik.py analyze 'samples/**/*.png' --profile deep --jobs 4
+    python stegsik.py bitplanes img.png --out-dir planes/
+    python stegsik.py scramble encrypt photos/ --out-dir scrambled/ --password pw
+    python stegsik.py strings 'dump/*' --limit 20
+    python stegsik.py embed cover.png --payload secret.zip --out-dir out/
+    python stegsik.py extract out/ --out-dir overlays/
+    python stegsik.py morse-hide cover.jpg --message "Hi" --mode pixel
+    python stegsik.py morse-recover stego.png --offset 1024 --interval 50
+    python stegsik.py morse-bruteforce suspects/
+    python stegsik.py patch-height crop.png --height 1200
+
+Inputs can be files, directories (recursed) or glob patterns. Files are
+processed in parallel with --jobs N. Every result is printed as one JSON
+line on stdout as soon as it is ready; progress and the summary go to
+stderr. The exit status is 1 if any file failed.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch import expand_inputs, read_password, IMAGE_EXTS
+
+def _out_dir(source, args):
+    """--out-dir keeps the inputs' layout below their common directory (args.base_dir)."""
+    if not args.out_dir:
+        return os.path.dirname(source)
+    rel = os.path.relpath(os.path.dirname(os.path.abspath(source)), args.base_dir)
+    return os.path.normpath(os.path.join(args.out_dir, rel))
+
+def _out_path(source, args, prefix="", ext=None):
+    name, source_ext = os.path.splitext(os.path.basename(source))
+    return os.path.join(_out_dir(source, args), f"{prefix}{name}{source_ext if ext is None else ext}")
+
+def output_for(command, path, args):
+    """Where `command` writes its output for `path` (None: no file, or in place)."""
+    if command == "bitplanes":
+        return os.path.join(_out_dir(path, args), os.path.basename(path)) if args.out_dir else f"{path}_bitplanes"
+    if command == "embed":
+        return _out_path(path, args, prefix="embedded_")
+    if command == "extract":
+        return _out_path(path, args, prefix="extracted_", ext=".bin")
+    if command == "morse-hide":
+        return _out_path(path, args, prefix="advanced_steg_", ext=".png" if args.mode == "pixel" else None)
+    if command == "patch-height" and not args.in_place:
+        return _out_path(path, args, prefix="patched_")
+    return None
+
+def check_outputs(command, paths, args):
+    """
+    Exits before any work if two inputs would write the same output, e.g.
+    a.png and a.jpg -> extracted_a.bin (they'd overwrite each other,
+    silently and in any order under --jobs).
+    """
+    seen = {}
+    for path in paths:
+        out = output_for(command, path, args)
+        if out is None:
+            continue
+        key = os.path.abspath(out)
+        if key in seen:
+            sys.exit(f"[-] {seen[key]} and {path} would both write {out}; rename one of them")
+        seen[key] = path
+
+def _prepare(out_path):
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    return out_path
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _parse_range(text):
+    """'500-3000' -> range(500, 3001), '50' -> range(50, 51)"""
+    low, _, high = text.partition("-")
+    return range(int(low), int(high or low) + 1)
+
+# --- COMMANDS ---
+# Each takes (path, args) and returns a dict for the JSON line. They run in
+# pool processes, so heavy modules are imported inside.
+
+def cmd_analyze(path, args):
+    from worker import _run_analysis
+    tool_stats = {}
+    result = _run_analysis(path, tool_stats, args.profile)
+    result["metrics"] = {"tools": tool_stats}
+    return result
+
+def cmd_bitplanes(path, args):
+    from worker import generate_bit_planes
+    out_dir = output_for("bitplanes", path, args)
+    os.makedirs(out_dir, exist_ok=True)
+    planes = generate_bit_planes(path, out_dir)
+    if "error" in planes:
+        raise ValueError(planes["error"])
+    return {"output_dir": out_dir, "planes": planes}
+
+def cmd_strings(path, args):
+    from strings_scan import extract_file_strings, ENCODINGS
+    found = extract_file_strings(path, min_len=args.min_len, encodings=args.encodings or ENCODINGS, limit=args.limit)
+    return {"total": found["total"], "truncated": found["truncated"], "strings": found["strings"]}
+
+def cmd_dct(path, args):
+    from jpeg_dct import analyze_file, MAX_BLOCKS
+    return analyze_file(path, max_blocks=args.max_blocks or MAX_BLOCKS)
+
+def cmd_embed(path, args):
+    from utils import embed_file_data
+    out_path = _prepare(output_for("embed", path, args))
+    success, msg = embed_file_data(path, args.payload, out_path)
+    if not success:
+        raise ValueError(msg)
+    return {"output": out_path, "payload_bytes": os.path.getsize(args.payload)}
+
+def cmd_extract(path, args):
+    from carve import scan_file, copy_range, write_segments
+    overlay_offset, segments = scan_file(path)
+    if not segments:
+        return {"overlay_bytes": 0, "segments": []}
+    overlay_bytes = os.path.getsize(path) - overlay_offset
+    out_path = _prepare(output_for("extract", path, args))
+    copy_range(path, overlay_offset, overlay_bytes, out_path)
+    if not args.no_split:
+        name = os.path.splitext(os.path.basename(path))[0]
+        write_segments(path, segments, os.path.dirname(out_path) or ".", f"extracted_{name}")
+    return {"output": out_path, "overlay_offset": overlay_offset, "overlay_bytes": overlay_bytes, "segments": segments}
+
+def cmd_morse_hide(path, args):
+    from advanced_steg import custom_inject, pixel_inject, RANDOM_OFFSET_RANGE, RANDOM_INTERVAL_RANGE
+    offset = args.offset if args.offset is not None else random.randint(*RANDOM_OFFSET_RANGE)
+    interval = args.interval if args.interval is not None else random.randint(*RANDOM_INTERVAL_RANGE)
+    data = _read(path)
+    if args.mode == "pixel":
+        final_data = pixel_inject(data, args.message, offset, interval)
+    else:
+        final_data = custom_inject(data, args.message, offset, interval, version=args.version)
+    out_path = _prepare(output_for("morse-hide", path, args))
+    _write(out_path, final_data)
+    return {"output": out_path, "key_offset": offset, "key_interval": interval, "mode": args.mode}
+
+def cmd_morse_recover(path, args):
+    from advanced_steg import solve_custom_steg, solve_pixel_steg
+    data = _read(path)
+    message = None
+    if args.mode in ("auto", "tail"):
+        message = solve_custom_steg(data, args.offset, args.interval)
+    if args.mode == "pixel" or (args.mode == "auto" and message.startswith("Error:")):
+        pixel_message = solve_pixel_steg(data, args.offset, args.interval)
+        if args.mode == "pixel" or not pixel_message.startswith("Error:"):
+            message = pixel_message
+    if message.startswith("Error:"):
+        raise ValueError(message)
+    return {"message": message}
+
+def cmd_morse_bruteforce(path, args):
+    from advanced_steg import bruteforce_custom_steg
+    hits = []
+    for offset, interval, version, message in bruteforce_custom_steg(
+            _read(path), _parse_range(args.offsets), _parse_range(args.intervals), include_v1=not args.no_v1):
+        hits.append({"key_offset": offset, "key_interval": interval, "format_version": version, "message": message})
+        if len(hits) >= args.max_hits:
+            break
+    return {"hits": hits}
+
+def cmd_patch_height(path, args):
+    from utils import patch_png_height, patch_jpg_height
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".png":
+        patch = patch_png_height
+    elif ext in (".jpg", ".jpeg"):
+        patch = patch_jpg_height
+    else:
+        raise ValueError("Unsupported file format. Only PNG and JPG supported.")
+    target = path
+    if not args.in_place:
+        target = _prepare(output_for("patch-height", path, args))
+        shutil.copyfile(path, target)
+    success, msg = patch(target, args.height)
+    if not success:
+        raise ValueError(msg)
+    return {"output": target, "message": msg}
+
+COMMANDS = {
+    "analyze": cmd_analyze,
+    "bitplanes": cmd_bitplanes,
+    "strings": cmd_strings,
+    "dct": cmd_dct,
+    "embed": cmd_embed,
+    "extract": cmd_extract,
+    "morse-hide": cmd_morse_hide,
+    "morse-recover": cmd_morse_recover,
+    "morse-bruteforce": cmd_morse_bruteforce,
+    "patch-height": cmd_patch_height,
+}
+
+def _run_one(command, path, args):
+    start = time.perf_counter()
+    record = {"command": command, "file": path}
+    try:
+        # The engines print progress; keep stdout for the JSON lines only
+        with contextlib.redirect_stdout(sys.stderr):
+            record.update(COMMANDS[command](path, args))
+        record["status"] = "ok"
+    except Exception as e:
+        record.update(status="error", error=str(e))
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+def _emit(record):
+    print(json.dumps(record, default=str), flush=True)
+
+def run_files(command, paths, args):
+    """
+    Runs `command` on every path, --jobs at a time, printing each result
+    as it completes. Returns the number of failures.
+    """
+    failures = 0
+    if args.jobs == 1 or len(paths) == 1:
+        for path in paths:
+            record = _run_one(command, path, args)
+            failures += record["status"] != "ok"
+            _emit(record)
+        return failures
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(_run_one, command, path, args) for path in paths]
+        for future in as_completed(futures):
+            record = future.result()
+            failures += record["status"] != "ok"
+            _emit(record)
+    return failures
+
+def run_scramble(paths, args):
+    from batch import run_batch
+    try:
+        manifest = run_batch(paths, read_password(args), args.mode, args.out_dir, args.jobs,
+                             args.manifest, on_entry=lambda entry: _emit({"command": "scramble", **entry}))
+    except ValueError as e:
+        sys.exit(f"[-] {e}")
+    print(f"[*] Manifest: {manifest['manifest_path']}", file=sys.stderr)
+    return manifest["failed"]
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="stegsik", description="Stegsik engines on local files")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add(name, help_text, images_only=True, mode_choices=None):
+        p = sub.add_parser(name, help=help_text)
+        if mode_choices:
+            p.add_argument("mode", choices=mode_choices)
+        p.add_argument("inputs", nargs="+", help="Files, directories or glob patterns")
+        p.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1)
+        p.add_argument("--no-recursive", action="store_true", help="Don't descend into subdirectories")
+        p.set_defaults(images_only=images_only)
+        return p
+
+    p = add("analyze", "Run the forensic pipeline (results_<file>/ next to each input)")
+    p.add_argument("--profile", default="auto", choices=["auto", "quick", "standard", "deep"])
+
+    p = add("bitplanes", "Extract the 24 bit planes")
+    p.add_argument("--out-dir")
+
+    p = add("scramble", "RGB scrambler (encrypt/decrypt) with one password", mode_choices=["encrypt", "decrypt"])
+    p.add_argument("--password", help="Default: STEGSIK_PASSWORD or a prompt")
+    p.add_argument("--out-dir")
+    p.add_argument("--manifest")
+
+    p = add("strings", "Ranked strings (ASCII/UTF-16, base64/hex decoded) with offsets", images_only=False)
+    p.add_argument("--min-len", type=int, default=10)
+    p.add_argument("--encodings", nargs="+", choices=["ascii", "utf-16le", "utf-16be"])
+    p.add_argument("--limit", type=int, default=50, help="Best N strings per file")
+
+    p = add("dct", "JPEG DCT-domain steganalysis (JSteg/F5/OutGuess signatures)")
+    p.add_argument("--max-blocks", type=int, help="Decode only the first rows beyond this many blocks (default: DCT_MAX_BLOCKS or 60000)")
+
+    p = add("embed", "Append a payload file to each cover")
+    p.add_argument("--payload", required=True)
+    p.add_argument("--out-dir")
+
+    p = add("extract", "Extract data appended after the image, split by file type", images_only=False)
+    p.add_argument("--out-dir")
+    p.add_argument("--no-split", action="store_true", help="Only write the whole tail (.bin)")
+
+    p = add("morse-hide", "Hide a message with the keyed Morse scheme")
+    p.add_argument("--message", required=True)
+    p.add_argument("--offset", type=int, help="Default: random")
+    p.add_argument("--interval", type=int, help="Default: random")
+    p.add_argument("--version", type=int, default=2, choices=[1, 2])
+    p.add_argument("--mode", default="tail", choices=["tail", "pixel"])
+    p.add_argument("--out-dir")
+
+    p = add("morse-recover", "Recover a message with known keys", images_only=False)
+    p.add_argument("--offset", type=int, default=1024)
+    p.add_argument("--interval", type=int, default=50)
+    p.add_argument("--mode", default="auto", choices=["auto", "tail", "pixel"])
+
+    p = add("morse-bruteforce", "Search tail keys for a Morse message", images_only=False)
+    p.add_argument("--offsets", default="500-3000", help="Offset range, e.g. 0-5000")
+    p.add_argument("--intervals", default="10-100", help="Interval range, e.g. 1-200")
+    p.add_argument("--no-v1", action="store_true", help="Only look for v2 payloads")
+    p.add_argument("--max-hits", type=int, default=10)
+
+    p = add("patch-height", "Rewrite the height field of PNG/JPG headers")
+    p.add_argument("--height", type=int, required=True)
+    p.add_argument("--in-place", action="store_true", help="Patch the input files instead of writing patched_<name>")
+    p.add_argument("--out-dir")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Commands that work on any file (stego tails) take everything in a directory
+    paths = expand_inputs(args.inputs, recursive=not args.no_recursive,
+                          exts=IMAGE_EXTS if args.images_only else None)
+    if not paths:
+        sys.exit("[-] No input files found")
+
+    # Same layout rule as batch.plan_jobs
+    args.base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    check_outputs(args.command, paths, args)
+
+    start = time.perf_counter()
+    if args.command == "scramble":
+        failures = run_scramble(paths, args)
+    else:
+        failures = run_files(args.command, paths, args)
+    print(f"[+] {args.command}: {len(paths) - failures}/{len(paths)} ok in {time.perf_counter() - start:.2f}s"
+          f" ({args.jobs} jobs)", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
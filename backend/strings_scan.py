@@ -0,0 +1,201 @@
+import base64
+import binascii
+import mmap
+import os
+import re
+import numpy as np
+
+# In-process replacement for `strings -n 10`.
+# Printable runs are found with NumPy on a memory map (a few vectorized
+# passes per encoding, no Python loop over bytes), then every string is
+# scored with precompiled regexes so flags, keys and URLs come first instead
+# of being buried in megabytes of noise. Only a capped number of strings is
+# kept; the API pages through them.
+
+MIN_LEN = 10
+MAX_STRINGS = int(os.getenv("STRINGS_MAX", "20000"))
+MAX_TEXT = 512  # longer strings are cut in the result (length stays exact)
+STRINGS_PREVIEW = 100  # shown in the analysis result
+STRINGS_FILE = "strings.json"
+ENCODINGS = ("ascii", "utf-16le", "utf-16be")
+
+# --- SCORING ---
+# (tag, regex, score). A string gets the score of every tag that matches.
+PATTERNS = [
+    ("flag", re.compile(r"[A-Za-z0-9_]{2,16}\{[^{}\s]{3,200}\}"), 100),
+    ("key", re.compile(r"-----BEGIN [A-Z ]*(?:KEY|CERTIFICATE)-----|AKIA[0-9A-Z]{16}|ssh-(?:rsa|ed25519) [A-Za-z0-9+/=]{20,}|gh[pousr]_[A-Za-z0-9]{36}"), 80),
+    ("url", re.compile(r"(?:https?|ftp)://[^\s\"'<>]{4,}"), 40),
+    ("email", re.compile(r"[\w.+-]{2,64}@[\w-]{2,63}(?:\.[\w-]{2,63})*\.[A-Za-z]{2,10}\b"), 20),
+    ("keyword", re.compile(r"(?i)(?:pass(?:word|wd)?|secret|token|api[_-]?key|private|flag|hidden|steg)"), 15),
+]
+B64_RE = re.compile(r"(?:[A-Za-z0-9+/]{4}){4,}(?:[A-Za-z0-9+/]{2}==|[A-Za-z0-9+/]{3}=)?")
+HEX_RE = re.compile(r"(?:[0-9a-fA-F]{2}){8,}")
+DECODED_SCORE = 30
+
+def printable_mask(arr):
+    # Same set as GNU strings: printable ASCII plus tab
+    return ((arr - 0x20) < 0x5F) | (arr == 0x09)
+
+def _runs(mask, min_len):
+    """Start/end indices of the True runs of at least min_len."""
+    # window[i] is True when mask[i:i + width] is all True. Doubling the
+    # width takes ~log2(min_len) ANDs, and only positions inside long runs
+    # survive, so the (usually huge) number of short runs never matters.
+    window, width = mask, 1
+    while width < min_len:
+        step = min(width, min_len - width)
+        window = window[:-step] & window[step:]
+        width += step
+    starts = np.flatnonzero(window)
+    if not len(starts):
+        return starts, starts
+    # A run of length n leaves n - min_len + 1 consecutive positions
+    breaks = np.flatnonzero(np.diff(starts) != 1)
+    run_starts = starts[np.concatenate(([0], breaks + 1))]
+    run_ends = starts[np.concatenate((breaks, [len(starts) - 1]))] + min_len
+    return run_starts, run_ends
+
+def _ascii_runs(printable, min_len):
+    starts, ends = _runs(printable, min_len)
+    return [(int(s), int(e - s), "ascii") for s, e in zip(starts, ends)]
+
+def _utf16_runs(printable, zero, min_len, big_endian):
+    found = []
+    for align in (0, 1):
+        if big_endian:
+            hi, lo = zero[align::2], printable[align + 1::2]
+        else:
+            lo, hi = printable[align::2], zero[align + 1::2]
+        n = min(len(lo), len(hi))
+        if n < min_len:
+            continue
+        starts, ends = _runs(lo[:n] & hi[:n], min_len)
+        found.extend((align + 2 * int(s), int(e - s), "utf-16be" if big_endian else "utf-16le") for s, e in zip(starts, ends))
+    return found
+
+def _drop_shadows(le, be):
+    """
+    "H\0e\0l\0l\0o\0" also reads as big endian one byte later ("ello...",
+    one char shorter), and the other way round. Keep the longer reading.
+    """
+    le_by_start = {s: l for s, l, _ in le}
+    be_by_start = {s: l for s, l, _ in be}
+    le = [h for h in le if not be_by_start.get(h[0] - 1, -1) >= h[1]]
+    be = [h for h in be if not le_by_start.get(h[0] - 1, -1) >= h[1]]
+    return le, be
+
+def _printable_text(data):
+    if not data:
+        return None
+    text = data.decode("latin-1")
+    printable = sum(1 for c in text if c.isprintable() or c in "\t\r\n")
+    return text if printable / len(text) >= 0.95 else None
+
+def _decode_encoded(text):
+    """base64/hex blobs inside `text` that decode to readable text."""
+    decoded = []
+    for m in B64_RE.finditer(text):
+        blob = m.group()
+        # Plain words and hex also match the base64 alphabet
+        if blob.isalpha() or HEX_RE.fullmatch(blob):
+            continue
+        try:
+            plain = _printable_text(base64.b64decode(blob + "=" * (-len(blob) % 4)))
+        except (binascii.Error, ValueError):
+            continue
+        if plain:
+            decoded.append(("base64", plain))
+    for m in HEX_RE.finditer(text):
+        blob = m.group()
+        if blob.isdigit():
+            continue
+        plain = _printable_text(bytes.fromhex(blob))
+        if plain:
+            decoded.append(("hex", plain))
+    return decoded
+
+def score_string(text, decode=True):
+    """-> (score, tags, decoded texts)"""
+    # Padding, fill patterns and the like: not interesting at all
+    if len(set(text)) < 5:
+        return 0, ["repetitive"], []
+    score, tags = 0, []
+    for tag, regex, points in PATTERNS:
+        if regex.search(text):
+            score += points
+            tags.append(tag)
+    decoded = _decode_encoded(text) if decode else []
+    for kind, plain in decoded:
+        tags.append(kind)
+        score += DECODED_SCORE
+        inner, inner_tags, _ = score_string(plain, decode=False)
+        score += inner
+        tags.extend(t for t in inner_tags if t not in tags and t != "repetitive")
+    if any(c.isalpha() for c in text):
+        score += min(len(text) // 16, 5)
+    return score, tags, [plain for _, plain in decoded]
+
+def extract_strings(buf, min_len=MIN_LEN, encodings=ENCODINGS, decode=True, limit=MAX_STRINGS):
+    """
+    Finds printable strings in `buf` (bytes, mmap, ...). Returns
+    {"total": found, "strings": [...], "truncated": bool}; strings are the
+    `limit` best ones, best first, each with offset, encoding, length,
+    text, score and tags.
+    """
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    printable = printable_mask(arr)
+    runs = _ascii_runs(printable, min_len) if "ascii" in encodings else []
+    le, be = [], []
+    if "utf-16le" in encodings or "utf-16be" in encodings:
+        zero = arr == 0
+        le = _utf16_runs(printable, zero, min_len, False) if "utf-16le" in encodings else []
+        be = _utf16_runs(printable, zero, min_len, True) if "utf-16be" in encodings else []
+    le, be = _drop_shadows(le, be)
+    runs.extend(le)
+    runs.extend(be)
+
+    hits = []
+    for offset, length, encoding in runs:
+        if encoding == "ascii":
+            text = bytes(buf[offset:offset + length]).decode("ascii")
+        else:
+            text = bytes(buf[offset:offset + 2 * length]).decode(encoding)
+        score, tags, decoded = score_string(text, decode)
+        hit = {"offset": offset, "encoding": encoding, "length": length,
+               "text": text[:MAX_TEXT], "score": score, "tags": tags}
+        if decoded:
+            hit["decoded"] = [plain[:MAX_TEXT] for plain in decoded]
+        hits.append(hit)
+
+    hits.sort(key=lambda h: (-h["score"], h["offset"]))
+    return {"total": len(hits), "strings": hits[:limit], "truncated": len(hits) > limit}
+
+def extract_file_strings(path, **kwargs):
+    if os.path.getsize(path) == 0:
+        return {"total": 0, "strings": [], "truncated": False}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return extract_strings(buf, **kwargs)
+
+def page_strings(strings, offset=0, limit=100, sort="score", min_score=0, encoding=None, query=None):
+    """Filters/sorts a result's strings and returns one page of them."""
+    items = [s for s in strings if s["score"] >= min_score]
+    if encoding:
+        items = [s for s in items if s["encoding"] == encoding]
+    if query:
+        q = query.lower()
+        items = [s for s in items if q in s["text"].lower() or any(q in d.lower() for d in s.get("decoded", []))]
+    if sort == "offset":
+        items.sort(key=lambda s: s["offset"])
+    return {"total": len(items), "offset": offset, "limit": limit, "items": items[offset:offset + limit]}
+
+def format_report(result, top=100):
+    """Text view of the best strings (the stage's content)."""
+    lines = [f"[*] {result['total']} strings found"
+             + (f", best {len(result['strings'])} kept" if result["truncated"] else "")
+             + f", top {min(top, len(result['strings']))} shown"]
+    for s in result["strings"][:top]:
+        tags = f"[{','.join(s['tags'])}] " if s["tags"] else ""
+        lines.append(f"0x{s['offset']:08x} {s['encoding']:<8} {s['score']:>4} {tags}{s['text']}")
+        for plain in s.get("decoded", []):
+            lines.append(f"{'':>24}-> {plain}")
+    return "\n".join(lines)
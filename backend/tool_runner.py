@@ -0,0 +1,309 @@
+import os
+import time
+import signal
+import atexit
+import resource
+import selectors
+import threading
+import subprocess
+
+# Sandboxed runner for external forensic tools.
+# Every tool runs in its own session/process group with rlimits applied, so
+# a hung or malicious input can be killed completely (including children
+# like binwalk's extractors). Output is captured in streaming fashion up
+# to a cap. exiftool is kept warm with -stay_open, which saves Perl startup
+# on every image.
+
+MB = 1024 * 1024
+
+DEFAULT_LIMITS = {
+    "timeout": int(os.getenv("TOOL_TIMEOUT", "30")),          # wall clock, seconds
+    "cpu_seconds": None,                                       # None = timeout + 5
+    "address_space": int(os.getenv("TOOL_MAX_MEMORY_MB", "2048")) * MB,
+    "file_size": int(os.getenv("TOOL_MAX_FILE_MB", "512")) * MB,
+    "open_files": 256,
+    "max_output": int(os.getenv("TOOL_MAX_OUTPUT_MB", "4")) * MB,
+}
+
+# Per-tool overrides. Brute forcing needs far longer than a metadata dump,
+# and carvers write many (possibly large) files.
+TOOL_LIMITS = {
+    "stegseek": {"timeout": 120},
+    "binwalk": {"timeout": 60, "open_files": 1024},
+    "foremost": {"timeout": 60, "open_files": 1024},
+    "zsteg": {"address_space": 4096 * MB},  # Ruby reserves a lot of virtual memory
+}
+
+EXIFTOOL_STAY_OPEN = os.getenv("EXIFTOOL_STAY_OPEN", "1") != "0"
+READ_CHUNK = 64 * 1024
+# Polling for the exit once the pipes are closed (seconds)
+WAIT_POLL_MIN = 0.001
+WAIT_POLL_MAX = 0.05
+
+def limits_for(tool, timeout=None):
+    limits = dict(DEFAULT_LIMITS)
+    limits.update(TOOL_LIMITS.get(tool, {}))
+    if timeout is not None:
+        limits["timeout"] = timeout
+    if limits["cpu_seconds"] is None:
+        limits["cpu_seconds"] = int(limits["timeout"]) + 5
+    return limits
+
+def new_record():
+    return {
+        "wall_seconds": 0.0,
+        "cpu_seconds": None,
+        "peak_rss_bytes": None,
+        "output_bytes": 0,
+        "output_truncated": False,
+        "returncode": None,
+        "timed_out": False,
+        "error": None,
+        "warm": False,
+    }
+
+def _rlimit_preexec(limits, cpu=True):
+    """
+    Returns a preexec_fn that applies rlimits in the child before exec.
+    """
+    settings = [
+        (resource.RLIMIT_AS, limits.get("address_space")),
+        (resource.RLIMIT_FSIZE, limits.get("file_size")),
+        (resource.RLIMIT_NOFILE, limits.get("open_files")),
+    ]
+    if cpu:
+        settings.append((resource.RLIMIT_CPU, limits.get("cpu_seconds")))
+
+    def apply():
+        for res, value in settings:
+            if value:
+                # Never try to raise a limit the worker itself doesn't have
+                hard = resource.getrlimit(res)[1]
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+                resource.setrlimit(res, (value, value))
+    return apply
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+class _CappedBuffer:
+    def __init__(self, cap):
+        self.cap = cap
+        self.data = bytearray()
+        self.total = 0
+
+    def feed(self, chunk):
+        room = self.cap - len(self.data)
+        if room > 0:
+            self.data.extend(chunk[:room])
+        self.total += len(chunk)
+
+    @property
+    def truncated(self):
+        return self.total > len(self.data)
+
+def run_tool(command, limits):
+    """
+    Runs `command` under `limits` (see limits_for). Returns (output, record)
+    where output is stdout+stderr as text, capped at limits["max_output"].
+    """
+    record = new_record()
+    start = time.monotonic()
+    try:
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,  # own process group, so killpg gets every child
+            preexec_fn=_rlimit_preexec(limits),
+        )
+    except Exception as e:
+        record["wall_seconds"] = time.monotonic() - start
+        record["error"] = str(e)
+        return str(e), record
+
+    # Reading keeps going past the cap (and discards) so the child never
+    # blocks on a full pipe.
+    out_buf = _CappedBuffer(limits["max_output"])
+    err_buf = _CappedBuffer(limits["max_output"])
+    selector = selectors.DefaultSelector()
+    selector.register(proc.stdout, selectors.EVENT_READ, (out_buf, err_buf))
+    selector.register(proc.stderr, selectors.EVENT_READ, (err_buf, out_buf))
+
+    deadline = start + limits["timeout"]
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                record["timed_out"] = True
+                _kill_group(proc.pid)
+                break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, READ_CHUNK)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                buf, other = key.data
+                # stdout and stderr share one budget
+                buf.cap = max(0, limits["max_output"] - len(other.data))
+                buf.feed(chunk)
+    except BaseException:
+        # Interrupted (e.g. Celery's soft time limit): don't leave the tool running
+        _kill_group(proc.pid)
+        proc.wait()
+        raise
+    finally:
+        selector.close()
+    proc.stdout.close()
+    proc.stderr.close()
+
+    # Wait for the exit without reaping (WNOWAIT): an unreaped leader keeps
+    # its pgid from being reused, so the killpg below can only hit what the
+    # tool left running. Polled, so a tool that closed its pipes but keeps
+    # running still hits the deadline.
+    pause = WAIT_POLL_MIN
+    while os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+        if time.monotonic() >= deadline:
+            record["timed_out"] = True
+            break
+        time.sleep(min(pause, max(0, deadline - time.monotonic())))
+        pause = min(pause * 2, WAIT_POLL_MAX)
+    _kill_group(proc.pid)
+    # wait4 reaps the child and gives us its own rusage (not the whole worker's)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    output = out_buf.data.decode(errors="replace") + err_buf.data.decode(errors="replace")
+    record["wall_seconds"] = time.monotonic() - start
+    record["cpu_seconds"] = rusage.ru_utime + rusage.ru_stime
+    record["peak_rss_bytes"] = rusage.ru_maxrss * 1024  # Linux reports KB
+    record["output_bytes"] = out_buf.total + err_buf.total
+    record["output_truncated"] = out_buf.truncated or err_buf.truncated
+    record["returncode"] = proc.returncode
+    if proc.returncode in (-signal.SIGXCPU, -signal.SIGKILL) and not record["timed_out"]:
+        record["error"] = "killed by resource limit"
+    return output, record
+
+class ExiftoolDaemon:
+    """
+    A persistent `exiftool -stay_open True -@ -` process. Arguments are sent
+    one per line followed by -executeN; the reply ends with {readyN}.
+    One daemon per worker process, started lazily (after Celery forks).
+    """
+    def __init__(self, executable="exiftool"):
+        self.executable = executable
+        self._proc = None
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def _start(self):
+        limits = limits_for("exiftool")
+        self._proc = subprocess.Popen(
+            [self.executable, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+            # No CPU limit: it would accumulate over the daemon's lifetime
+            preexec_fn=_rlimit_preexec(limits, cpu=False),
+        )
+
+    def _kill(self):
+        if self._proc is not None:
+            _kill_group(self._proc.pid)
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            self._proc = None
+
+    def execute(self, args, limits):
+        """
+        Runs one exiftool command in the daemon. Returns (output, record).
+        """
+        record = new_record()
+        record["warm"] = True
+        start = time.monotonic()
+        with self._lock:
+            try:
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                    record["warm"] = False
+                self._counter += 1
+                marker = f"{{ready{self._counter}}}\n".encode()
+                self._proc.stdin.write(("\n".join(args) + f"\n-execute{self._counter}\n").encode())
+                self._proc.stdin.flush()
+            except Exception as e:
+                self._kill()
+                record["wall_seconds"] = time.monotonic() - start
+                record["error"] = str(e)
+                return str(e), record
+
+            buf = _CappedBuffer(limits["max_output"])
+            pending = b""
+            deadline = start + limits["timeout"]
+            fd = self._proc.stdout.fileno()
+            with selectors.DefaultSelector() as selector:
+                selector.register(fd, selectors.EVENT_READ)
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        record["timed_out"] = True
+                        self._kill()
+                        break
+                    if not selector.select(remaining):
+                        continue
+                    chunk = os.read(fd, READ_CHUNK)
+                    if not chunk:
+                        # Daemon died; it will be restarted on the next call
+                        record["error"] = "exiftool daemon exited"
+                        self._kill()
+                        break
+                    pending += chunk
+                    end = pending.find(marker)
+                    if end != -1:
+                        buf.feed(pending[:end])
+                        break
+                    # Keep a tail that could hold a partial marker
+                    keep = len(marker) - 1
+                    if len(pending) > keep:
+                        buf.feed(pending[:-keep])
+                        pending = pending[-keep:]
+
+        record["wall_seconds"] = time.monotonic() - start
+        record["output_bytes"] = buf.total
+        record["output_truncated"] = buf.truncated
+        record["returncode"] = 0 if not (record["timed_out"] or record["error"]) else None
+        return buf.data.decode(errors="replace"), record
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                try:
+                    self._proc.stdin.write(b"-stay_open\nFalse\n")
+                    self._proc.stdin.flush()
+                    self._proc.wait(timeout=5)
+                except Exception:
+                    pass
+            self._kill()
+
+_exiftool_daemon = None
+
+def run_exiftool(args, limits):
+    """
+    Runs exiftool with `args` through the warm daemon, falling back to a
+    one-shot sandboxed run if stay_open is disabled or unusable.
+    """
+    global _exiftool_daemon
+    # The daemon protocol is line based; a newline in an argument would split it
+    if not EXIFTOOL_STAY_OPEN or any("\n" in a for a in args):
+        return run_tool(["exiftool"] + list(args), limits)
+    if _exiftool_daemon is None:
+        _exiftool_daemon = ExiftoolDaemon()
+        atexit.register(_exiftool_daemon.close)
+    return _exiftool_daemon.execute(list(args), limits)
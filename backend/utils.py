@@ -1,5 +1,6 @@
 import struct
 import os
+import shutil
 import numpy as np
 import hashlib
 from PIL import Image
@@ -104,41 +105,89 @@ def patch_jpg_height(file_path, new_height):
     except Exception as e:
         return False, str(e)
 
-def process_image_encryption(file_path, password, mode='encrypt'):
+def derive_scramble_seed(password):
+    """
+    Password -> NumPy seed. SHA-256 of the password, reduced to uint32.
+    """
+    key_hash = hashlib.sha256(password.encode()).digest()
+    return int.from_bytes(key_hash, 'big') % (2**32 - 1) # Numpy seed must be uint32
+
+def scramble_keystream(seed, shape, cache=None):
+    """
+    XOR key stream for an image of `shape`. It only depends on the seed and
+    the shape, so batch jobs pass a `cache` dict and images of the same
+    size reuse the last stream instead of regenerating it.
+    """
+    shape = tuple(shape)
+    if cache is not None and cache.get('seed') == seed and cache.get('shape') == shape:
+        return cache['stream']
+    # RandomState (legacy) keeps existing encrypted images decryptable
+    rng = np.random.RandomState(seed)
+    stream = rng.randint(0, 256, list(shape), dtype=np.uint8)
+    if cache is not None:
+        # One entry only: a 50MP stream is 150MB
+        cache.clear()
+        cache.update(seed=seed, shape=shape, stream=stream)
+    return stream
+
+SCRAMBLE_SIG = b'RGB_SIG'
+
+def scramble_verifier(password, salt):
+    """Password check stored after the signature of a scrambled image."""
+    return hashlib.sha256(password.encode() + salt).digest()
+
+def _png_overlay_head(file_path, size):
+    """
+    First `size` bytes after the PNG's IEND chunk, found by walking the
+    chunk headers (seeks only, no full read). None if not a PNG.
+    """
+    with open(file_path, 'rb') as f:
+        if f.read(8) != b'\x89PNG\r\n\x1a\n':
+            return None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return b''
+            length, kind = struct.unpack('>I4s', header)
+            f.seek(length + 4, 1)  # data + CRC
+            if kind == b'IEND':
+                return f.read(size)
+
+def scramble_salt(file_path):
+    """Salt of the password check appended to a scrambled image, or None."""
+    overlay = _png_overlay_head(file_path, 55)
+    if overlay is None:
+        overlay = extract_overlay(file_path)
+    if overlay and len(overlay) >= 55 and overlay.startswith(SCRAMBLE_SIG):
+        return overlay[7:23]
+    return None
+
+def process_image_encryption(file_path, password, mode='encrypt', seed=None, keystream_cache=None, out_dir=None, verifiers=None):
     """
     Encrypts or decrypts an image using XOR with a specific password-derived key.
     Output is always PNG to allow lossless restoration.
+    Batch callers pass a precomputed `seed`, a `keystream_cache` dict and
+    an `out_dir` (default: next to the input). Batch workers never get the
+    password: they pass `verifiers`, {salt: scramble_verifier()} computed
+    up front (one salt to encrypt with, or the salts of the inputs).
     """
     try:
         # Open image and convert to RGB (ensure consistent channels)
         img = Image.open(file_path).convert('RGB')
         img_array = np.array(img)
         
-        # Derive key from password
-        # Use SHA-256 to get a deterministic hash
-        key_hash = hashlib.sha256(password.encode()).digest()
-        
-        # Convert hash to an integer seed for NumPy
-        # int.from_bytes is a standard way to convert bytes to int
-        seed = int.from_bytes(key_hash, 'big') % (2**32 - 1) # Numpy seed must be uint32
-        
-        # Create a RandomState with the seed for reproducibility
-        # We use RandomState instead of default_rng for legacy consistency if needed, 
-        # but default_rng is better. Let's use RandomState for simplicity in seeding.
-        rng = np.random.RandomState(seed)
-        
-        # Generate random noise (key stream) with same shape as image
-        # Integers between 0-255 (byte size)
-        key_stream = rng.randint(0, 256, list(img_array.shape), dtype=np.uint8)
+        if seed is None:
+            seed = derive_scramble_seed(password)
+        key_stream = scramble_keystream(seed, img_array.shape, keystream_cache)
         
         # XOR operation (Symmetric: A ^ B = C, C ^ B = A)
         # So encrypt and decrypt logic is identical
-        result_array = np.bitwise_xor(img_array, key_stream)
+        result_array = np.bitwise_xor(img_array, key_stream, out=img_array)
         
         result_img = Image.fromarray(result_array)
         
         # Save as PNG
-        dir_name = os.path.dirname(file_path)
+        dir_name = out_dir if out_dir is not None else os.path.dirname(file_path)
         base_name = os.path.basename(file_path)
         name_without_ext = os.path.splitext(base_name)[0]
         
@@ -185,12 +234,15 @@ def process_image_encryption(file_path, password, mode='encrypt'):
         overlay_data = extract_overlay(file_path)
         
         # --- PASSWORD VERIFICATION LOGIC ---
-        MAGIC_SIG = b'RGB_SIG'
+        MAGIC_SIG = SCRAMBLE_SIG
         
         if mode == 'encrypt':
             # Create Signature: MAGIC + Salt(16) + Hash(32)
-            salt = os.urandom(16)
-            verifier = hashlib.sha256(password.encode() + salt).digest()
+            if verifiers:
+                salt, verifier = next(iter(verifiers.items()))
+            else:
+                salt = os.urandom(16)
+                verifier = scramble_verifier(password, salt)
             signature = MAGIC_SIG + salt + verifier
             
             # Prepend to existing overlay (if any)
@@ -213,7 +265,7 @@ def process_image_encryption(file_path, password, mode='encrypt'):
                     actual_overlay = overlay_data[55:] # The rest
                     
                     # Verify
-                    check = hashlib.sha256(password.encode() + salt).digest()
+                    check = verifiers.get(salt) if verifiers is not None else scramble_verifier(password, salt)
                     
                     if check != stored_verifier:
                          # Use the EXACT error message requested by user
@@ -294,4 +346,18 @@ def embed_data(cover_path, payload_bytes, output_path):
     except Exception as e:
         return False, str(e)
 
+def embed_file_data(cover_path, payload_path, output_path):
+    """
+    Same as embed_data, but the payload is a file and is copied in chunks
+    (payloads can be up to 1GB).
+    """
+    try:
+        with open(output_path, 'wb') as f_out:
+            for path in (cover_path, payload_path):
+                with open(path, 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        return True, "Data embedded successfully"
+    except Exception as e:
+        return False, str(e)
+
 
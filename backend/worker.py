@@ -1,27 +1,78 @@
-from celery import Celery
 import time
 import os
-import subprocess
 import shutil
 from PIL import Image
 import numpy as np
 import mimetypes
+import math
+import json
+from contextlib import contextmanager
+from artifacts import register_archive, cleanup_expired
+from metrics import registry, record_tool_run, flush_to_redis
+from tool_runner import limits_for, run_tool, run_exiftool, new_record
+from utils import extract_overlay
+from strings_scan import extract_file_strings, format_report, STRINGS_FILE, STRINGS_PREVIEW
+from jpeg_dct import analyze_file as analyze_jpeg_file, format_report as format_dct_report
+from phash import image_hashes
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+from celery_app import celery_app, TASK_SOFT_TIME_LIMIT
+from profiles import PROFILES, STAGE_FORMATS, resolve_profile
+from search_index import build_entry, queue_entry, flush_pending
 
-# Configure Celery to use Redis
-redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
-celery_app = Celery("worker", broker=redis_url, backend=redis_url)
+# Same directory the API saves uploads to (shared volume, same working dir)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 
-def run_command(command):
+logger = get_task_logger("stegsik.worker")
+
+def run_command(command, timeout=None, stats=None):
+    """
+    Runs a tool in the sandboxed runner and returns its combined
+    stdout+stderr as text. Wall time, CPU time and peak RSS of the child,
+    timeouts and output size are recorded in the metrics registry and,
+    if given, in the `stats` dict under the tool name.
+    """
+    tool = os.path.basename(command[0])
+    limits = limits_for(tool, timeout)
+    if tool == "exiftool":
+        output, record = run_exiftool(command[1:], limits)
+    else:
+        output, record = run_tool(command, limits)
+    _finish_tool_record(tool, record, stats)
+
+    if record["output_truncated"]:
+        output += f"\n[!] Output truncated ({record['output_bytes']} bytes produced)"
+    if record["timed_out"]:
+        output += f"\n[!] {tool} killed after {limits['timeout']}s timeout"
+    elif record["error"] and output != record["error"]:
+        output += f"\n[!] {tool}: {record['error']}"
+    return output
+
+def _finish_tool_record(tool, record, stats):
+    record_tool_run(tool, record)
+    if stats is not None:
+        stats[tool] = record
+
+@contextmanager
+def timed_stage(name, stats=None):
+    """
+    Times an in-process stage (e.g. bit plane generation) like a tool run.
+    """
+    start = time.monotonic()
+    cpu_start = time.process_time()
     try:
-        result = subprocess.run(command, capture_output=True, text=True, timeout=30)
-        return result.stdout + result.stderr
-    except Exception as e:
-        return str(e)
+        yield
+    finally:
+        record = new_record()
+        record["wall_seconds"] = time.monotonic() - start
+        record["cpu_seconds"] = time.process_time() - cpu_start
+        _finish_tool_record(name, record, stats)
 
-def generate_bit_planes(image_path, output_dir):
+def generate_bit_planes(image_path, output_dir, arr=None):
     try:
-        img = Image.open(image_path).convert('RGB')
-        arr = np.array(img)
+        # Callers that already decoded the image can pass the array in
+        if arr is None:
+            arr = np.array(Image.open(image_path).convert('RGB'))
         planes = {}
         
         # Channels: 0=R, 1=G, 2=B
@@ -46,76 +97,237 @@ def generate_bit_planes(image_path, output_dir):
         return {"error": str(e)}
 
 @celery_app.task
-def analyze_image_task(file_path):
-    # Ensure absolute path for file_path
-    abs_file_path = os.path.abspath(file_path)
-    
-    # Directory for analysis artifacts (bit planes, extracted files)
-    # Directory for analysis artifacts (bit planes, extracted files)
-    base_dir = os.path.dirname(abs_file_path)
-    filename = os.path.basename(abs_file_path)
-    result_dir_name = f"results_{filename}"
-    result_dir = os.path.join(base_dir, result_dir_name)
-    os.makedirs(result_dir, exist_ok=True)
-
-    # Helper to save text output
-    def save_output(tool_name, content):
+def analyze_image_task(file_path, enqueued_at=None, profile="auto"):
+    """
+    Runs the forensic pipeline on an uploaded image. `profile` is one of
+    quick/standard/deep/auto (see PROFILES). `enqueued_at` is the
+    wall-clock time the API queued the task, used to measure queue wait.
+    """
+    task_start = time.monotonic()
+    queue_wait = None
+    if enqueued_at is not None:
+        queue_wait = max(0.0, time.time() - enqueued_at)
+        registry.observe("stegsik_task_queue_wait_seconds", queue_wait, {"task": "analyze_image"})
+
+    tool_stats = {}
+    try:
+        try:
+            result = _run_analysis(file_path, tool_stats, profile)
+        except SoftTimeLimitExceeded:
+            result = {"error": f"Analysis exceeded the {TASK_SOFT_TIME_LIMIT}s time limit"}
+        wall = time.monotonic() - task_start
+        result["metrics"] = {
+            "queue_wait_seconds": queue_wait,
+            "wall_seconds": wall,
+            "tools": tool_stats,
+        }
+        registry.observe("stegsik_task_wall_seconds", wall, {"task": "analyze_image"})
+        if "error" not in result:
+            _index_result(file_path, result)
+        return result
+    finally:
+        flush_to_redis()
+
+def _index_result(file_path, result):
+    # Feeds /search (batched, see search_index). Never fails the analysis.
+    start = time.monotonic()
+    try:
+        queue_entry(build_entry(analyze_image_task.request.id, file_path, result))
+    except Exception:
+        logger.exception("Search index entry failed for %s", file_path)
+    registry.observe("stegsik_index_seconds", time.monotonic() - start, {"task": "analyze_image"})
+
+@celery_app.task
+def flush_search_index():
+    """Periodic (beat) task: writes the queued index entries in batches."""
+    return {"written": flush_pending()}
+
+# --- BATCH SCRAMBLING ---
+# The batch is split into contiguous chunks of the shape-sorted file list;
+# Celery's worker processes are the pool (prefork children can't start
+# their own). A chord writes the manifest once every chunk is done.
+# The chunks get the key stream seed, which is key-equivalent: whoever can
+# read the broker or the result backend can rebuild the key stream and
+# unscramble the outputs. Keep them on a trusted network.
+BATCH_CHUNKS = int(os.getenv("BATCH_CHUNKS", "16"))
+
+@celery_app.task
+def scramble_chunk_task(jobs, seed, verifiers, mode):
+    import batch
+    cache = {}  # key stream reused across same-shape images in this chunk
+    return [batch.scramble_one(source, target_dir, mode, seed, verifiers, cache) for source, target_dir, _ in jobs]
+
+@celery_app.task
+def finish_scramble_batch(chunk_results, manifest_path, mode, key_id, started, chunks):
+    import batch
+    entries = [entry for chunk in chunk_results for entry in chunk]
+    manifest = batch.write_manifest(manifest_path, mode, key_id, entries, started, chunks)
+    return {key: manifest[key] for key in ("mode", "key_id", "total", "failed", "seconds")} | {"manifest": manifest_path}
+
+def start_scramble_batch(paths, password, mode="encrypt", out_dir=None):
+    """
+    Scrambles many local files with one password on the Celery workers.
+    Not a task: call it in the API or CLI process, so the password never
+    goes through the broker (chunks get the seed and the salted password
+    checks, the callback only the key id). Returns right away with the
+    chord id; the manifest is written to <out_dir>/manifest.json.
+    """
+    import uuid
+    import batch
+    from celery import chord
+    from utils import derive_scramble_seed
+    started = time.time()
+    out_dir = out_dir or os.path.join(UPLOAD_DIR, f"batch_{uuid.uuid4()}")
+    planned = batch.plan_jobs(paths, out_dir)
+    seed = derive_scramble_seed(password)
+    size = max(1, math.ceil(len(planned) / BATCH_CHUNKS))
+    chunks = [planned[i:i + size] for i in range(0, len(planned), size)]
+    manifest_path = os.path.join(out_dir, batch.MANIFEST_NAME)
+    result = chord(scramble_chunk_task.s(chunk, seed, batch.make_verifiers(password, mode, [job[0] for job in chunk]), mode)
+                   for chunk in chunks)(
+        finish_scramble_batch.s(manifest_path, mode, batch.key_id(password), started, len(chunks)))
+    return {"chord_id": result.id, "manifest": manifest_path, "files": len(planned), "chunks": len(chunks)}
+
+@celery_app.task
+def cleanup_expired_artifacts():
+    """
+    Periodic (beat) task: removes uploads, their result directories and
+    generated files once they are older than ARTIFACT_TTL. The matching
+    Celery results expire at the same time (result_expires).
+    """
+    stats = cleanup_expired(UPLOAD_DIR)
+    if stats["removed"]:
+        print(f"[*] Cleanup: removed {stats['removed']} expired artifacts ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+    return stats
+
+def lsb_chi_square(arr):
+    """
+    Westfeld/Pfitzmann chi-square attack on the LSBs of each channel.
+    LSB embedding equalizes the counts of each value pair (2k, 2k+1);
+    the returned probability approaches 1 when that has happened.
+    """
+    scores = {}
+    for ch_idx, channel_name in enumerate(['Red', 'Green', 'Blue']):
+        hist = np.bincount(arr[:, :, ch_idx].ravel(), minlength=256).astype(np.float64)
+        even, odd = hist[0::2], hist[1::2]
+        expected = (even + odd) / 2
+        mask = expected > 4  # the usual validity rule for chi-square cells
+        dof = int(mask.sum()) - 1
+        if dof < 1:
+            scores[channel_name] = {"chi_square": 0.0, "dof": 0, "embedding_probability": 0.0}
+            continue
+        chi = float((((even - expected) ** 2)[mask] / expected[mask]).sum())
+        # Wilson-Hilferty approximation of the chi-square upper tail
+        z = ((chi / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+        p = 0.5 * math.erfc(z / math.sqrt(2))
+        scores[channel_name] = {
+            "chi_square": round(chi, 3),
+            "dof": dof,
+            "embedding_probability": round(p, 4),
+            "lsb_ones_ratio": round(float((arr[:, :, ch_idx] & 1).mean()), 4),
+        }
+    return scores
+
+class _AnalysisContext:
+    """
+    Shared state for the stages of one analysis run.
+    """
+    def __init__(self, file_path, tool_stats):
+        self.file_path = file_path
+        self.abs_file_path = os.path.abspath(file_path)
+        base_dir = os.path.dirname(self.abs_file_path)
+        self.filename = os.path.basename(self.abs_file_path)
+        self.result_dir_name = f"results_{self.filename}"
+        self.result_dir = os.path.join(base_dir, self.result_dir_name)
+        os.makedirs(self.result_dir, exist_ok=True)
+        self.tool_stats = tool_stats
+        self.results = {}
+        self.bit_planes = {}
+        self.images_zip = None
+        self.perceptual_hashes = None
+        self._pixels = None
+
+        # Header-only open: format and size without decoding
+        try:
+            with Image.open(self.abs_file_path) as img:
+                self.format, (self.width, self.height), self.mode = img.format, img.size, img.mode
+        except Exception:
+            self.format, self.width, self.height, self.mode = None, None, None, None
+
+    def pixels(self):
+        # Decoded once, shared by bit planes and the LSB score
+        if self._pixels is None:
+            self._pixels = np.array(Image.open(self.abs_file_path).convert('RGB'))
+        return self._pixels
+
+    def save_output(self, tool_name, content):
         output_filename = f"{tool_name}_output.log"
-        output_path = os.path.join(result_dir, output_filename)
+        output_path = os.path.join(self.result_dir, output_filename)
         with open(output_path, "w") as f:
             f.write(content)
         return {
             "content": content,
-            "file_path": f"{result_dir_name}/{output_filename}"
+            "file_path": f"{self.result_dir_name}/{output_filename}"
         }
 
-    # 1. Generate Bit Planes
-    bit_planes = generate_bit_planes(abs_file_path, result_dir) # Returns filenames directly in result_dir
-    # Bit planes are in result_dir, so path is outputs/results_.../filename
-    
-    # Create a zip of all generated images (bitplanes)
-    images_zip_name = os.path.join(result_dir, "all_images")
-    # We want to zip only the png files we just created
-    import zipfile
-    with zipfile.ZipFile(f"{images_zip_name}.zip", 'w') as zipf:
-        for root, dirs, files in os.walk(result_dir):
-            for file in files:
-                if file.startswith("bitplane_") and file.endswith(".png"):
-                    zipf.write(os.path.join(root, file), file)
-    
-    images_zip_path = f"{result_dir_name}/all_images.zip"
+def _stage_structure(ctx):
+    overlay = extract_overlay(ctx.abs_file_path)
+    lines = [
+        f"Format     : {ctx.format or 'unknown'}",
+        f"Dimensions : {ctx.width} x {ctx.height}",
+        f"Mode       : {ctx.mode}",
+        f"File size  : {os.path.getsize(ctx.abs_file_path)} bytes",
+        f"Overlay    : {len(overlay) if overlay else 0} bytes after end of image",
+    ]
+    ctx.results['structure'] = ctx.save_output('structure', "\n".join(lines))
 
-    # 2. Run Forensic Tools
-    results = {}
-    
+def _stage_lsb_score(ctx):
+    scores = lsb_chi_square(ctx.pixels())
+    lines = [
+        f"{name:<6} chi2={s['chi_square']:<12} dof={s['dof']:<4} "
+        f"embedding probability={s['embedding_probability']:.4f} "
+        f"lsb ones ratio={s.get('lsb_ones_ratio', 0):.4f}"
+        for name, s in scores.items()
+    ]
+    if any(s['embedding_probability'] > 0.9 for s in scores.values()):
+        lines.append("\n[!] LSB pairs are equalized: sequential LSB embedding is likely.")
+    ctx.results['lsb_score'] = ctx.save_output('lsb_score', "\n".join(lines))
+    ctx.results['lsb_score']['scores'] = scores
+
+def _stage_bit_planes(ctx):
+    ctx.bit_planes = generate_bit_planes(ctx.abs_file_path, ctx.result_dir, arr=ctx.pixels())
+    # Bit plane zip is built lazily on download (PNGs are stored, not re-deflated)
+    register_archive(ctx.result_dir, "all_images.zip", ctx.result_dir, prefix="bitplane_", suffix=".png")
+    ctx.images_zip = f"{ctx.result_dir_name}/all_images.zip"
+
+def _stage_zsteg(ctx):
     # zsteg (Ruby tool, good for LSB)
-    zsteg_out = run_command(["zsteg", "-a", abs_file_path])
-    results['zsteg'] = save_output('zsteg', zsteg_out)
-    
+    zsteg_out = run_command(["zsteg", "-a", ctx.abs_file_path], stats=ctx.tool_stats)
+    ctx.results['zsteg'] = ctx.save_output('zsteg', zsteg_out)
+
+def _stage_stegseek(ctx):
     # Stegseek (Ultra-fast Steghide Cracker)
-    wordlist_path = "wordlist.txt"
     # Force output to a specific file in the result directory
-    expected_out_file = os.path.join(result_dir, "stegseek_extracted.bin")
+    expected_out_file = os.path.join(ctx.result_dir, "stegseek_extracted.bin")
     
-    stegseek_cmd = ["stegseek", "-xf", expected_out_file, abs_file_path, "wordlist.txt"]
-    stegseek_out = run_command(stegseek_cmd)
+    stegseek_cmd = ["stegseek", "-xf", expected_out_file, ctx.abs_file_path, "wordlist.txt"]
+    stegseek_out = run_command(stegseek_cmd, stats=ctx.tool_stats)
     
     # Remove branding
     stegseek_out = stegseek_out.replace("StegSeek 0.6 - https://github.com/RickdeJager/StegSeek", "")
     
-    # Check if stegseek created an output file
-    
     # Save the log output always
-    log_result = save_output('steghide', stegseek_out)
+    log_result = ctx.save_output('steghide', stegseek_out)
     final_file_path = log_result['file_path'] # Default to log file if no extraction
 
+    # Check if stegseek created an output file
     if os.path.exists(expected_out_file):
         # Determine file extension using 'file' command
         ext = ".bin"
         try:
             # Run file --mime-type -b <file>
             mime_cmd = ["file", "--mime-type", "-b", expected_out_file]
-            mime_out = subprocess.check_output(mime_cmd).decode().strip()
+            mime_out = run_command(mime_cmd, stats=ctx.tool_stats).strip()
             guessed_ext = mimetypes.guess_extension(mime_out)
             if guessed_ext:
                 ext = guessed_ext
@@ -126,81 +338,153 @@ def analyze_image_task(file_path):
         if ext == '.jpe': ext = '.jpg'
         
         extract_filename = f"steghide_extracted{ext}"
-        final_extract_path = os.path.join(result_dir, extract_filename)
+        final_extract_path = os.path.join(ctx.result_dir, extract_filename)
         
         shutil.move(expected_out_file, final_extract_path)
-        final_file_path = f"{result_dir_name}/{extract_filename}"
+        final_file_path = f"{ctx.result_dir_name}/{extract_filename}"
         stegseek_out += f"\n[+] SUCCESS: Password found and data extracted to {extract_filename}!"
     else:
          stegseek_out += "\n[-] Bruteforce finished. If no success message above, password was not found in wordlist."
 
-    results['steghide'] = {
+    ctx.results['steghide'] = {
         "content": stegseek_out,
         "file_path": final_file_path
     }
-    
+
+def _stage_outguess(ctx):
     # outguess (Needs explicit output file for data, but we capture stdout/info here)
-    outguess_out_file = os.path.join(result_dir, "outguess.out")
-    outguess_log = run_command(["outguess", "-r", abs_file_path, outguess_out_file])
+    outguess_out_file = os.path.join(ctx.result_dir, "outguess.out")
+    outguess_log = run_command(["outguess", "-r", ctx.abs_file_path, outguess_out_file], stats=ctx.tool_stats)
     # Check if outguess produced a data file
     if os.path.exists(outguess_out_file):
         outguess_log += f"\n\n[INFO] Data extracted to {os.path.basename(outguess_out_file)}"
-        results['outguess'] = {
+        ctx.results['outguess'] = {
             "content": outguess_log,
-            "file_path": f"{result_dir_name}/{os.path.basename(outguess_out_file)}"
+            "file_path": f"{ctx.result_dir_name}/{os.path.basename(outguess_out_file)}"
         }
     else:
-        results['outguess'] = save_output('outguess', outguess_log)
-    
-    # exiftool
-    exif_out = run_command(["exiftool", abs_file_path])
-    results['exiftool'] = save_output('exiftool', exif_out)
-    
-    # binwalk
+        ctx.results['outguess'] = ctx.save_output('outguess', outguess_log)
+
+def _stage_exiftool(ctx):
+    exif_out = run_command(["exiftool", ctx.abs_file_path], stats=ctx.tool_stats)
+    ctx.results['exiftool'] = ctx.save_output('exiftool', exif_out)
+
+def _stage_binwalk_scan(ctx):
+    # Signature scan only, no extraction
+    binwalk_out = run_command(["binwalk", ctx.abs_file_path], stats=ctx.tool_stats)
+    ctx.results['binwalk'] = ctx.save_output('binwalk', binwalk_out)
+
+def _stage_binwalk(ctx):
     # Run binwalk with extraction (-e) and signature scanning (-B is default)
     # We want to capture the log, but also allow extraction.
-    # Note: binwalk extracts to a directory named _{filename}.extracted
-    binwalk_cmd = ["binwalk", "-e", abs_file_path]
-    binwalk_out = run_command(binwalk_cmd)
+    # Note: binwalk extracts to a directory named _{filename}.extracted,
+    # -C keeps it inside result_dir next to the other artifacts.
+    binwalk_cmd = ["binwalk", "-e", "-C", ctx.result_dir, ctx.abs_file_path]
+    binwalk_out = run_command(binwalk_cmd, stats=ctx.tool_stats)
     
     # Check for extracted directory
-    extracted_dir_name = f"_{filename}.extracted"
-    extracted_full_path = os.path.join(base_dir, extracted_dir_name)
+    extracted_full_path = os.path.join(ctx.result_dir, f"_{ctx.filename}.extracted")
     
     if os.path.exists(extracted_full_path) and os.listdir(extracted_full_path):
-        # Zip the extracted content
-        zip_base_name = os.path.join(result_dir, "binwalk_extracted")
-        shutil.make_archive(zip_base_name, 'zip', extracted_full_path)
+        # Zipped on download, nothing is recompressed here
+        register_archive(ctx.result_dir, "binwalk_extracted.zip", extracted_full_path)
         
-        results['binwalk'] = {
+        ctx.results['binwalk'] = {
             "content": binwalk_out + "\n\n[INFO] Files extracted and zipped.",
-            "file_path": f"{result_dir_name}/binwalk_extracted.zip"
+            "file_path": f"{ctx.result_dir_name}/binwalk_extracted.zip"
         }
-        # Optionally cleanup the extraction folder to save space, but keeping it is fine for debug
     else:
         # Just return the log if nothing extracted
-        results['binwalk'] = save_output('binwalk', binwalk_out)
-    
-    # foremost
-    foremost_out_dir = os.path.join(result_dir, "foremost_out")
-    run_command(["foremost", "-o", foremost_out_dir, "-i", abs_file_path])
+        ctx.results['binwalk'] = ctx.save_output('binwalk', binwalk_out)
+
+def _stage_foremost(ctx):
+    foremost_out_dir = os.path.join(ctx.result_dir, "foremost_out")
+    run_command(["foremost", "-o", foremost_out_dir, "-i", ctx.abs_file_path], stats=ctx.tool_stats)
     foremost_msg = f"Foremost output saved to directory: {os.path.basename(foremost_out_dir)}"
-    # Zip the foremost output for easy download
-    shutil.make_archive(foremost_out_dir, 'zip', foremost_out_dir)
-    results['foremost'] = {
+    # Zip is streamed on download for easy access
+    register_archive(ctx.result_dir, "foremost_out.zip", foremost_out_dir)
+    ctx.results['foremost'] = {
         "content": foremost_msg,
-        "file_path": f"{result_dir_name}/foremost_out.zip"
+        "file_path": f"{ctx.result_dir_name}/foremost_out.zip"
     }
-    
-    # strings
-    strings_out = run_command(["strings", "-n", "10", abs_file_path])
-    results['strings'] = save_output('strings', strings_out)
+
+def _stage_strings(ctx):
+    # In-process (no `strings` fork): ranked, capped, with offsets. The
+    # result only carries the best ones; the rest are paged via /strings.
+    found = extract_file_strings(ctx.abs_file_path)
+    with open(os.path.join(ctx.result_dir, STRINGS_FILE), "w") as f:
+        json.dump(found, f)
+    ctx.results['strings'] = {
+        "content": format_report(found, STRINGS_PREVIEW),
+        "file_path": f"{ctx.result_dir_name}/{STRINGS_FILE}",
+        "total": found["total"],
+        "truncated": found["truncated"],
+    }
+
+def _stage_dct(ctx):
+    # Coefficients straight from the Huffman stream, no stegseek/outguess needed
+    # Best effort: a corrupt JPEG must not fail the whole analysis
+    try:
+        stats = analyze_jpeg_file(ctx.abs_file_path)
+    except Exception as e:
+        ctx.results['dct'] = ctx.save_output('dct', f"[-] DCT analysis skipped: {e}")
+        return
+    ctx.results['dct'] = ctx.save_output('dct', format_dct_report(stats))
+    ctx.results['dct']['stats'] = stats
+
+def _stage_phash(ctx):
+    # Perceptual hashes of the decoded pixels, for /similar
+    ctx.perceptual_hashes = image_hashes(ctx.pixels())
+
+STAGES = {
+    "structure": _stage_structure,
+    "exiftool": _stage_exiftool,
+    "lsb_score": _stage_lsb_score,
+    "dct": _stage_dct,
+    "phash": _stage_phash,
+    "bit_planes": _stage_bit_planes,
+    "zsteg": _stage_zsteg,
+    "outguess": _stage_outguess,
+    "strings": _stage_strings,
+    "binwalk_scan": _stage_binwalk_scan,
+    "binwalk": _stage_binwalk,
+    "foremost": _stage_foremost,
+    "stegseek": _stage_stegseek,
+}
+
+# Stages that run in-process are timed like tools
+IN_PROCESS_STAGES = {"structure", "lsb_score", "dct", "phash", "bit_planes", "strings"}
+
+def _run_analysis(file_path, tool_stats, profile="auto"):
+    ctx = _AnalysisContext(file_path, tool_stats)
+    profile = resolve_profile(profile, ctx.width, ctx.height)
+
+    stages_run = []
+    stages_skipped = {}
+    for name in PROFILES[profile]:
+        formats = STAGE_FORMATS.get(name)
+        if formats and ctx.format not in formats:
+            stages_skipped[name] = f"not applicable to {ctx.format or 'unknown'} images"
+            continue
+        if name in IN_PROCESS_STAGES:
+            with timed_stage(name, tool_stats):
+                STAGES[name](ctx)
+        else:
+            STAGES[name](ctx)
+        stages_run.append(name)
 
     return {
         "file_path": file_path,
-        "filename": filename,
-        "bit_planes": bit_planes, # dictionary of "Label": "filename"
-        "images_zip": images_zip_path,
-        "tool_outputs": results,
-        "result_dir": result_dir_name
+        "filename": ctx.filename,
+        "format": ctx.format,
+        "width": ctx.width,
+        "height": ctx.height,
+        "profile": profile,
+        "stages_run": stages_run,
+        "stages_skipped": stages_skipped,
+        "bit_planes": ctx.bit_planes, # dictionary of "Label": "filename"
+        "images_zip": ctx.images_zip,
+        "perceptual_hashes": ctx.perceptual_hashes,
+        "tool_outputs": ctx.results,
+        "result_dir": ctx.result_dir_name
     }
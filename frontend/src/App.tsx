@@ -7,6 +7,7 @@ function App() {
     const [loading, setLoading] = useState(false)
     const [result, setResult] = useState<any>(null)
     const [error, setError] = useState<string | null>(null)
+    const [profile, setProfile] = useState<'auto' | 'quick' | 'standard' | 'deep'>('auto')
 
     // Magic Patcher State
     const [patchFile, setPatchFile] = useState<File | null>(null)
@@ -37,6 +38,7 @@ function App() {
     const [embedSuccessMsg, setEmbedSuccessMsg] = useState<string | null>(null)
     const [embedError, setEmbedError] = useState<string | null>(null)
     const [embedFilename, setEmbedFilename] = useState<string | null>(null)
+    const [extractSegments, setExtractSegments] = useState<any[]>([])
 
     // Advanced Stego State
     const [advAction, setAdvAction] = useState<'hide' | 'recover'>('hide')
@@ -44,6 +46,7 @@ function App() {
     const [advMessage, setAdvMessage] = useState('')
     const [advOffset, setAdvOffset] = useState<number | ''>(1024)
     const [advInterval, setAdvInterval] = useState<number | ''>(50)
+    const [advMode, setAdvMode] = useState<'tail' | 'pixel'>('tail')
     const [advLoading, setAdvLoading] = useState(false)
     const [advResult, setAdvResult] = useState<any>(null)
     const [advError, setAdvError] = useState<string | null>(null)
@@ -75,6 +78,7 @@ function App() {
         setEmbedLoading(true)
         setEmbedError(null)
         setEmbedResult(null)
+        setExtractSegments([])
         setEmbedFilename(null)
 
         const formData = new FormData()
@@ -129,6 +133,7 @@ function App() {
         setEmbedLoading(true)
         setEmbedError(null)
         setEmbedResult(null)
+        setExtractSegments([])
         setEmbedFilename(null)
 
         const formData = new FormData()
@@ -145,6 +150,7 @@ function App() {
                 setEmbedResult(response.data.download_url)
                 setEmbedFilename(response.data.filename)
                 setEmbedSuccessMsg(response.data.message)
+                setExtractSegments(response.data.segments || [])
             } else {
                 setEmbedError(response.data.message || 'Extraction failed')
             }
@@ -201,6 +207,7 @@ function App() {
 
         const formData = new FormData()
         formData.append('file', file)
+        formData.append('profile', profile)
 
         try {
             const response = await axios.post(`${API_URL}/upload`, formData)
@@ -312,6 +319,7 @@ function App() {
                     return
                 }
                 formData.append('message', advMessage)
+                formData.append('mode', advMode)
                 if (advOffset !== '') {
                     formData.append('start_offset', advOffset.toString())
                 }
@@ -392,6 +400,17 @@ function App() {
                     />
                 </div>
 
+                <select
+                    value={profile}
+                    onChange={(e) => setProfile(e.target.value as any)}
+                    style={{ width: '100%', marginBottom: '1rem', padding: '0.6rem', borderRadius: '6px', background: '#0f172a', color: '#e2e8f0', border: '1px solid #334155' }}
+                >
+                    <option value="auto">Auto (based on format and size)</option>
+                    <option value="quick">Quick: structure, metadata, LSB score</option>
+                    <option value="standard">Standard: + bit planes, zsteg/outguess, strings</option>
+                    <option value="deep">Deep: + carving and password brute force</option>
+                </select>
+
                 <button
                     onClick={handleUpload}
                     disabled={!file || loading}
@@ -919,6 +938,7 @@ function App() {
                                     if (e.target.files?.[0]) {
                                         setEmbedCover(e.target.files[0])
                                         setEmbedResult(null)
+                                        setExtractSegments([])
                                     }
                                 }}
                                 style={{ display: 'none' }}
@@ -1068,6 +1088,24 @@ function App() {
                             >
                                 <Download size={16} /> Download Result
                             </button>
+
+                            {extractSegments.length > 0 && (
+                                <div style={{ marginTop: '1rem', display: 'flex', flexDirection: 'column', gap: '0.5rem' }}>
+                                    {extractSegments.map((seg) => (
+                                        <div key={seg.index} style={{ display: 'flex', alignItems: 'center', justifyContent: 'space-between', background: '#1e293b', padding: '0.5rem 0.75rem', borderRadius: '6px', fontSize: '0.85rem' }}>
+                                            <span style={{ color: '#cbd5e1' }}>
+                                                <strong style={{ color: '#38bdf8' }}>{seg.type}</strong> @ {seg.offset} ({seg.length} bytes)
+                                            </span>
+                                            <button
+                                                onClick={() => handleDownload(`${API_URL}/${seg.download_url}`, seg.filename)}
+                                                style={{ display: 'flex', alignItems: 'center', gap: '4px', background: 'transparent', border: '1px solid #10b981', color: '#10b981', padding: '0.25rem 0.5rem', borderRadius: '4px', cursor: 'pointer' }}
+                                            >
+                                                <Download size={14} /> {seg.ext}
+                                            </button>
+                                        </div>
+                                    ))}
+                                </div>
+                            )}
                         </div>
                     )}
                 </div>
@@ -1216,6 +1254,14 @@ function App() {
                                     resize: 'vertical'
                                 }}
                             />
+                            <select
+                                value={advMode}
+                                onChange={(e) => setAdvMode(e.target.value as 'tail' | 'pixel')}
+                                style={{ width: '100%', marginTop: '1rem', padding: '0.8rem 1rem', borderRadius: '8px', border: '1px solid #475569', background: '#0f172a', color: 'white' }}
+                            >
+                                <option value="tail">Trailing data (after end of image)</option>
+                                <option value="pixel">Pixel LSBs (same file size, PNG output)</option>
+                            </select>
                             <div className="flex-stack-mobile" style={{ display: 'flex', gap: '1rem', marginTop: '1rem', flexWrap: 'wrap' }}>
                                 <div className="w-full-mobile" style={{ flex: '1 1 200px' }}>
                                     <label style={{ color: '#94a3b8', fontSize: '0.8rem', marginBottom: '0.3rem', display: 'block' }}>Start Offset (Optional)</label>
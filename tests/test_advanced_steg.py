@@ -0,0 +1,45 @@
+import io
+
+import pytest
+from PIL import Image
+
+from advanced_steg import plan_custom_inject, pixel_capacity, custom_inject
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), (10, 20, 30)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("start_offset, interval", [(-1, 5), (0, -1), (10, -5)])
+def test_negative_keys_raise(start_offset, interval):
+    with pytest.raises(ValueError):
+        plan_custom_inject("hi", start_offset, interval)
+    with pytest.raises(ValueError):
+        pixel_capacity(1000, start_offset, interval)
+    with pytest.raises(ValueError):
+        custom_inject(png_bytes(), "hi", start_offset, interval)
+
+
+def test_zero_keys_are_valid():
+    plan = plan_custom_inject("hi", 0, 0, cover_samples=1000)
+    assert plan["tail_bytes"] == plan["payload_bytes"]
+    assert pixel_capacity(1000, 0, 0) == 125
+
+
+@pytest.mark.parametrize("path, fields", [
+    ("/steg/advanced/plan", {"message": "hi", "interval": "-1"}),
+    ("/steg/advanced/plan", {"message": "hi", "start_offset": "-3"}),
+    ("/steg/advanced/hide", {"message": "hi", "start_offset": "0", "interval": "-5"}),
+    ("/steg/advanced/recover", {"offset": "-1"}),
+])
+def test_endpoints_reject_negative_keys(path, fields):
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app, follow_redirects=False)
+    files = None if path.endswith("plan") else {"file": ("cover.png", png_bytes(), "image/png")}
+    response = client.post(path, data=fields, files=files)
+    assert response.status_code == 400
+    assert "0 or more" in response.json()["detail"]
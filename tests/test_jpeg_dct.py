@@ -0,0 +1,79 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from jpeg_dct import parse_jpeg, decode_coefficients, analyze_jpeg, _spatial, _plane
+
+
+def make_jpeg(width=200, height=120, quality=85):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.sin(x / 9) * 60 + np.cos(y / 7) * 40 + 128 + rng.normal(0, 8, (height, width))
+    buf = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def find_segment(data, marker):
+    """Offset of the first marker segment `marker` (the FF byte)."""
+    pos = data.index(bytes([0xFF, marker]))
+    return pos, int.from_bytes(data[pos + 2:pos + 4], "big")
+
+
+def test_coefficients_rebuild_pils_luma():
+    data = make_jpeg()
+    info = parse_jpeg(data)
+    comps = decode_coefficients(data, info)
+    luma = comps[info["frame"]["components"][0]["id"]]
+
+    plane = _plane(_spatial(luma["blocks"], info["qt"][luma["tq"]]))[:120, :200]
+    reference = np.asarray(Image.open(io.BytesIO(data)).convert("L"), dtype=np.float32)
+
+    error = np.abs(plane - reference)
+    # Float IDCT vs libjpeg's integer one: off by one here and there
+    assert error.mean() < 0.1
+    assert error.max() <= 2
+
+
+def test_truncated_huffman_table():
+    data = bytearray(make_jpeg())
+    pos, length = find_segment(data, 0xC4)
+    # A DHT segment shorter than its 16 count bytes (the ones present are 0)
+    short = data[:pos + 2] + (7).to_bytes(2, "big") + b"\x00" * 5 + data[pos + 2 + length:]
+    with pytest.raises(ValueError):
+        parse_jpeg(bytes(short))
+
+
+def test_zero_quantization_table():
+    data = bytearray(make_jpeg())
+    pos, _ = find_segment(data, 0xDB)
+    data[pos + 5] = 0  # first table, second value
+    with pytest.raises(ValueError, match="zeros"):
+        parse_jpeg(bytes(data))
+
+
+def test_not_a_jpeg():
+    with pytest.raises(ValueError):
+        parse_jpeg(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+
+
+def test_truncated_scan_keeps_decoded_rows():
+    data = make_jpeg(width=256, height=256)
+    stats = analyze_jpeg(data[:len(data) // 2])
+    assert 0 < stats["blocks_analyzed"] < 32 * 32
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_garbage_entropy_data_only_raises_value_error(seed):
+    data = make_jpeg()
+    pos, length = find_segment(data, 0xDA)
+    start = pos + 2 + length
+    noise = np.random.default_rng(seed).integers(0, 256, len(data) - start - 2, dtype=np.uint8).tobytes()
+    # No markers inside the noise: stuff every FF
+    noise = noise.replace(b"\xff", b"\xff\x00")
+    try:
+        analyze_jpeg(data[:start] + noise + b"\xff\xd9")
+    except ValueError:
+        pass
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+import redis.asyncio as aioredis
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+import rate_limit
+from rate_limit import RateLimiter, KEY_PREFIX, MB
+
+
+class WindowLimiter(RateLimiter):
+    """Stand-in for the Redis script: one fixed window, same accept rule."""
+    def __init__(self):
+        super().__init__(enabled=True)
+        self.used = 0
+        self.costs = []
+
+    async def hit(self, key, limit, window_ms, cost=1):
+        self.costs.append(cost)
+        if self.used + cost > limit:
+            return False, self.used, 1
+        self.used += cost
+        return True, self.used, 0
+
+
+def make_request(path, size, method="POST"):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(b"content-length", str(size).encode())],
+        "client": ("10.0.0.1", 1234),
+    }
+    return Request(scope)
+
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+
+def test_body_larger_than_budget_gets_through(monkeypatch):
+    monkeypatch.setattr(rate_limit, "GLOBAL_BUDGET", "600/minute")
+    limiter = WindowLimiter()
+
+    # 1GB /embed: base cost plus 1024 per MB would be over the budget
+    response = asyncio.run(limiter.budget_middleware(make_request("/embed", 1024 * MB), ok))
+
+    assert response.status_code == 200
+    assert limiter.costs == [600]
+
+
+def test_big_body_waits_for_an_empty_window(monkeypatch):
+    monkeypatch.setattr(rate_limit, "GLOBAL_BUDGET", "600/minute")
+    limiter = WindowLimiter()
+    limiter.used = 1
+
+    response = asyncio.run(limiter.budget_middleware(make_request("/upload", 700 * MB), ok))
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_preflight_is_free():
+    assert rate_limit.request_cost(make_request("/upload", 0, method="OPTIONS")) == 0
+
+
+def test_fails_open_without_redis(monkeypatch):
+    client = aioredis.Redis.from_url("redis://127.0.0.1:1/0", socket_connect_timeout=0.5)
+    monkeypatch.setattr(rate_limit, "get_async_redis", lambda: client)
+
+    assert asyncio.run(RateLimiter().hit("k", 1, 60000, cost=5)) == (True, 0, 0)
+
+
+# --- The Lua sliding window, on fakeredis' Lua engine ---
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(rate_limit, "get_async_redis", lambda: client)
+    return client
+
+
+def test_window_allows_up_to_the_limit(fake_redis):
+    limiter = RateLimiter()
+
+    async def run():
+        results = [await limiter.hit("fixed", 5, 60000) for _ in range(6)]
+        return results
+
+    results = asyncio.run(run())
+    assert [allowed for allowed, _, _ in results] == [True] * 5 + [False]
+    assert results[4][1] == 5
+    assert 1 <= results[5][2] <= 60
+
+
+def test_previous_window_is_weighted(fake_redis):
+    limiter = RateLimiter()
+    window, prev, limit = 60000, 1000, 1000
+
+    async def run():
+        # Fill the previous window, then work out how much of it still counts
+        seconds, micros = await fake_redis.time()
+        now = seconds * 1000 + micros // 1000
+        cur_start = now - now % window
+        for key in ("fits", "over"):
+            await fake_redis.set(f"{KEY_PREFIX}:{key}:{cur_start - window}", prev)
+        weighted = prev * (window - (now - cur_start)) / window
+        if weighted < 3:
+            pytest.skip("previous window has (almost) no weight left at this instant")
+        # Both costs fit in the current window alone; only the weighted
+        # previous window decides. A margin of 2 covers the clock moving.
+        fits = await limiter.hit("fits", limit, window, cost=limit - int(weighted) - 2)
+        over = await limiter.hit("over", limit, window, cost=limit - int(weighted) + 2)
+        return fits, over
+
+    fits, over = asyncio.run(run())
+    assert fits[0] is True
+    assert over[0] is False
+    assert 1 <= over[2] <= 60
+
+
+def test_budget_429_passes_through_cors_and_security_headers(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    calls = []
+
+    async def reject(key, limit, window_ms, cost=1):
+        calls.append(cost)
+        return False, limit, 7
+
+    monkeypatch.setattr(main.limiter, "enabled", True)
+    monkeypatch.setattr(main.limiter, "hit", reject)
+    client = TestClient(main.app, follow_redirects=False)
+    origin = {"Origin": "http://localhost:5173"}
+
+    response = client.get("/result/abc", headers=origin)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert response.headers["access-control-allow-origin"] == "http://localhost:5173"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+    preflight = client.options("/upload", headers={**origin, "Access-Control-Request-Method": "POST"})
+    assert preflight.status_code == 200
+    assert len(calls) == 1
@@ -0,0 +1,20 @@
+import pytest
+
+import search_index
+
+
+@pytest.mark.parametrize("q", ['"', '""', "*", '" * "', "strings:*"])
+def test_query_without_terms_is_rejected(tmp_path, q):
+    db = str(tmp_path / "index.db")
+    search_index.connect(db).close()
+    assert search_index.fts_query(q) == ""
+    with pytest.raises(ValueError):
+        search_index.search(q, None, None, 20, 0, db_path=db)
+
+
+def test_search_endpoint_answers_400_for_empty_terms():
+    from fastapi.testclient import TestClient
+    import main
+
+    response = TestClient(main.app, follow_redirects=False).get("/search", params={"q": '"'})
+    assert response.status_code == 400